@@ -1,6 +1,9 @@
 import os
+import time
 import logging
-import tempfile
+from contextlib import contextmanager
+import cv2
+import numpy as np
 from flask import Flask, request, jsonify
 from deepface import DeepFace
 
@@ -14,6 +17,32 @@ if not os.path.exists(DB_PATH):
 if not os.listdir(DB_PATH):
     logging.warning("Folder database kosong! Aplikasi tidak akan dapat mengenali wajah.")
 
+# Header request untuk meminta rincian waktu per tahap di header Server-Timing respons
+TRACE_HEADER = "X-Face-Trace"
+
+
+@contextmanager
+def stage(timings, name):
+    """Mencatat durasi satu tahap (detik) ke dict timings."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = time.perf_counter() - started
+
+
+def finish(response, timings, started, status_code=200):
+    """Satu baris log terstruktur per request, plus header Server-Timing."""
+    total = time.perf_counter() - started
+    logging.info("recognize status=%d total_ms=%.1f %s", status_code, total * 1000,
+                 " ".join(f"{name}_ms={seconds * 1000:.1f}" for name, seconds in timings.items()))
+    entries = [f"app;dur={total * 1000:.1f}"]
+    if request.headers.get(TRACE_HEADER) == "1":
+        entries += [f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items()]
+    response.headers["Server-Timing"] = ", ".join(entries)
+    return response, status_code
+
+
 @app.route("/")
 def index():
     return "Face Recognition API siap digunakan. Kirim POST request ke /recognize."
@@ -26,27 +55,31 @@ def recognize_face():
     if file.filename == '':
         return jsonify({"error": "Tidak ada file yang dipilih"}), 400
 
-    temp_dir = tempfile.gettempdir()
-    temp_file_path = os.path.join(temp_dir, file.filename)
-    file.save(temp_file_path)
-    logging.info(f"File sementara disimpan di: {temp_file_path}")
+    started = time.perf_counter()
+    timings = {}
+
+    # Dekode langsung dari memori; tidak ada file sementara yang bisa bertabrakan antar request
+    with stage(timings, "decode"):
+        image = cv2.imdecode(np.frombuffer(file.read(), dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        return finish(jsonify({"error": "File bukan gambar yang valid"}), timings, started, 400)
 
     try:
-        # Menambahkan print() untuk debugging, ini akan tampil di terminal server Flask
-        logging.info("Mencari wajah di database...")
-        dfs = DeepFace.find(
-            img_path=temp_file_path,
-            db_path=DB_PATH,
-            model_name="VGG-Face",
-            enforce_detection=False
-        )
-        
-        # dfs adalah list of DataFrame. Kita cek isinya.
-        logging.info(f"Hasil dari DeepFace.find(): {dfs}")
+        # DeepFace.find menjalankan deteksi, embedding dan pencarian sekaligus
+        with stage(timings, "find"):
+            dfs = DeepFace.find(
+                img_path=image,
+                db_path=DB_PATH,
+                model_name="VGG-Face",
+                enforce_detection=False
+            )
+
+        # dfs adalah list of DataFrame; cukup catat jumlah kandidat, bukan seluruh DataFrame
+        logging.info("DeepFace.find(): %d kandidat", len(dfs[0]) if dfs else 0)
 
         if not dfs or dfs[0].empty:
             logging.info("Tidak ada wajah yang cocok ditemukan di database.")
-            return jsonify({"status": "unknown", "message": "Wajah tidak dikenali."})
+            return finish(jsonify({"status": "unknown", "message": "Wajah tidak dikenali."}), timings, started)
 
         # Ambil hasil teratas
         top_result = dfs[0].iloc[0]
@@ -60,20 +93,17 @@ def recognize_face():
         confidence_level = (1 - distance) * 100
 
         logging.info(f"Wajah teridentifikasi sebagai: {name} dengan confidence: {confidence_level:.2f}%")
-        return jsonify({
-            "status": "recognized",
-            "name": name,
-            "confidence": f"{confidence_level:.2f}%"
-        })
+        with stage(timings, "response"):
+            response = jsonify({
+                "status": "recognized",
+                "name": name,
+                "confidence": f"{confidence_level:.2f}%"
+            })
+        return finish(response, timings, started)
 
     except Exception as e:
         logging.error(f"Terjadi error saat pemrosesan: {e}", exc_info=True)
-        return jsonify({"error": str(e)}), 500
-
-    finally:
-        if os.path.exists(temp_file_path):
-            os.remove(temp_file_path)
-            logging.info(f"File sementara dihapus: {temp_file_path}")
+        return finish(jsonify({"error": str(e)}), timings, started, 500)
 
 if __name__ == '__main__':
     # Ganti port jika perlu
@@ -0,0 +1,425 @@
+# ann_index.py
+import os
+import json
+import numpy as np
+
+# Backend pencarian: "exact" (brute-force), "ivf" (inverted file, approximate) atau
+# "template" (template per orang lalu pencarian tepat atas sampel kandidat)
+INDEX_BACKEND = os.environ.get("INDEX_BACKEND", "exact")
+# Di bawah jumlah baris ini IVF tidak sebanding dengan biayanya, jadi tetap brute-force
+IVF_MIN_ROWS = int(os.environ.get("IVF_MIN_ROWS", "4096"))
+# Direktori penyimpanan index IVF (satu subdirektori per model)
+ANN_INDEX_PATH = os.environ.get("ANN_INDEX_PATH", "ann_index")
+# Jumlah list IVF yang diperiksa per query; makin besar makin akurat tetapi makin lambat
+IVF_N_PROBE = int(os.environ.get("IVF_N_PROBE", "8"))
+# Latih ulang centroid jika jumlah baris sudah tumbuh sebesar faktor ini sejak pelatihan terakhir
+IVF_RETRAIN_FACTOR = 2.0
+
+# Jumlah medoid (sampel nyata) per orang yang disimpan di samping centroid (backend template)
+TEMPLATE_MEDOIDS = int(os.environ.get("TEMPLATE_MEDOIDS", "2"))
+# Jumlah orang teratas menurut template yang sampel mentahnya diperiksa ulang secara tepat
+TEMPLATE_CANDIDATES = int(os.environ.get("TEMPLATE_CANDIDATES", "8"))
+
+# Ukuran potongan baris saat menghitung perkalian matriks besar agar memori tetap terbatas
+_CHUNK_ROWS = 8192
+
+
+def top_k(similarities, k):
+    """Indeks k nilai similarity terbesar, terurut menurun."""
+    k = min(k, len(similarities))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    top = np.argpartition(-similarities, k - 1)[:k]
+    return top[np.argsort(-similarities[top])]
+
+
+def _assign(vectors, centroids):
+    """Centroid terdekat (cosine) untuk setiap baris, dihitung per potongan."""
+    assignments = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), _CHUNK_ROWS):
+        chunk = vectors[start:start + _CHUNK_ROWS]
+        assignments[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return assignments
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32)
+
+
+def train_centroids(vectors, n_lists, iterations=10, sample_size=65536, seed=0):
+    """
+    Spherical k-means sederhana di NumPy untuk quantizer kasar IVF.
+    Dilatih pada sampel acak agar biaya pelatihan tidak tumbuh linear dengan galeri.
+    """
+    rng = np.random.default_rng(seed)
+    if len(vectors) > sample_size:
+        sample = np.asarray(vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))])
+    else:
+        sample = np.asarray(vectors)
+    n_lists = min(n_lists, len(sample))
+    centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignments = _assign(sample, centroids)
+        counts = np.bincount(assignments, minlength=n_lists)
+        empty = counts == 0
+        # Jumlahkan anggota tiap list sekaligus: urutkan per list lalu reduceat per segmen
+        order = np.argsort(assignments, kind="stable")
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        sums = np.zeros_like(centroids)
+        sums[~empty] = np.add.reduceat(sample[order], starts[~empty], axis=0)
+        # List kosong diisi ulang dengan titik acak agar semua list tetap terpakai
+        if empty.any():
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()), replace=False)]
+        centroids = _normalize(sums)
+    return centroids
+
+
+def top_k_rows(similarities, k):
+    """top_k untuk setiap baris matriks similarity (query x galeri)."""
+    k = min(k, similarities.shape[1])
+    top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+    top_sims = np.take_along_axis(similarities, top, axis=1)
+    order = np.argsort(-top_sims, axis=1)
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_sims, order, axis=1)
+
+
+class ExactIndex:
+    """Pencarian brute-force: satu perkalian matriks-vektor atas seluruh galeri. Selalu tepat."""
+
+    kind = "exact"
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def __len__(self):
+        return len(self.vectors)
+
+    @classmethod
+    def build(cls, vectors):
+        return cls(vectors)
+
+    def updated(self, vectors, keep, n_new):
+        return ExactIndex(vectors)
+
+    def search(self, query, k):
+        """
+        Returns:
+            tuple: (indeks baris, cosine similarity) terurut menurun.
+        """
+        similarities = self.vectors @ query
+        top = top_k(similarities, k)
+        return top, similarities[top]
+
+    def search_batch(self, queries, k):
+        """
+        Mencari banyak query sekaligus dengan satu perkalian matriks-matriks.
+
+        Returns:
+            tuple: (indeks baris, similarity), masing-masing berbentuk (jumlah query, k).
+        """
+        return top_k_rows(queries @ self.vectors.T, k)
+
+
+class IVFIndex:
+    """
+    Inverted file index: galeri dibagi ke n_lists kelompok berdasarkan centroid terdekat,
+    dan query hanya memeriksa n_probe kelompok terdekat lalu di-rerank secara tepat.
+    Biaya per query kira-kira O(n_lists + N * n_probe / n_lists), sub-linear terhadap N.
+    """
+
+    kind = "ivf"
+
+    def __init__(self, vectors, centroids, assignments, n_probe=IVF_N_PROBE, trained_size=None):
+        self.vectors = vectors
+        self.centroids = centroids
+        self.assignments = assignments
+        self.n_probe = n_probe
+        self.trained_size = trained_size or len(vectors)
+        # Baris diurutkan per list agar kandidat satu list bisa diambil sebagai satu slice
+        self._order = np.argsort(assignments, kind="stable")
+        self._offsets = np.searchsorted(assignments[self._order], np.arange(len(centroids) + 1))
+
+    def __len__(self):
+        return len(self.vectors)
+
+    @classmethod
+    def build(cls, vectors, n_lists=None, n_probe=IVF_N_PROBE):
+        # Aturan praktis umum: sekitar 4 * sqrt(N) list
+        n_lists = n_lists or max(1, int(4 * np.sqrt(len(vectors))))
+        centroids = train_centroids(vectors, n_lists)
+        return cls(vectors, centroids, _assign(vectors, centroids), n_probe)
+
+    def updated(self, vectors, keep, n_new):
+        """
+        Index baru setelah perubahan inkremental: baris lama yang dipertahankan tetap di
+        list-nya, baris baru cukup dimasukkan ke centroid terdekat tanpa pelatihan ulang.
+        Centroid dilatih ulang hanya jika galeri sudah tumbuh jauh sejak pelatihan terakhir.
+        """
+        if len(vectors) > IVF_RETRAIN_FACTOR * self.trained_size:
+            return IVFIndex.build(vectors, n_probe=self.n_probe)
+        new_assignments = _assign(vectors[len(vectors) - n_new:], self.centroids)
+        assignments = np.concatenate([self.assignments[keep], new_assignments]).astype(np.int32)
+        return IVFIndex(vectors, self.centroids, assignments, self.n_probe, self.trained_size)
+
+    def search(self, query, k):
+        """
+        Returns:
+            tuple: (indeks baris, cosine similarity) terurut menurun.
+        """
+        probe = top_k(self.centroids @ query, self.n_probe)
+        candidates = np.concatenate([
+            self._order[self._offsets[lst]:self._offsets[lst + 1]] for lst in probe
+        ])
+        if len(candidates) < k:
+            # Terlalu sedikit kandidat: kembali ke pencarian tepat
+            return ExactIndex(self.vectors).search(query, k)
+        similarities = self.vectors[candidates] @ query
+        top = top_k(similarities, k)
+        return candidates[top], similarities[top]
+
+    def search_batch(self, queries, k):
+        """Setiap query memeriksa list yang berbeda, jadi dicari satu per satu."""
+        results = [self.search(query, k) for query in queries]
+        return [ids for ids, _ in results], [sims for _, sims in results]
+
+    def save(self, path, keys=None):
+        """
+        Menyimpan index sebagai file .npy terpisah agar bisa di-memory-map saat dimuat.
+
+        Args:
+            path (str): Direktori tujuan.
+            keys (list): Opsional, kunci baris (misalnya "identity|sha256") untuk validasi saat dimuat.
+        """
+        os.makedirs(path, exist_ok=True)
+        # Tulis ke file sementara per proses lalu ganti secara atomik, karena beberapa
+        # worker server bisa menyimpan index yang sama bersamaan; meta.json ditulis terakhir
+        arrays = {
+            "vectors.npy": np.asarray(self.vectors, dtype=np.float32),
+            "centroids.npy": self.centroids,
+            "assignments.npy": self.assignments,
+        }
+        for name, array in arrays.items():
+            temp_path = os.path.join(path, f"{name}.{os.getpid()}.tmp")
+            with open(temp_path, "wb") as f:
+                np.save(f, array)
+            os.replace(temp_path, os.path.join(path, name))
+        temp_path = os.path.join(path, f"meta.json.{os.getpid()}.tmp")
+        with open(temp_path, "w") as f:
+            json.dump({"n_probe": self.n_probe, "trained_size": self.trained_size, "keys": keys or []}, f)
+        os.replace(temp_path, os.path.join(path, "meta.json"))
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Memuat index yang disimpan dengan save(). Dengan mmap=True vektor galeri tidak
+        dibaca ke RAM sekaligus; halaman dimuat sesuai kebutuhan dan dibagi antar proses.
+
+        Returns:
+            tuple: (IVFIndex, keys)
+        """
+        mode = "r" if mmap else None
+        vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode=mode)
+        centroids = np.load(os.path.join(path, "centroids.npy"))
+        assignments = np.load(os.path.join(path, "assignments.npy"))
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        index = cls(vectors, centroids, assignments, meta["n_probe"], meta["trained_size"])
+        return index, meta["keys"]
+
+
+def select_medoids(samples, count, iterations=3):
+    """
+    k-medoids cosine sederhana atas sampel satu orang.
+
+    Dimulai dari sampel paling sentral, lalu ditambah sampel yang paling jauh dari yang sudah
+    dipilih (misalnya foto berkacamata), kemudian setiap medoid digeser ke sampel paling sentral
+    di kelompoknya.
+
+    Returns:
+        np.ndarray: Indeks hingga `count` sampel terpilih.
+    """
+    if len(samples) <= count:
+        return np.arange(len(samples))
+    similarities = samples @ samples.T
+    chosen = [int(np.argmax(similarities.sum(axis=1)))]
+    while len(chosen) < count:
+        chosen.append(int(np.argmin(similarities[:, chosen].max(axis=1))))
+    chosen = np.array(chosen)
+    for _ in range(iterations):
+        assignments = np.argmax(similarities[:, chosen], axis=1)
+        updated = chosen.copy()
+        for cluster in range(count):
+            members = np.flatnonzero(assignments == cluster)
+            if len(members):
+                updated[cluster] = members[np.argmax(similarities[np.ix_(members, members)].sum(axis=1))]
+        if np.array_equal(updated, chosen):
+            break
+        chosen = updated
+    return chosen
+
+
+class TemplateIndex:
+    """
+    Index dua tahap berbasis identitas.
+
+    Setiap orang diwakili satu centroid (rata-rata sampel yang dinormalisasi). Orang yang
+    sampelnya lebih banyak dari 1 + n_medoids juga mendapat n_medoids medoid; untuk orang lain
+    template sebesar itu tidak lebih kecil dari sampelnya sendiri. Matriks template berisi satu
+    blok centroid (satu baris per orang) diikuti blok medoid hanya untuk orang yang memilikinya,
+    sehingga tahap pertama berukuran kira-kira jumlah orang, bukan jumlah gambar. Skor orang
+    adalah similarity tertinggi di antara templatenya. Tahap kedua memeriksa ulang secara tepat
+    hanya sampel mentah dari n_candidates orang teratas, sehingga jarak yang dikembalikan tetap
+    jarak ke satu gambar dan ambang batas yang ada tetap berlaku.
+    """
+
+    kind = "template"
+
+    def __init__(self, vectors, labels, templates, medoid_people, n_medoids=TEMPLATE_MEDOIDS,
+                 n_candidates=TEMPLATE_CANDIDATES):
+        self.vectors = vectors
+        self.labels = labels
+        self.n_people = int(labels.max()) + 1 if len(labels) else 0
+        # Baris 0..P-1: centroid per orang; sesudahnya n_medoids baris per orang di medoid_people
+        self.templates = templates
+        self.medoid_people = medoid_people
+        self.n_medoids = n_medoids
+        self.n_candidates = n_candidates
+        # Nomor orang untuk setiap baris template
+        self.template_labels = np.concatenate([np.arange(self.n_people), np.repeat(medoid_people, n_medoids)])
+        # Posisi blok medoid setiap orang (-1 jika hanya centroid), untuk dipakai ulang saat update
+        self._medoid_slot = np.full(self.n_people, -1, dtype=np.int64)
+        self._medoid_slot[medoid_people] = np.arange(len(medoid_people))
+        # Baris diurutkan per orang agar sampel satu orang bisa diambil sebagai satu slice
+        self._order = np.argsort(labels, kind="stable")
+        self._offsets = np.searchsorted(labels[self._order], np.arange(self.n_people + 1))
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def _medoid_block(self):
+        return self.templates[self.n_people:].reshape(len(self.medoid_people), self.n_medoids, -1)
+
+    @classmethod
+    def build(cls, vectors, labels, n_medoids=TEMPLATE_MEDOIDS, n_candidates=TEMPLATE_CANDIDATES,
+              previous=None, old_of_new=None, reuse=None):
+        """
+        Args:
+            vectors (np.ndarray): Embedding ternormalisasi L2, satu baris per gambar.
+            labels (np.ndarray): Nomor orang 0..P-1 untuk setiap baris.
+            previous (TemplateIndex): Opsional, index lama yang templatenya dipakai ulang.
+            old_of_new (np.ndarray): Nomor orang lama untuk setiap nomor orang baru (-1 jika baru).
+            reuse (np.ndarray): Mask orang yang templatenya diambil dari `previous`.
+        """
+        labels = np.asarray(labels, dtype=np.int64)
+        n_people = int(labels.max()) + 1
+        order = np.argsort(labels, kind="stable")
+        counts = np.bincount(labels, minlength=n_people)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+
+        if reuse is None:
+            reuse = np.zeros(n_people, dtype=bool)
+            # Jumlahkan sampel tiap orang sekaligus: baris sudah urut per orang, reduceat per segmen
+            centroids = _normalize(np.add.reduceat(np.asarray(vectors)[order], starts, axis=0))
+        else:
+            centroids = np.empty((n_people, previous.templates.shape[1]), dtype=np.float32)
+            centroids[reuse] = previous.templates[old_of_new[reuse]]
+            for person in np.flatnonzero(~reuse):
+                rows = order[starts[person]:starts[person] + counts[person]]
+                centroids[person] = _normalize(vectors[rows].sum(axis=0))
+
+        has_medoids = ~reuse & (counts > 1 + n_medoids) if n_medoids else np.zeros(n_people, dtype=bool)
+        computed = np.flatnonzero(has_medoids)
+        old_slots = np.full(n_people, -1, dtype=np.int64)
+        if reuse.any():
+            old_slots[reuse] = previous._medoid_slot[old_of_new[reuse]]
+            has_medoids |= old_slots >= 0
+        medoid_people = np.flatnonzero(has_medoids)
+
+        block = np.empty((len(medoid_people), n_medoids, centroids.shape[1]), dtype=np.float32)
+        copied = old_slots[medoid_people] >= 0
+        if copied.any():
+            block[copied] = previous._medoid_block()[old_slots[medoid_people[copied]]]
+        # Medoid baru hanya untuk orang yang berubah
+        for slot in np.searchsorted(medoid_people, computed):
+            rows = order[starts[medoid_people[slot]]:starts[medoid_people[slot]] + counts[medoid_people[slot]]]
+            block[slot] = vectors[rows[select_medoids(vectors[rows], n_medoids)]]
+
+        templates = np.ascontiguousarray(np.vstack([centroids, block.reshape(-1, centroids.shape[1])]))
+        return cls(vectors, labels, templates, medoid_people, n_medoids, n_candidates)
+
+    def updated(self, vectors, keep, n_new, labels):
+        """
+        Index baru setelah perubahan inkremental: centroid dan medoid hanya dihitung ulang untuk
+        orang yang sampelnya bertambah atau berkurang; template orang lain dipakai ulang.
+        """
+        labels = np.asarray(labels, dtype=np.int64)
+        n_kept = len(labels) - n_new
+        # Nomor orang bisa bergeser saat ada orang baru; petakan lewat baris yang dipertahankan
+        old_of_new = np.full(int(labels.max()) + 1, -1, dtype=np.int64)
+        old_of_new[labels[:n_kept]] = self.labels[keep]
+        changed = np.zeros(len(old_of_new), dtype=bool)
+        changed[labels[n_kept:]] = True
+        changed |= old_of_new < 0
+        changed |= np.isin(old_of_new, self.labels[~keep])
+        return TemplateIndex.build(vectors, labels, self.n_medoids, self.n_candidates,
+                                   previous=self, old_of_new=old_of_new, reuse=~changed)
+
+    def _scores(self, similarities):
+        """Skor per orang (kolom terakhir) dari similarity per baris template."""
+        scores = similarities[..., :self.n_people].copy()
+        if len(self.medoid_people):
+            medoids = similarities[..., self.n_people:]
+            # Maksimum per orang lewat slice berjarak n_medoids; max(axis=-1) atas sumbu sepanjang
+            # n_medoids jauh lebih lambat di NumPy
+            best = medoids[..., 0::self.n_medoids].copy()
+            for j in range(1, self.n_medoids):
+                np.maximum(best, medoids[..., j::self.n_medoids], out=best)
+            scores[..., self.medoid_people] = np.maximum(scores[..., self.medoid_people], best)
+        return scores
+
+    def _refine(self, query, scores, k):
+        people = top_k(scores, max(k, self.n_candidates))
+        candidates = np.concatenate([self._order[self._offsets[p]:self._offsets[p + 1]] for p in people])
+        similarities = self.vectors[candidates] @ query
+        top = top_k(similarities, k)
+        return candidates[top], similarities[top]
+
+    def search(self, query, k):
+        """
+        Returns:
+            tuple: (indeks baris, cosine similarity) terurut menurun.
+        """
+        return self._refine(query, self._scores(self.templates @ query), k)
+
+    def search_batch(self, queries, k):
+        """Tahap template untuk semua query dalam satu perkalian matriks; tahap sampel per query."""
+        scores = self._scores(queries @ self.templates.T)
+        results = [self._refine(query, row, k) for query, row in zip(queries, scores)]
+        return [ids for ids, _ in results], [sims for _, sims in results]
+
+
+def build_index(vectors, backend=INDEX_BACKEND, labels=None):
+    """
+    Membangun index sesuai backend; galeri kecil selalu memakai brute-force.
+    Backend template butuh `labels` (nomor orang per baris).
+    """
+    if backend == "template" and labels is not None and len(vectors):
+        return TemplateIndex.build(vectors, labels)
+    if backend == "ivf" and len(vectors) >= IVF_MIN_ROWS:
+        return IVFIndex.build(vectors)
+    return ExactIndex.build(vectors)
+
+
+def update_index(index, vectors, keep, n_new, backend=INDEX_BACKEND, labels=None):
+    """Memperbarui index secara inkremental, berpindah backend jika ukuran galeri melewati IVF_MIN_ROWS."""
+    if backend == "template" or index.kind == "template":
+        if index.kind == "template" and backend == "template" and labels is not None and len(vectors):
+            return index.updated(vectors, keep, n_new, labels)
+        return build_index(vectors, backend, labels)
+    wants_ivf = backend == "ivf" and len(vectors) >= IVF_MIN_ROWS
+    if wants_ivf != (index.kind == "ivf"):
+        return build_index(vectors, backend)
+    return index.updated(vectors, keep, n_new)
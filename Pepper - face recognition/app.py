@@ -1,38 +1,98 @@
 # app.py
 import os
-import uuid
 import base64
-from flask import Flask, request, jsonify
-from deepface import DeepFace
-import pandas as pd
-from gcs_handler import synchronize_gcs_to_local, upload_face_to_gcs, LOCAL_DB_PATH
+from flask import Flask, request, jsonify, Response
+from gcs_handler import upload_face_bytes_to_gcs, get_bucket, LOCAL_DB_PATH, GCS_SYNC_INTERVAL
+from sync_worker import SyncWorker
+from image_io import decode_image, InMemoryRequest
+from embedding_index import EmbeddingIndex, identity_to_name
+from micro_batcher import MicroBatcher
+from register_queue import (RegistrationQueue, RegistrationRejected, QueueFull, IdempotencyConflict,
+                            job_to_dict, read_idempotency_key)
+import model_registry
+import metrics
 
 #kalau local gunakan
 os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = os.path.join(os.path.dirname(__file__), "key.json")
 
 app = Flask(__name__)
+# File unggahan tetap di memori (tidak di-spool ke disk) dan didekode langsung menjadi array
+app.request_class = InMemoryRequest
 
 # --- Konfigurasi ---
 # Pilih model dan metrik jarak yang akan digunakan
 MODEL_NAME = "VGG-Face"
 DISTANCE_METRIC = "cosine"
-# Atur ambang batas jarak berdasarkan Tabel 2
-DISTANCE_THRESHOLD = 0.6
-# Direktori sementara untuk menyimpan file yang diunggah
-UPLOAD_FOLDER = 'temp_uploads'
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
+# Atur ambang batas jarak berdasarkan Tabel 2; kalibrasi ulang dengan eval_thresholds.py
+DISTANCE_THRESHOLD = float(os.environ.get("DISTANCE_THRESHOLD", "0.6"))
+# Unggahan didekode langsung dari memori; batasi ukurannya agar memori tetap terkendali
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", str(16 * 1024 * 1024)))
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES
 
 # Pesan respons standar
 UNRECOGNIZED_MESSAGE = "wajah anda tidak saya kenali silahkan daftarkan wajah anda"
+# Batas jumlah gambar dalam satu permintaan /recognize_batch
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", "64"))
+
+# Index embedding resident di memori, dimuat sekali lalu hanya dimuat ulang jika database berubah
+face_index = EmbeddingIndex(LOCAL_DB_PATH, MODEL_NAME)
+
+# Wajah dari request yang datang bersamaan digabung menjadi satu batch inferensi
+embedder = MicroBatcher(MODEL_NAME)
+
+# Sinkronisasi GCS berjalan di thread latar belakang; perubahan diterapkan per baris ke index
+sync_worker = SyncWorker(get_bucket, LOCAL_DB_PATH, interval=GCS_SYNC_INTERVAL)
+sync_worker.subscribe(face_index.apply_changes)
+sync_worker.start()
+
+# Panaskan model di latar belakang saat proses dimulai; index embedding dimuat setelahnya
+model_registry.start_warm_up([MODEL_NAME], after=face_index.load)
+
+
+@app.before_request
+def start_trace():
+    # Rincian per tahap di Server-Timing hanya jika client mengirim header X-Face-Trace: 1
+    metrics.begin_request(request.endpoint, trace=request.headers.get(metrics.TRACE_HEADER) == "1")
+
+
+@app.after_request
+def add_server_timing(response):
+    # Waktu proses server, dipakai client robot untuk memisahkan waktu jaringan dan server
+    trace = metrics.end_request(response.status_code)
+    if trace is not None:
+        response.headers["Server-Timing"] = trace.server_timing()
+    return response
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """
+    Metrik format Prometheus: jumlah dan durasi request per endpoint, serta histogram
+    durasi per tahap (gcs_sync, decode, detect, embed, embed_batch, search, upload, response).
+    """
+    return Response(metrics.REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route('/ready', methods=['GET'])
+def readiness():
+    """
+    Endpoint kesiapan untuk load balancer.
+    Mengembalikan 200 setelah semua model selesai dipanaskan, 503 sebelumnya.
+    """
+    state = model_registry.status()
+    state["database_version"] = sync_worker.snapshot.version
+    state["batching"] = embedder.stats()
+    return jsonify(state), (200 if state["ready"] else 503)
+
 
 @app.route('/recognize', methods=['POST'])
 def recognize_face():
     """
     Endpoint untuk mengenali wajah dari gambar yang diunggah.
     """
-    # Lakukan sinkronisasi cerdas di setiap request untuk memastikan database selalu terbaru
-    synchronize_gcs_to_local()
+    # Sinkronisasi GCS ditangani oleh sync_worker; request cukup membaca snapshot index terakhir
+    if not face_index.loaded:
+        face_index.load()
 
     # Periksa apakah ada file gambar dalam permintaan
     if 'image' not in request.files:
@@ -43,69 +103,47 @@ def recognize_face():
         return jsonify({"status": "error", "message": "Nama file kosong"}), 400
 
     if file:
-        # Simpan file sementara
-        filename = str(uuid.uuid4()) + os.path.splitext(file.filename)[1]
-        temp_image_path = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(temp_image_path)
+        # Dekode unggahan langsung dari memori tanpa file sementara
+        with metrics.stage("decode"):
+            image = decode_image(file.read())
+        if image is None:
+            return jsonify({"status": "error", "message": "File bukan gambar yang valid."}), 400
 
         try:
-            # Gunakan DeepFace.find untuk mencari wajah di database lokal
-            # enforce_detection=False agar tidak error jika tidak ada wajah
-            dfs = DeepFace.find(
-                img_path=temp_image_path,
-                db_path=LOCAL_DB_PATH,
-                model_name=MODEL_NAME,
-                distance_metric=DISTANCE_METRIC,
-                enforce_detection=False
-            )
-
-            # DeepFace.find mengembalikan list of dataframes. Kita proses dataframe pertama.
-            if not dfs or dfs[0].empty:
+            # Deteksi wajah di thread request, embedding lewat micro-batcher, lalu cari di index
+            # yang sudah ada di memori. Tanpa wajah terdeteksi, seluruh gambar dipakai (enforce_detection=False)
+            # Tahap "detect" mencakup deteksi dan penyelarasan (keduanya di dalam DeepFace.extract_faces)
+            with metrics.stage("detect"):
+                face = model_registry.detect_face(image)
+            with metrics.stage("embed"):
+                embedding = embedder.embed(face) if face is not None else None
+            with metrics.stage("search"):
+                matches = face_index.search(embedding, k=1)
+
+            if not matches:
                 print("Wajah tidak ditemukan di database atau tidak ada kecocokan.")
                 return jsonify({"status": "unrecognized", "message": UNRECOGNIZED_MESSAGE})
 
-            # Ambil dataframe hasil dari list
-            result_df = dfs[0]
-            
-            # Ambil baris pertama (kecocokan terbaik)
-            best_match = result_df.iloc[0]
-            
-            # Cari nama kolom jarak secara dinamis.
-            distance_column_name = [col for col in result_df.columns if DISTANCE_METRIC in col]
-            
-            # Jika tidak ketemu, coba gunakan nama kolom 'distance' sebagai fallback
-            if not distance_column_name:
-                if 'distance' in result_df.columns:
-                    distance_column_name = ['distance']
-                else:
-                    raise KeyError(f"Tidak dapat menemukan kolom jarak. Kolom yang tersedia: {list(result_df.columns)}")
-
-            # Ambil jarak dari kolom yang ditemukan
-            distance = best_match[distance_column_name[0]]
-            
+            # Ambil kecocokan terbaik
+            best_match = matches[0]
+            distance = best_match['distance']
+
             # Periksa apakah jarak di bawah ambang batas
             if distance <= DISTANCE_THRESHOLD:
-                # Ekstrak nama dari path identitas
-                identity_path = best_match['identity']
-                
-                # Coba ekstrak nama dari struktur folder bersarang (gcs_database/NAMA/file.jpg)
-                person_name = os.path.basename(os.path.dirname(identity_path))
-                
-                # Jika hasilnya adalah nama folder database itu sendiri, berarti strukturnya datar (gcs_database/NAMA.jpg)
-                # Maka, kita ambil nama dari nama filenya.
-                if person_name == LOCAL_DB_PATH:
-                    person_name = os.path.splitext(os.path.basename(identity_path))[0]
+                # Ekstrak nama dari path identitas (struktur bersarang maupun datar)
+                person_name = identity_to_name(best_match['identity'], LOCAL_DB_PATH)
 
                 # Hitung skor kepercayaan sebagai kebalikan dari jarak
                 confidence_score = (1 - distance) * 100
 
                 print(f"Wajah dikenali sebagai: {person_name} dengan jarak: {distance} (kepercayaan: {confidence_score:.2f}%)")
-                return jsonify({
-                    "status": "recognized", 
-                    "name": person_name, 
-                    "distance": float(distance),
-                    "confidence": f"{confidence_score:.2f}%"
-                })
+                with metrics.stage("response"):
+                    return jsonify({
+                        "status": "recognized", 
+                        "name": person_name, 
+                        "distance": float(distance),
+                        "confidence": f"{confidence_score:.2f}%"
+                    })
             else:
                 print(f"Kecocokan ditemukan tetapi jarak ({distance}) di atas ambang batas ({DISTANCE_THRESHOLD}).")
                 return jsonify({"status": "unrecognized", "message": UNRECOGNIZED_MESSAGE})
@@ -116,61 +154,183 @@ def recognize_face():
             if "Face could not be detected" in str(e):
                  return jsonify({"status": "error", "message": "Tidak ada wajah yang terdeteksi di gambar."})
             return jsonify({"status": "error", "message": f"Terjadi kesalahan internal: {str(e)}"})
-        finally:
-            # Hapus file sementara setelah diproses
-            if os.path.exists(temp_image_path):
-                os.remove(temp_image_path)
     
     return jsonify({"status": "error", "message": "Terjadi kesalahan yang tidak diketahui."}), 500
 
 
+def _match_to_result(matches):
+    """
+    Mengubah hasil pencarian index menjadi respons untuk satu gambar, dengan format yang sama seperti /recognize.
+    """
+    if not matches or matches[0]['distance'] > DISTANCE_THRESHOLD:
+        return {"status": "unrecognized", "message": UNRECOGNIZED_MESSAGE}
+
+    distance = matches[0]['distance']
+    person_name = identity_to_name(matches[0]['identity'], LOCAL_DB_PATH)
+    confidence_score = (1 - distance) * 100
+    return {
+        "status": "recognized",
+        "name": person_name,
+        "distance": float(distance),
+        "confidence": f"{confidence_score:.2f}%"
+    }
+
+
+@app.route('/recognize_batch', methods=['POST'])
+def recognize_batch():
+    """
+    Endpoint untuk mengenali banyak gambar dalam satu permintaan.
+    Menerima field multipart 'images' (boleh berulang). Wajah dideteksi per gambar,
+    embedding semua wajah dihitung dalam satu forward pass, lalu dicocokkan dengan galeri
+    lewat satu perkalian matriks. Hasil dikembalikan sesuai urutan gambar yang diunggah.
+    """
+    files = request.files.getlist('images')
+    if not files:
+        return jsonify({"status": "error", "message": "Tidak ada file gambar dalam permintaan"}), 400
+    if len(files) > MAX_BATCH_SIZE:
+        return jsonify({"status": "error", "message": f"Maksimal {MAX_BATCH_SIZE} gambar per permintaan."}), 413
+
+    if not face_index.loaded:
+        face_index.load()
+
+    # Tahap 1: dekode dan deteksi per gambar; gambar yang gagal langsung diberi hasil error
+    results = [None] * len(files)
+    faces, positions = [], []
+    for position, file in enumerate(files):
+        try:
+            with metrics.stage("decode"):
+                image = decode_image(file.read())
+            if image is None:
+                results[position] = {"status": "error", "message": "File bukan gambar yang valid."}
+                continue
+            with metrics.stage("detect"):
+                face = model_registry.detect_face(image)
+            if face is None:
+                results[position] = {"status": "error", "message": "Tidak ada wajah yang terdeteksi di gambar."}
+                continue
+            faces.append(face)
+            positions.append(position)
+        except Exception as e:
+            print(f"Error selama deteksi gambar ke-{position}: {e}")
+            results[position] = {"status": "error", "message": f"Terjadi kesalahan internal: {str(e)}"}
+
+    # Tahap 2: satu forward pass untuk semua wajah, lalu satu pencarian matriks-matriks
+    try:
+        with metrics.stage("embed"):
+            embeddings = model_registry.embed_faces(faces, MODEL_NAME)
+        with metrics.stage("search"):
+            batch_matches = face_index.search_batch(embeddings, k=1)
+    except Exception as e:
+        print(f"Error selama pemrosesan batch: {e}")
+        return jsonify({"status": "error", "message": f"Terjadi kesalahan internal: {str(e)}"}), 500
+
+    for position, matches in zip(positions, batch_matches):
+        results[position] = _match_to_result(matches)
+
+    recognized = sum(1 for result in results if result["status"] == "recognized")
+    print(f"Batch {len(files)} gambar diproses, {recognized} wajah dikenali.")
+    with metrics.stage("response"):
+        return jsonify({"status": "success", "results": results})
+
+
+def read_register_payload():
+    """
+    Membaca (bytes gambar, nama) dari multipart biner atau JSON base64.
+    Multipart lebih disarankan: tanpa base64 payload ~33% lebih kecil.
+    """
+    upload = request.files.get('image')
+    if upload is not None:
+        return upload.read(), request.form.get('name')
+    data = request.get_json(silent=True)
+    if not data or 'name' not in data or 'image' not in data:
+        return None, None
+    try:
+        return base64.b64decode(data['image']), data['name']
+    except (ValueError, TypeError):
+        return None, None
+
+
+def process_registration(job, image_bytes):
+    """
+    Dijalankan thread worker RegistrationQueue: pemeriksaan kualitas, unggah ke GCS,
+    lalu embedding dan penambahan ke index lewat sync_worker.
+    """
+    with metrics.stage("decode"):
+        image = decode_image(image_bytes)
+    if image is None:
+        raise RegistrationRejected("Data 'image' bukan gambar yang valid.")
+    with metrics.stage("quality"):
+        faces = model_registry.detect_faces(image)
+    if not faces:
+        raise RegistrationRejected("Tidak ada wajah yang terdeteksi di gambar.")
+    if len(faces) > 1:
+        raise RegistrationRejected("Terdeteksi lebih dari satu wajah; kirim gambar dengan satu wajah saja.")
+
+    # Nama file dari job_id, sehingga job yang diambil ulang menimpa objek yang sama
+    filename = f"{job.name}_{job.job_id}.jpg"
+    with metrics.stage("upload"):
+        blob = upload_face_bytes_to_gcs(image_bytes, job.name, filename)
+    if not blob:
+        raise RuntimeError("Gagal mengunggah gambar ke GCS.")
+
+    # Catat wajah baru ke database lokal; hanya gambar ini yang di-embed dan ditambahkan ke index
+    with metrics.stage("index"):
+        sync_worker.register_upload(blob, image_bytes)
+    return f"Wajah untuk {job.name} berhasil didaftarkan."
+
+
+# Pendaftaran diproses di latar belakang; /register hanya memasukkan job ke antrean
+register_queue = RegistrationQueue(process_registration).start()
+
+
 @app.route('/register', methods=['POST'])
 def register_face():
     """
     Endpoint untuk mendaftarkan wajah baru.
-    Menerima JSON dengan 'name' dan 'image' (base64 encoded).
+    Menerima multipart/form-data dengan field 'name' dan file 'image' (biner),
+    atau JSON dengan 'name' dan 'image' (base64 encoded).
+
+    Gambar hanya dimasukkan ke antrean; respons 202 berisi job_id yang statusnya bisa
+    ditanyakan di /register/<job_id>. Header Idempotency-Key (atau field 'idempotency_key')
+    membuat pengiriman ulang mengembalikan job yang sama.
     """
-    data = request.get_json()
-    if not data or 'name' not in data or 'image' not in data:
+    with metrics.stage("read"):
+        image_bytes, person_name = read_register_payload()
+    if not image_bytes or not person_name:
         return jsonify({"status": "error", "message": "Permintaan tidak valid. 'name' dan 'image' diperlukan."}), 400
 
-    person_name = data['name']
-    image_data = data['image']
-
     try:
-        # Decode gambar base64 dan simpan sementara
-        image_bytes = base64.b64decode(image_data)
-        filename = f"{person_name}_{uuid.uuid4()}.jpg"
-        temp_image_path = os.path.join(UPLOAD_FOLDER, filename)
-        
-        with open(temp_image_path, 'wb') as f:
-            f.write(image_bytes)
-
-        # Unggah gambar ke GCS
-        success = upload_face_to_gcs(temp_image_path, person_name)
-
-        if success:
-            # Setelah pendaftaran, sinkronkan kembali GCS ke lokal agar wajah baru tersedia
-            print("Memperbarui database lokal setelah pendaftaran baru...")
-            synchronize_gcs_to_local()
-            return jsonify({"status": "success", "message": f"Wajah untuk {person_name} berhasil didaftarkan."})
-        else:
-            return jsonify({"status": "error", "message": "Gagal mengunggah gambar ke GCS."}), 500
+        with metrics.stage("enqueue"):
+            job, created = register_queue.submit(person_name, image_bytes, read_idempotency_key(request))
+    except QueueFull:
+        response = jsonify({"status": "error", "message": "Antrean pendaftaran penuh, coba lagi nanti."})
+        response.headers["Retry-After"] = "5"
+        return response, 503
+    except IdempotencyConflict:
+        return jsonify({"status": "error", "message": "Idempotency-Key sudah dipakai untuk nama lain."}), 409
 
-    except Exception as e:
-        print(f"Error selama pendaftaran: {e}")
-        return jsonify({"status": "error", "message": f"Terjadi kesalahan internal: {str(e)}"}), 500
-    finally:
-        # Hapus file sementara
-        if 'temp_image_path' in locals() and os.path.exists(temp_image_path):
-            os.remove(temp_image_path)
+    body = job_to_dict(job)
+    body["status_url"] = f"/register/{job.job_id}"
+    if created:
+        body["message"] = f"Pendaftaran wajah untuk {person_name} sedang diproses."
+    return jsonify(body), 202 if created else 200
+
+
+@app.route('/register/<job_id>', methods=['GET'])
+def register_status(job_id):
+    """Status job pendaftaran: queued, processing, success atau error."""
+    job = register_queue.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Job pendaftaran tidak ditemukan."}), 404
+    return jsonify(job_to_dict(job))
 
 
 if __name__ == '__main__':
     # Saat startup, cukup pastikan folder database lokal ada.
-    # Sinkronisasi penuh akan dijalankan oleh request pertama.
+    # Sinkronisasi penuh dijalankan oleh sync_worker di latar belakang.
     if not os.path.exists(LOCAL_DB_PATH):
         os.makedirs(LOCAL_DB_PATH)
     
-    # Jalankan aplikasi Flask
-    app.run(host='0.0.0.0', port=8000, debug=True)
\ No newline at end of file
+    # Server pengembangan Flask; untuk produksi gunakan: gunicorn -c gunicorn.conf.py app:app
+    # Reloader mode debug akan memuat model dua kali, jadi debug hanya aktif jika diminta
+    app.run(host='0.0.0.0', port=8000, debug=os.environ.get("FLASK_DEBUG") == "1", threaded=True)
\ No newline at end of file
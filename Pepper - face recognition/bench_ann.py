@@ -0,0 +1,114 @@
+# bench_ann.py
+"""
+Benchmark recall dan latensi index IVF dan template per orang terhadap pencarian brute-force (exact).
+
+Galeri sintetis dibuat dari sejumlah "identitas" (pusat acak) dengan beberapa sampel
+berderau per identitas, mirip sebaran embedding wajah. Query adalah sampel baru dari
+identitas yang sama.
+
+Contoh:
+    python bench_ann.py --gallery 100000 --dim 512 --queries 500 --n-probe 8 16 32
+    python bench_ann.py --gallery 40000 --samples-per-identity 8 --candidates 1 4 8
+"""
+import time
+import json
+import argparse
+import numpy as np
+from ann_index import ExactIndex, IVFIndex, TemplateIndex
+
+
+def make_gallery(n_rows, dim, samples_per_identity=4, noise=0.35, seed=0):
+    rng = np.random.default_rng(seed)
+    n_identities = max(1, n_rows // samples_per_identity)
+    centers = rng.standard_normal((n_identities, dim)).astype(np.float32)
+    labels = rng.integers(0, n_identities, n_rows)
+    gallery = centers[labels] + noise * rng.standard_normal((n_rows, dim)).astype(np.float32)
+    gallery /= np.linalg.norm(gallery, axis=1, keepdims=True)
+    return gallery, centers, labels
+
+
+def make_queries(centers, n_queries, noise=0.35, seed=1):
+    rng = np.random.default_rng(seed)
+    labels = rng.integers(0, len(centers), n_queries)
+    queries = centers[labels] + noise * rng.standard_normal((n_queries, centers.shape[1])).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return queries
+
+
+def timed_search(index, queries, k):
+    results = []
+    start = time.perf_counter()
+    for query in queries:
+        results.append(index.search(query, k)[0])
+    elapsed = time.perf_counter() - start
+    return results, elapsed / len(queries) * 1000
+
+
+def recall_at_k(approximate, exact):
+    hits = sum(len(set(a.tolist()) & set(e.tolist())) for a, e in zip(approximate, exact))
+    return hits / sum(len(e) for e in exact)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark recall IVF dan template vs brute-force.")
+    parser.add_argument("--gallery", type=int, default=100000, help="Jumlah baris galeri.")
+    parser.add_argument("--dim", type=int, default=512, help="Dimensi embedding.")
+    parser.add_argument("--queries", type=int, default=500, help="Jumlah query.")
+    parser.add_argument("--k", type=int, default=1, help="Top-k yang dibandingkan.")
+    parser.add_argument("--n-probe", type=int, nargs="+", default=[4, 8, 16, 32])
+    parser.add_argument("--samples-per-identity", type=int, default=4, help="Rata-rata gambar per identitas.")
+    parser.add_argument("--candidates", type=int, nargs="+", default=[1, 4, 8],
+                        help="Jumlah orang kandidat backend template yang diperiksa ulang.")
+    args = parser.parse_args()
+
+    gallery, centers, labels = make_gallery(args.gallery, args.dim, args.samples_per_identity)
+    queries = make_queries(centers, args.queries)
+
+    exact = ExactIndex.build(gallery)
+    exact_results, exact_ms = timed_search(exact, queries, args.k)
+
+    start = time.perf_counter()
+    ivf = IVFIndex.build(gallery)
+    build_s = time.perf_counter() - start
+
+    report = {
+        "gallery": args.gallery,
+        "dim": args.dim,
+        "queries": args.queries,
+        "k": args.k,
+        "n_lists": len(ivf.centroids),
+        "ivf_build_s": round(build_s, 3),
+        "exact_ms_per_query": round(exact_ms, 3),
+        "ivf": [],
+        "template": [],
+    }
+    for n_probe in args.n_probe:
+        ivf.n_probe = n_probe
+        ivf_results, ivf_ms = timed_search(ivf, queries, args.k)
+        report["ivf"].append({
+            "n_probe": n_probe,
+            "recall": round(recall_at_k(ivf_results, exact_results), 4),
+            "ms_per_query": round(ivf_ms, 3),
+            "speedup": round(exact_ms / ivf_ms, 2) if ivf_ms else None,
+        })
+
+    start = time.perf_counter()
+    # Identitas tanpa sampel dibuang agar nomor orang rapat 0..P-1
+    template = TemplateIndex.build(gallery, np.unique(labels, return_inverse=True)[1])
+    report["people"] = template.n_people
+    report["template_rows"] = len(template.templates)
+    report["template_build_s"] = round(time.perf_counter() - start, 3)
+    for n_candidates in args.candidates:
+        template.n_candidates = n_candidates
+        template_results, template_ms = timed_search(template, queries, args.k)
+        report["template"].append({
+            "candidates": n_candidates,
+            "recall": round(recall_at_k(template_results, exact_results), 4),
+            "ms_per_query": round(template_ms, 3),
+            "speedup": round(exact_ms / template_ms, 2) if template_ms else None,
+        })
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
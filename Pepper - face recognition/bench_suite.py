@@ -0,0 +1,459 @@
+# bench_suite.py
+"""
+Benchmark yang bisa diulang untuk jalur pengenalan dan pendaftaran.
+
+1. Galeri sintetis dibuat dari gambar contoh di gcs_database/ dan "Deepface model/database/":
+   setiap identitas adalah augmentasi deterministik (rotasi, skala, geser, kecerahan,
+   kontras, kualitas JPEG) dari salah satu gambar contoh, disimpan sebagai
+   <galeri>/<identitas>/<n>.jpg. Dengan seed yang sama galeri yang dihasilkan sama persis.
+   Identitas dari gambar dasar yang sama tetap orang yang sama, jadi angka akurasi di sini
+   tidak bermakna; yang diukur adalah biaya galeri berukuran N.
+2. Server dijalankan terhadap galeri itu (GCS_LOCAL_BUCKET_PATH), baik di proses ini
+   (Flask test client, --mode inprocess) maupun lewat HTTP (--mode http, server yang sudah
+   berjalan di --url atau Gunicorn yang dijalankan sendiri dengan --spawn).
+3. Setiap endpoint diberi --requests request pada setiap tingkat --concurrency.
+
+Hasil berupa JSON (stdout dan --output) yang bisa di-diff antar rilis: throughput, latensi
+p50/p95/p99, jumlah error per endpoint dan tingkat konkurensi, waktu persiapan (galeri,
+sinkronisasi, index) dan puncak RSS.
+
+Contoh:
+    python bench_suite.py --identities 1000 --mode inprocess --concurrency 1 4 16 --output bench.json
+    python bench_suite.py --identities 10000 --mode http --spawn --workers 2 --endpoints recognize register
+    python bench_suite.py --mode http --url http://localhost:8000 --endpoints recognize
+    python bench_suite.py --app-dir "../final test face reco app" --endpoints recognize compare_models
+
+/register menambah wajah ke galeri; gunakan hanya terhadap galeri sintetis atau server uji.
+Latensi /register adalah waktu memasukkan job ke antrean, bukan waktu sampai wajah terdaftar.
+"""
+import io
+import os
+import sys
+import json
+import glob
+import time
+import shutil
+import random
+import argparse
+import platform
+import threading
+import importlib
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import cv2
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SAMPLE_DIRS = [os.path.join(HERE, "gcs_database"), os.path.join(HERE, "..", "Deepface model", "database")]
+ENDPOINTS = {
+    "recognize": "/recognize",
+    "register": "/register",
+    "compare_models": "/compare_models",
+}
+GALLERY_META = "bench_gallery.json"
+
+
+# ----------------------------------------------------------------------------
+# Galeri sintetis
+# ----------------------------------------------------------------------------
+def sample_images(sample_dirs=SAMPLE_DIRS):
+    paths = []
+    for sample_dir in sample_dirs:
+        for extension in ("jpg", "jpeg", "png"):
+            paths += glob.glob(os.path.join(sample_dir, "**", f"*.{extension}"), recursive=True)
+    images = []
+    for path in sorted(set(paths)):
+        image = cv2.imread(path)
+        if image is not None:
+            images.append(image)
+    if not images:
+        raise RuntimeError("Tidak ada gambar contoh di " + ", ".join(sample_dirs))
+    return images
+
+
+def augment(image, rng, max_side=480, jpeg_quality=None):
+    """Satu augmentasi deterministik (untuk rng yang sama) dari gambar wajah, sebagai bytes JPEG."""
+    height, width = image.shape[:2]
+    scale = min(1.0, max_side / max(height, width)) * rng.uniform(0.9, 1.1)
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), rng.uniform(-10, 10), scale)
+    matrix[:, 2] += (rng.uniform(-0.05, 0.05) * width * scale, rng.uniform(-0.05, 0.05) * height * scale)
+    size = (int(width * scale), int(height * scale))
+    out = cv2.warpAffine(image, matrix, size, borderMode=cv2.BORDER_REFLECT)
+    out = cv2.convertScaleAbs(out, alpha=rng.uniform(0.8, 1.2), beta=rng.uniform(-25, 25))
+    if rng.random() < 0.5:
+        out = cv2.flip(out, 1)
+    quality = jpeg_quality or int(rng.integers(80, 96))
+    ok, encoded = cv2.imencode(".jpg", out, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+    if not ok:
+        raise RuntimeError("Gagal meng-encode gambar sintetis")
+    return encoded.tobytes()
+
+
+def build_gallery(path, identities, images_per_identity, seed, workers=8):
+    """
+    Membuat (atau memakai ulang) galeri sintetis. Galeri dipakai ulang jika parameternya sama.
+
+    Returns:
+        dict: Ringkasan galeri (jumlah identitas, gambar, byte, waktu pembuatan).
+    """
+    meta_path = os.path.join(path, GALLERY_META)
+    params = {"identities": identities, "images_per_identity": images_per_identity, "seed": seed}
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get("params") == params:
+            meta["reused"] = True
+            return meta
+        shutil.rmtree(path)
+
+    started = time.perf_counter()
+    bases = sample_images()
+    os.makedirs(path, exist_ok=True)
+
+    def write_identity(index):
+        rng = np.random.default_rng([seed, index])
+        base = bases[index % len(bases)]
+        identity_dir = os.path.join(path, f"id{index:06d}")
+        os.makedirs(identity_dir, exist_ok=True)
+        written = 0
+        for image_index in range(images_per_identity):
+            data = augment(base, rng)
+            with open(os.path.join(identity_dir, f"{image_index}.jpg"), "wb") as f:
+                f.write(data)
+            written += len(data)
+        return written
+
+    # cv2 melepas GIL saat encode, jadi thread cukup untuk mempercepat pembuatan galeri
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        total_bytes = sum(executor.map(write_identity, range(identities)))
+
+    meta = {
+        "params": params,
+        "base_images": len(bases),
+        "images": identities * images_per_identity,
+        "bytes": total_bytes,
+        "build_seconds": round(time.perf_counter() - started, 2),
+    }
+    with open(meta_path, "w") as f:
+        json.dump(meta, f)
+    meta["reused"] = False
+    return meta
+
+
+def make_queries(count, identities, seed):
+    """Gambar query: augmentasi baru (bukan file galeri) dari gambar dasar identitas acak."""
+    bases = sample_images()
+    rng = np.random.default_rng([seed, 1_000_003])
+    queries = []
+    for _ in range(count):
+        identity = int(rng.integers(0, max(1, identities)))
+        queries.append(augment(bases[identity % len(bases)], rng))
+    return queries
+
+
+# ----------------------------------------------------------------------------
+# Memori
+# ----------------------------------------------------------------------------
+def peak_rss_bytes(pid=None):
+    """Puncak RSS (VmHWM) satu proses, atau None jika /proc tidak tersedia."""
+    try:
+        with open(f"/proc/{pid or 'self'}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if pid is None:
+        import resource
+        # ru_maxrss dalam KB di Linux, byte di macOS
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    return None
+
+
+def process_tree(pid):
+    """pid beserta semua turunannya (misalnya worker Gunicorn), dari /proc."""
+    children = {}
+    for stat_path in glob.glob("/proc/[0-9]*/stat"):
+        try:
+            with open(stat_path) as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            children.setdefault(int(fields[1]), []).append(int(stat_path.split("/")[2]))
+        except (OSError, IndexError, ValueError):
+            continue
+    tree, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        tree.append(current)
+        stack.extend(children.get(current, []))
+    return tree
+
+
+def tree_peak_rss(pid):
+    """Puncak RSS per proses dalam pohon proses, serta jumlahnya."""
+    peaks = {p: peak_rss_bytes(p) for p in process_tree(pid)}
+    peaks = {p: value for p, value in peaks.items() if value is not None}
+    return {"total": sum(peaks.values()) if peaks else None, "max_process": max(peaks.values()) if peaks else None}
+
+
+# ----------------------------------------------------------------------------
+# Target: in-process atau HTTP
+# ----------------------------------------------------------------------------
+class InProcessTarget:
+    """Mengimpor app.py dengan galeri sintetis sebagai bucket, lalu memakai Flask test client."""
+
+    def __init__(self, app_dir, gallery_path, work_dir, models_timeout):
+        self.work_dir = work_dir
+        os.makedirs(work_dir, exist_ok=True)
+        os.environ["GCS_LOCAL_BUCKET_PATH"] = gallery_path
+        os.environ.setdefault("GCS_SYNC_INTERVAL", "3600")
+        os.environ.setdefault("EMBEDDING_CACHE_PATH", os.path.join(work_dir, "embedding_cache.sqlite3"))
+        os.environ.setdefault("ANN_INDEX_PATH", os.path.join(work_dir, "ann_index"))
+        # LOCAL_DB_PATH relatif terhadap direktori kerja; jangan sentuh gcs_database milik repo
+        os.chdir(work_dir)
+        for path in (HERE, os.path.abspath(app_dir)):
+            if path not in sys.path:
+                sys.path.insert(0, path)
+
+        self.setup = {}
+        started = time.perf_counter()
+        self.module = importlib.import_module("app")
+        self.setup["import_seconds"] = round(time.perf_counter() - started, 2)
+
+        started = time.perf_counter()
+        self.module.sync_worker.sync_once()
+        self.setup["sync_seconds"] = round(time.perf_counter() - started, 2)
+
+        started = time.perf_counter()
+        deadline = time.time() + models_timeout
+        while not self.module.model_registry.is_ready():
+            if time.time() > deadline:
+                raise RuntimeError("Model belum siap sebelum timeout")
+            time.sleep(0.5)
+        self.setup["warm_up_seconds"] = round(time.perf_counter() - started, 2)
+
+        started = time.perf_counter()
+        if not self.module.face_index.loaded:
+            self.module.face_index.load()
+        self.setup["index_load_seconds"] = round(time.perf_counter() - started, 2)
+        self._local = threading.local()
+
+    def has_endpoint(self, path):
+        return any(rule.rule == path for rule in self.module.app.url_map.iter_rules())
+
+    def post(self, path, image, form=None):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.module.app.test_client()
+        data = dict(form or {})
+        data["image"] = (io.BytesIO(image), "bench.jpg")
+        response = client.post(path, data=data, content_type="multipart/form-data")
+        return response.status_code, response.get_json(silent=True)
+
+    def memory(self):
+        return {"peak_rss_bytes": peak_rss_bytes()}
+
+    def close(self):
+        pass
+
+
+class HttpTarget:
+    """Server HTTP yang sudah berjalan, atau Gunicorn yang dijalankan terhadap galeri sintetis."""
+
+    def __init__(self, url, spawn, app_dir, gallery_path, work_dir, workers, threads, port, ready_timeout):
+        from load_test import wait_until_ready
+        import requests
+        self.requests = requests
+        self.server = None
+        self.setup = {}
+        if spawn:
+            os.makedirs(work_dir, exist_ok=True)
+            env = dict(
+                os.environ,
+                GCS_LOCAL_BUCKET_PATH=gallery_path,
+                EMBEDDING_CACHE_PATH=os.path.join(work_dir, "embedding_cache.sqlite3"),
+                ANN_INDEX_PATH=os.path.join(work_dir, "ann_index"),
+                WEB_WORKERS=str(workers), WEB_THREADS=str(threads), WEB_BIND=f"127.0.0.1:{port}",
+            )
+            self.server = subprocess.Popen(
+                [sys.executable, "-m", "gunicorn", "-c", os.path.join(HERE, "gunicorn.conf.py"),
+                 "--pythonpath", f"{os.path.abspath(app_dir)},{HERE}", "app:app"],
+                cwd=work_dir, env=env
+            )
+            url = f"http://127.0.0.1:{port}"
+        self.url = url.rstrip("/")
+        started = time.perf_counter()
+        if not wait_until_ready(self.url, ready_timeout):
+            self.close()
+            raise RuntimeError(f"{self.url}/ready tidak mengembalikan 200")
+        self.setup["ready_seconds"] = round(time.perf_counter() - started, 2)
+        self._local = threading.local()
+
+    def has_endpoint(self, path):
+        # Endpoint yang tidak ada mengembalikan 404 (POST tanpa body cukup untuk memeriksanya)
+        try:
+            return self.requests.post(self.url + path, timeout=10).status_code != 404
+        except self.requests.exceptions.RequestException:
+            # Biarkan pengukuran mencatat error-nya
+            return True
+
+    def post(self, path, image, form=None):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = self.requests.Session()
+        try:
+            response = session.post(self.url + path, data=form, files={"image": ("bench.jpg", image, "image/jpeg")},
+                                    timeout=120)
+        except self.requests.exceptions.RequestException:
+            return None, None
+        try:
+            return response.status_code, response.json()
+        except ValueError:
+            return response.status_code, None
+
+    def memory(self):
+        if self.server is None:
+            return {"peak_rss_bytes": None}
+        rss = tree_peak_rss(self.server.pid)
+        return {"peak_rss_bytes": rss["total"], "peak_rss_max_process_bytes": rss["max_process"]}
+
+    def close(self):
+        if self.server is not None:
+            self.server.terminate()
+            try:
+                self.server.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.server.kill()
+            self.server = None
+
+
+# ----------------------------------------------------------------------------
+# Beban
+# ----------------------------------------------------------------------------
+def summarize(latencies, errors, elapsed):
+    latencies_ms = np.asarray(latencies) * 1000 if latencies else np.zeros(1)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "requests_per_second": round(len(latencies) / elapsed, 2) if elapsed > 0 else None,
+        "mean_ms": round(float(latencies_ms.mean()), 1),
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 1),
+        "p95_ms": round(float(np.percentile(latencies_ms, 95)), 1),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 1),
+    }
+
+
+def run_level(target, endpoint, queries, concurrency, n_requests, run_id):
+    """Mengirim n_requests request dari `concurrency` thread; request ke-i memakai query ke-(i mod N)."""
+    path = ENDPOINTS[endpoint]
+    latencies = [None] * n_requests
+    failed = [False] * n_requests
+    statuses = {}
+    lock = threading.Lock()
+
+    def one(i):
+        form = {"name": f"bench_{run_id}_{concurrency}_{i}"} if endpoint == "register" else None
+        started = time.perf_counter()
+        status, body = target.post(path, queries[i % len(queries)], form)
+        latencies[i] = time.perf_counter() - started
+        # Respons 200 dengan status "error" juga dihitung gagal (format respons aplikasi ini);
+        # /register menjawab 202 setelah job masuk antrean
+        ok = status in (200, 202) and not (isinstance(body, dict) and body.get("status") == "error")
+        failed[i] = not ok
+        with lock:
+            key = str(status)
+            statuses[key] = statuses.get(key, 0) + 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(n_requests)))
+    elapsed = time.perf_counter() - started
+
+    result = summarize(latencies, sum(failed), elapsed)
+    result.update({"endpoint": endpoint, "concurrency": concurrency, "status_codes": statuses})
+    result.update(target.memory())
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=HERE, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark jalur pengenalan dan pendaftaran wajah.")
+    parser.add_argument("--identities", type=int, default=100, help="Jumlah identitas galeri sintetis (10 - 100000).")
+    parser.add_argument("--images-per-identity", type=int, default=1)
+    parser.add_argument("--gallery", default=None, help="Direktori galeri sintetis (default: di --work-dir).")
+    parser.add_argument("--work-dir", default=os.path.join(HERE, "bench_work"),
+                        help="Direktori kerja (database lokal, cache embedding, index).")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mode", choices=("inprocess", "http"), default="inprocess")
+    parser.add_argument("--app-dir", default=HERE, help="Folder app.py yang diuji (Pepper atau final test app).")
+    parser.add_argument("--endpoints", nargs="+", choices=sorted(ENDPOINTS), default=["recognize"])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=200, help="Request per endpoint per tingkat konkurensi.")
+    parser.add_argument("--warmup", type=int, default=10, help="Request pemanasan per endpoint (tidak diukur).")
+    parser.add_argument("--queries", type=int, default=50, help="Jumlah gambar query berbeda.")
+    parser.add_argument("--url", default=os.environ.get("BASE_URL", "http://localhost:8000"), help="Server HTTP (mode http).")
+    parser.add_argument("--spawn", action="store_true", help="Mode http: jalankan Gunicorn sendiri terhadap galeri sintetis.")
+    parser.add_argument("--workers", type=int, default=1, help="Worker Gunicorn untuk --spawn.")
+    parser.add_argument("--threads", type=int, default=4, help="Thread per worker untuk --spawn.")
+    parser.add_argument("--port", type=int, default=8200)
+    parser.add_argument("--ready-timeout", type=float, default=1800)
+    parser.add_argument("--output", help="File JSON hasil.")
+    args = parser.parse_args()
+
+    work_dir = os.path.abspath(args.work_dir)
+    gallery_path = os.path.abspath(args.gallery or os.path.join(work_dir, f"gallery_{args.identities}_{args.seed}"))
+    uses_gallery = args.mode == "inprocess" or args.spawn
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": vars(args),
+        },
+    }
+    if uses_gallery:
+        print(f"Menyiapkan galeri sintetis {args.identities} identitas di {gallery_path}...", file=sys.stderr)
+        report["gallery"] = build_gallery(gallery_path, args.identities, args.images_per_identity, args.seed)
+    queries = make_queries(args.queries, args.identities, args.seed)
+
+    if args.mode == "inprocess":
+        target = InProcessTarget(args.app_dir, gallery_path, work_dir, args.ready_timeout)
+    else:
+        target = HttpTarget(args.url, args.spawn, args.app_dir, gallery_path, work_dir, args.workers,
+                            args.threads, args.port, args.ready_timeout)
+    report["setup"] = target.setup
+    report["results"] = []
+    run_id = random.Random().randrange(16 ** 6)
+    try:
+        for endpoint in args.endpoints:
+            if not target.has_endpoint(ENDPOINTS[endpoint]):
+                report["results"].append({"endpoint": endpoint, "skipped": "endpoint tidak ada di aplikasi ini"})
+                continue
+            for i in range(args.warmup):
+                target.post(ENDPOINTS[endpoint], queries[i % len(queries)],
+                            {"name": f"bench_{run_id}_warmup_{i}"} if endpoint == "register" else None)
+            for concurrency in args.concurrency:
+                print(f"{endpoint} dengan konkurensi {concurrency}...", file=sys.stderr)
+                report["results"].append(run_level(target, endpoint, queries, concurrency, args.requests, run_id))
+        report["memory"] = target.memory()
+    finally:
+        target.close()
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
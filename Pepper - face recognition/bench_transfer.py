@@ -0,0 +1,96 @@
+# bench_transfer.py
+"""
+Benchmark unduhan paralel TransferEngine terhadap bucket palsu di direktori lokal.
+
+Bucket sumber berisi file acak (mirip foto wajah). Karena disk lokal jauh lebih cepat
+daripada GCS, --latency-ms menambahkan jeda per objek untuk meniru round-trip jaringan;
+tanpa jeda, angka yang terlihat adalah batas atas dari sisi disk dan Python.
+
+Contoh:
+    python bench_transfer.py --files 2000 --size-kb 80 --latency-ms 40 --workers 1 4 16 32
+"""
+import os
+import time
+import json
+import shutil
+import argparse
+import tempfile
+import numpy as np
+from local_bucket import LocalBucket
+from gcs_transfer import TransferEngine
+
+
+class SlowBlob:
+    """Membungkus LocalBlob dan menambahkan jeda tetap per unduhan."""
+
+    def __init__(self, blob, latency):
+        self._blob = blob
+        self._latency = latency
+        self.name = blob.name
+
+    def download_to_filename(self, filename):
+        time.sleep(self._latency)
+        self._blob.download_to_filename(filename)
+
+
+def make_bucket(root, n_files, size_kb, seed=0):
+    rng = np.random.default_rng(seed)
+    bucket = LocalBucket(root, "bench-bucket")
+    for i in range(n_files):
+        data = rng.integers(0, 256, size_kb * 1024, dtype=np.uint8).tobytes()
+        bucket.blob(f"person_{i % 200:03d}/face_{i:05d}.jpg").upload_from_string(data)
+    return bucket
+
+
+def run(bucket, workers, latency, destination_root):
+    blobs = [SlowBlob(blob, latency) for blob in bucket.list_blobs()]
+    engine = TransferEngine(max_workers=workers, retries=0)
+
+    def destination_for(blob):
+        return os.path.join(destination_root, blob.name.replace('/', os.sep))
+
+    start = time.perf_counter()
+    results = engine.download_many(blobs, destination_for)
+    elapsed = time.perf_counter() - start
+    engine.shutdown()
+
+    failed = sum(1 for _, _, error in results if error is not None)
+    total_bytes = sum(os.path.getsize(path) for _, path, error in results if error is None)
+    return {
+        "workers": workers,
+        "files": len(results),
+        "failed": failed,
+        "seconds": round(elapsed, 3),
+        "files_per_second": round(len(results) / elapsed, 1),
+        "mb_per_second": round(total_bytes / elapsed / (1024 * 1024), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark unduhan paralel ke bucket lokal.")
+    parser.add_argument("--files", type=int, default=1000, help="Jumlah objek di bucket.")
+    parser.add_argument("--size-kb", type=int, default=80, help="Ukuran setiap objek (KB).")
+    parser.add_argument("--latency-ms", type=float, default=30, help="Jeda per objek untuk meniru jaringan.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16, 32])
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_transfer_")
+    try:
+        bucket = make_bucket(os.path.join(workdir, "bucket"), args.files, args.size_kb)
+        report = {
+            "files": args.files,
+            "size_kb": args.size_kb,
+            "latency_ms": args.latency_ms,
+            "runs": [],
+        }
+        for workers in args.workers:
+            destination_root = os.path.join(workdir, f"local_{workers}")
+            report["runs"].append(run(bucket, workers, args.latency_ms / 1000.0, destination_root))
+            shutil.rmtree(destination_root, ignore_errors=True)
+        print(json.dumps(report, indent=2))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
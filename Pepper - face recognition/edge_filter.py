@@ -0,0 +1,224 @@
+"""
+Pre-filter di sisi robot sebelum foto dikirim ke /recognize.
+
+Urutan per frame:
+  1. Deteksi wajah lokal yang murah (Haar cascade OpenCV) pada gambar grayscale kecil.
+  2. Wajah terbesar dipotong dengan margin lalu diperkecil (sisi terpanjang <= max_side).
+  3. Frame dibuang jika wajah terlalu kecil, terpotong di tepi gambar, atau buram
+     (variansi Laplacian di bawah blur_threshold).
+  4. Frame dibuang jika potongan wajahnya hampir sama (dHash 64-bit, jarak Hamming
+     <= hash_distance) dengan potongan yang sudah dijawab server dalam dedupe_seconds
+     terakhir. Hasil DUPLICATE membawa jawaban untuk wajah itu, jadi client bisa
+     mengulanginya tanpa request.
+
+Hanya potongan JPEG kecil yang lolos semua pemeriksaan yang dikirim ke server. Hash wajah
+baru diingat lewat commit(result, answer) setelah server benar-benar menjawab, sehingga
+request yang gagal bisa langsung dicoba lagi dan jawaban orang lain tidak pernah terulang.
+Modul ini tidak butuh qi, sehingga bisa diuji di PC dengan gambar biasa:
+
+    python edge_filter.py foto1.jpg foto2.jpg
+"""
+import os
+import sys
+import time
+from collections import deque, namedtuple
+
+import cv2
+
+# face_hash diisi untuk frame yang diterima (untuk commit()); answer diisi untuk DUPLICATE
+FilterResult = namedtuple("FilterResult", ["accepted", "reason", "jpeg", "box", "sharpness", "face_hash", "answer"])
+
+# Alasan penolakan, dipakai client untuk memilih kalimat yang diucapkan robot
+NO_FACE = "no_face"
+TOO_SMALL = "too_small"
+AT_EDGE = "at_edge"
+BLURRY = "blurry"
+DUPLICATE = "duplicate"
+ACCEPTED = "accepted"
+
+SHARPNESS_SIZE = 128
+
+
+def _default_cascade_path():
+    # cv2.data hanya ada di OpenCV >= 3.3; di robot lama path bisa diberikan lewat env
+    env_path = os.environ.get("EDGE_CASCADE_PATH")
+    if env_path:
+        return env_path
+    data = getattr(cv2, "data", None)
+    if data is not None:
+        return os.path.join(data.haarcascades, "haarcascade_frontalface_default.xml")
+    return "haarcascade_frontalface_default.xml"
+
+
+def dhash(gray, hash_size=8):
+    """Difference hash 64-bit dari gambar grayscale, sebagai int Python."""
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def sharpness(gray):
+    """Variansi Laplacian: makin kecil makin buram."""
+    return float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
+
+class EdgeFilter(object):
+    """
+    Args:
+        detect_width (int): Lebar gambar untuk deteksi (gambar diperkecil dulu agar murah).
+        min_face (float): Tinggi wajah minimum sebagai fraksi tinggi gambar.
+        margin (float): Margin potongan sebagai fraksi ukuran wajah, agar detector server
+            masih bisa menemukan dan menyelaraskan wajah.
+        max_side (int): Sisi terpanjang potongan yang dikirim.
+        blur_threshold (float): Variansi Laplacian minimum pada potongan.
+        hash_distance (int): Jarak Hamming maksimum untuk dianggap wajah yang sama.
+        dedupe_seconds (float): Berapa lama wajah yang sudah dijawab diingat untuk dedupe.
+        jpeg_quality (int): Kualitas JPEG potongan.
+    """
+
+    def __init__(self, detect_width=320, min_face=0.12, margin=0.4, max_side=224, blur_threshold=60.0,
+                 hash_distance=6, dedupe_seconds=10.0, jpeg_quality=90, cascade_path=None):
+        self.detect_width = detect_width
+        self.min_face = min_face
+        self.margin = margin
+        self.max_side = max_side
+        self.blur_threshold = blur_threshold
+        self.hash_distance = hash_distance
+        self.dedupe_seconds = dedupe_seconds
+        self.jpeg_quality = jpeg_quality
+        self.cascade = cv2.CascadeClassifier(cascade_path or _default_cascade_path())
+        if self.cascade.empty():
+            raise IOError("Haar cascade tidak bisa dimuat: %s" % (cascade_path or _default_cascade_path()))
+        self._recent = deque()
+        self.counts = dict((reason, 0) for reason in (NO_FACE, TOO_SMALL, AT_EDGE, BLURRY, DUPLICATE, ACCEPTED))
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def _detect(self, gray):
+        """Mengembalikan kotak wajah terbesar (x, y, w, h) dalam koordinat gambar asli, atau None."""
+        height, width = gray.shape[:2]
+        ratio = min(1.0, float(self.detect_width) / width)
+        small = cv2.resize(gray, (int(width * ratio), int(height * ratio))) if ratio < 1.0 else gray
+        min_size = max(20, int(small.shape[0] * self.min_face * 0.8))
+        faces = self.cascade.detectMultiScale(small, scaleFactor=1.2, minNeighbors=5, minSize=(min_size, min_size))
+        if len(faces) == 0:
+            return None
+        x, y, w, h = max(faces, key=lambda f: f[2] * f[3])
+        return tuple(int(round(v / ratio)) for v in (x, y, w, h))
+
+    def _crop(self, image, box):
+        x, y, w, h = box
+        pad_x, pad_y = int(w * self.margin), int(h * self.margin)
+        height, width = image.shape[:2]
+        left, top = max(0, x - pad_x), max(0, y - pad_y)
+        right, bottom = min(width, x + w + pad_x), min(height, y + h + pad_y)
+        crop = image[top:bottom, left:right]
+        longest = max(crop.shape[:2])
+        if longest > self.max_side:
+            ratio = float(self.max_side) / longest
+            crop = cv2.resize(crop, (int(crop.shape[1] * ratio), int(crop.shape[0] * ratio)),
+                              interpolation=cv2.INTER_AREA)
+        return crop
+
+    def _find_recent(self, face_hash, now):
+        """Entri (waktu, hash, jawaban) terdekat dalam hash_distance, atau None."""
+        while self._recent and now - self._recent[0][0] > self.dedupe_seconds:
+            self._recent.popleft()
+        best = None
+        for entry in self._recent:
+            distance = hamming(face_hash, entry[1])
+            if distance <= self.hash_distance and (best is None or distance < best[0]):
+                best = (distance, entry)
+        return best[1] if best is not None else None
+
+    def commit(self, result, answer, now=None):
+        """
+        Mengingat wajah dari frame yang diterima bersama jawaban server untuknya. Panggil hanya
+        setelah jawaban yang valid; frame yang request-nya gagal tidak dianggap duplikat.
+        """
+        if result.face_hash is None:
+            return
+        self._recent.append((time.time() if now is None else now, result.face_hash, answer))
+
+    def _reject(self, reason, box=None, score=None, answer=None):
+        self.counts[reason] += 1
+        return FilterResult(False, reason, None, box, score, None, answer)
+
+    def process(self, image, now=None, original_bytes=0):
+        """
+        Memeriksa satu frame BGR.
+
+        Args:
+            image (np.ndarray): Frame BGR dari kamera.
+            original_bytes (int): Ukuran file asli, hanya untuk statistik penghematan.
+
+        Returns:
+            FilterResult: accepted=True dan jpeg berisi potongan wajah jika layak dikirim.
+        """
+        now = time.time() if now is None else now
+        self.bytes_in += original_bytes or image.nbytes
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+        box = self._detect(gray)
+        if box is None:
+            return self._reject(NO_FACE)
+        x, y, w, h = box
+        height, width = gray.shape[:2]
+        if h < self.min_face * height:
+            return self._reject(TOO_SMALL, box)
+        # Wajah yang menyentuh tepi gambar biasanya terpotong atau menoleh keluar frame
+        if x <= 1 or y <= 1 or x + w >= width - 1 or y + h >= height - 1:
+            return self._reject(AT_EDGE, box)
+
+        # Ukuran tetap, agar skor ketajaman tidak bergantung pada resolusi wajah
+        face_gray = cv2.resize(gray[y:y + h, x:x + w], (SHARPNESS_SIZE, SHARPNESS_SIZE), interpolation=cv2.INTER_AREA)
+        score = sharpness(face_gray)
+        if score < self.blur_threshold:
+            return self._reject(BLURRY, box, score)
+
+        face_hash = dhash(face_gray)
+        recent = self._find_recent(face_hash, now)
+        if recent is not None:
+            return self._reject(DUPLICATE, box, score, answer=recent[2])
+
+        ok, encoded = cv2.imencode(".jpg", self._crop(image, box), [int(cv2.IMWRITE_JPEG_QUALITY), self.jpeg_quality])
+        if not ok:
+            return self._reject(NO_FACE, box, score)
+        jpeg = encoded.tobytes()
+        self.counts[ACCEPTED] += 1
+        self.bytes_out += len(jpeg)
+        return FilterResult(True, ACCEPTED, jpeg, box, score, face_hash, None)
+
+    def process_file(self, path, now=None):
+        """Versi process() untuk file foto dari ALPhotoCapture."""
+        image = cv2.imread(path)
+        if image is None:
+            raise IOError("Gambar tidak bisa dibaca: %s" % path)
+        return self.process(image, now=now, original_bytes=os.path.getsize(path))
+
+    def stats(self):
+        stats = dict(self.counts)
+        stats["bytes_in"] = self.bytes_in
+        stats["bytes_out"] = self.bytes_out
+        stats["reduction"] = round(float(self.bytes_in) / self.bytes_out, 1) if self.bytes_out else None
+        return stats
+
+
+if __name__ == "__main__":
+    edge_filter = EdgeFilter()
+    for path in sys.argv[1:]:
+        result = edge_filter.process_file(path)
+        print("%s: %s (box=%s, sharpness=%s, %s bytes%s)" % (
+            path, result.reason, result.box, result.sharpness, len(result.jpeg) if result.jpeg else 0,
+            ", sama dengan %s" % result.answer if result.reason == DUPLICATE else ""))
+        # Tanpa server: nama file dipakai sebagai "jawaban" agar dedupe tetap bisa dicoba
+        if result.accepted:
+            edge_filter.commit(result, path)
+    print("Statistik:", edge_filter.stats())
@@ -0,0 +1,143 @@
+# embedding_cache.py
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+
+# Lokasi cache embedding; sengaja di luar LOCAL_DB_PATH agar tidak ikut disinkronkan
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite3")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    image_sha256 TEXT NOT NULL,
+    model TEXT NOT NULL,
+    detector TEXT NOT NULL,
+    align INTEGER NOT NULL,
+    normalization TEXT NOT NULL,
+    expand INTEGER NOT NULL,
+    dim INTEGER NOT NULL,
+    vectors BLOB NOT NULL,
+    facial_areas TEXT NOT NULL,
+    PRIMARY KEY (image_sha256, model, detector, align, normalization, expand)
+);
+CREATE TABLE IF NOT EXISTS file_hashes (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    image_sha256 TEXT NOT NULL
+);
+"""
+
+
+def sha256_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def sha256_file(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Cache embedding persisten yang dialamatkan berdasarkan isi gambar.
+
+    Kunci: (sha256 isi gambar, model, detektor, align, normalisasi, expand).
+    Karena kunci tidak memuat path, rename, sinkronisasi ulang, dan unggahan duplikat
+    tidak pernah memicu embedding ulang, dan beberapa model bisa berbagi satu file cache.
+    Nilai: semua wajah yang terdeteksi pada gambar (bisa kosong) sebagai matriks float32.
+    """
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        # WAL mengizinkan beberapa proses worker membaca sambil satu proses menulis
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def file_hash(self, path):
+        """
+        sha256 isi file. Hasilnya diingat per (path, ukuran, mtime) sehingga file
+        yang tidak berubah tidak perlu dibaca ulang.
+        """
+        stat = os.stat(path)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime_ns, image_sha256 FROM file_hashes WHERE path = ?", (path,)
+            ).fetchone()
+        if row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+            return row[2]
+
+        image_hash = sha256_file(path)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO file_hashes (path, size, mtime_ns, image_sha256) VALUES (?, ?, ?, ?)",
+                (path, stat.st_size, stat.st_mtime_ns, image_hash)
+            )
+            self._conn.commit()
+        return image_hash
+
+    def get(self, image_hash, model_name, detector_backend, align, normalization, expand_percentage=0):
+        """
+        Returns:
+            list: List (embedding float32, facial_area dict) jika ada di cache, None jika belum.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT dim, vectors, facial_areas FROM embeddings WHERE image_sha256 = ? AND model = ? "
+                "AND detector = ? AND align = ? AND normalization = ? AND expand = ?",
+                (image_hash, model_name, detector_backend, int(align), normalization, expand_percentage)
+            ).fetchone()
+        if row is None:
+            return None
+        dim, vectors, facial_areas = row
+        facial_areas = json.loads(facial_areas)
+        if not facial_areas:
+            return []
+        matrix = np.frombuffer(vectors, dtype=np.float32).reshape(len(facial_areas), dim)
+        return list(zip(matrix, facial_areas))
+
+    def put(self, image_hash, model_name, detector_backend, align, normalization, expand_percentage, results):
+        """
+        Menyimpan hasil embedding satu gambar.
+
+        Args:
+            results (list): List (embedding, facial_area) untuk setiap wajah pada gambar.
+        """
+        if results:
+            matrix = np.asarray([embedding for embedding, _ in results], dtype=np.float32)
+            dim = matrix.shape[1]
+        else:
+            matrix = np.zeros((0, 0), dtype=np.float32)
+            dim = 0
+        facial_areas = [
+            {key: int(area[key]) for key in ("x", "y", "w", "h")} for _, area in results
+        ]
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO embeddings (image_sha256, model, detector, align, normalization, "
+                "expand, dim, vectors, facial_areas) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (image_hash, model_name, detector_backend, int(align), normalization, expand_percentage,
+                 dim, matrix.tobytes(), json.dumps(facial_areas))
+            )
+            self._conn.commit()
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def default_cache():
+    """Satu instance cache bersama per proses, dipakai oleh semua index model."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = EmbeddingCache(EMBEDDING_CACHE_PATH)
+        return _default_cache
@@ -0,0 +1,307 @@
+# embedding_index.py
+import os
+import threading
+import numpy as np
+from deepface import DeepFace
+from embedding_cache import default_cache
+from ann_index import ANN_INDEX_PATH, INDEX_BACKEND, IVFIndex, build_index, update_index, ExactIndex
+
+# Ekstensi gambar yang dianggap sebagai bagian dari database wajah
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+def identity_to_name(identity_path, db_path):
+    """
+    Mengekstrak nama orang dari path identitas.
+    - Struktur bersarang (gcs_database/NAMA/file.jpg) -> NAMA
+    - Struktur datar (gcs_database/NAMA.jpg) -> NAMA
+    """
+    person_name = os.path.basename(os.path.dirname(identity_path))
+    if person_name == os.path.basename(os.path.normpath(db_path)):
+        person_name = os.path.splitext(os.path.basename(identity_path))[0]
+    return person_name
+
+
+def l2_normalize(vectors):
+    """Normalisasi L2 per baris sehingga cosine similarity cukup dihitung dengan dot product."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class EmbeddingIndex:
+    """
+    Penyimpanan embedding wajah yang resident di memori.
+
+    Semua embedding database disimpan sebagai satu matriks float32 kontigu
+    (sudah dinormalisasi L2) beserta array identitas sejajar, sehingga pencarian
+    cukup satu perkalian matriks-vektor tanpa membaca ulang .pkl atau membangun DataFrame.
+    Perubahan database diterapkan per baris lewat update()/apply_changes(), dan
+    embedding diambil dari EmbeddingCache berdasarkan isi gambar sehingga hanya
+    gambar yang benar-benar baru yang melewati model.
+
+    Pencarian didelegasikan ke backend di ann_index (brute-force, IVF, atau template per
+    orang). Index IVF disimpan ke disk setelah dibangun penuh dan di-memory-map pada startup
+    berikutnya jika isi database tidak berubah. Backend template mengelompokkan baris per
+    orang (identity_to_name), sehingga tahap pertama pencarian sebanding dengan jumlah orang.
+    """
+
+    def __init__(self, db_path, model_name, detector_backend="opencv", align=True,
+                 normalization="base", expand_percentage=0, cache=None,
+                 backend=INDEX_BACKEND, index_path=None):
+        self.db_path = db_path
+        self.model_name = model_name
+        self.detector_backend = detector_backend
+        self.align = align
+        self.normalization = normalization
+        self.expand_percentage = expand_percentage
+        self.cache = cache
+        self.backend = backend
+        self.index_path = index_path or os.path.join(
+            ANN_INDEX_PATH, f"{model_name}_{detector_backend}".replace("-", "").lower()
+        )
+        self.loaded = False
+        self._rows = []
+        self._lock = threading.Lock()
+        # Snapshot (matriks, identitas, index pencarian) diganti secara atomik;
+        # pembaca cukup mengambil referensinya
+        empty = np.zeros((0, 0), dtype=np.float32)
+        self._snapshot = (empty, np.array([], dtype=object), ExactIndex(empty))
+
+    def __len__(self):
+        return len(self._snapshot[1])
+
+    def vectors(self):
+        """Matriks embedding (sudah dinormalisasi L2) dan array identitas sejajar saat ini."""
+        matrix, identities, _ = self._snapshot
+        return matrix, identities
+
+    @property
+    def settings(self):
+        """Pengaturan yang menjadi bagian dari kunci cache embedding."""
+        return (self.model_name, self.detector_backend, self.align,
+                self.normalization, self.expand_percentage)
+
+    def _get_cache(self):
+        if self.cache is None:
+            self.cache = default_cache()
+        return self.cache
+
+    def _person_labels(self, rows):
+        """Nomor orang per baris untuk backend template (None untuk backend lain)."""
+        if self.backend != "template" or not rows:
+            return None
+        names = [identity_to_name(row["identity"], self.db_path) for row in rows]
+        return np.unique(names, return_inverse=True)[1]
+
+    def _list_images(self):
+        images = []
+        for root, _, files in os.walk(self.db_path):
+            for name in files:
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    images.append(os.path.join(root, name))
+        return images
+
+    def _embed_image(self, image_path):
+        """
+        Menghasilkan satu baris untuk setiap wajah di gambar.
+
+        Returns:
+            tuple: (list baris, True jika model benar-benar dijalankan)
+        """
+        cache = self._get_cache()
+        image_hash = cache.file_hash(image_path)
+        results = cache.get(image_hash, *self.settings)
+        computed = results is None
+        if computed:
+            representations = DeepFace.represent(
+                img_path=image_path,
+                model_name=self.model_name,
+                detector_backend=self.detector_backend,
+                align=self.align,
+                normalization=self.normalization,
+                expand_percentage=self.expand_percentage,
+                enforce_detection=False
+            )
+            results = [
+                (np.asarray(rep["embedding"], dtype=np.float32), rep["facial_area"])
+                for rep in representations
+            ]
+            cache.put(image_hash, *self.settings, results)
+
+        rows = [{"identity": image_path, "hash": image_hash, "embedding": embedding} for embedding, _ in results]
+        return rows, computed
+
+    def _embed_images(self, image_paths):
+        rows = []
+        computed = 0
+        for image_path in image_paths:
+            try:
+                image_rows, was_computed = self._embed_image(image_path)
+                rows.extend(image_rows)
+                computed += int(was_computed)
+            except Exception as e:
+                print(f"Peringatan: Gagal membuat embedding untuk {image_path}. Detail: {e}")
+        if computed:
+            print(f"Embedding baru dihitung untuk {computed} dari {len(image_paths)} gambar ({self.model_name}).")
+        return rows
+
+    def _swap(self, rows, matrix, ann):
+        """Mengganti snapshot (matriks, identitas, index pencarian) secara atomik."""
+        # Vektor sudah ada di matriks; baris cukup menyimpan identitas dan hash
+        self._rows = [{"identity": row["identity"], "hash": row["hash"]} for row in rows]
+        self._snapshot = (matrix, np.array([row["identity"] for row in rows], dtype=object), ann)
+
+    def _load_persisted(self, images):
+        """
+        Memuat index IVF yang tersimpan (memory-mapped) jika isinya masih sama
+        dengan database saat ini. Mengembalikan False jika tidak bisa dipakai.
+        """
+        if self.backend != "ivf" or not os.path.exists(os.path.join(self.index_path, "meta.json")):
+            return False
+        try:
+            ann, keys = IVFIndex.load(self.index_path, mmap=True)
+        except Exception as e:
+            print(f"Peringatan: Gagal memuat index tersimpan di {self.index_path}. Detail: {e}")
+            return False
+
+        cache = self._get_cache()
+        current = {f"{path}|{cache.file_hash(path)}" for path in images}
+        if set(keys) != current or len(keys) != len(ann):
+            return False
+        rows = [dict(zip(("identity", "hash"), key.rsplit("|", 1))) for key in keys]
+        self._swap(rows, ann.vectors, ann)
+        return True
+
+    def load(self):
+        """
+        Memuat seluruh embedding ke memori (sekali; panggilan berikutnya langsung kembali).
+        Gambar yang isinya sudah pernah di-embed diambil dari cache; hanya gambar baru yang di-embed.
+
+        Returns:
+            bool: True jika panggilan ini yang membangun index, False jika sudah dimuat sebelumnya.
+        """
+        with self._lock:
+            # Request pertama yang bersamaan dan warm-up bisa menunggu lock yang sama;
+            # hanya yang pertama membangun index
+            if self.loaded:
+                return False
+            os.makedirs(self.db_path, exist_ok=True)
+            images = sorted(self._list_images())
+            if self._load_persisted(images):
+                self.loaded = True
+                print(f"Index {self.backend} dimuat dari {self.index_path}: {len(self)} representasi ({self.model_name}).")
+                return True
+
+            rows = self._embed_images(images)
+            if rows:
+                matrix = np.ascontiguousarray(l2_normalize([row["embedding"] for row in rows]))
+            else:
+                matrix = np.zeros((0, 0), dtype=np.float32)
+            ann = build_index(matrix, self.backend, labels=self._person_labels(rows))
+            if ann.kind == "ivf":
+                ann.save(self.index_path, keys=[f"{row['identity']}|{row['hash']}" for row in rows])
+            self._swap(rows, matrix, ann)
+            self.loaded = True
+            print(f"Index embedding dimuat: {len(rows)} representasi ({self.model_name}, {ann.kind}).")
+            return True
+
+    def update(self, added=(), removed=()):
+        """
+        Memperbarui index secara inkremental tanpa meng-embed ulang seluruh database.
+
+        Args:
+            added (list): Path gambar lokal yang baru atau diganti; hanya gambar ini yang di-embed.
+            removed (list): Path gambar lokal yang dihapus; barisnya dibuang dari index.
+        """
+        with self._lock:
+            # Gambar yang diganti juga harus dibuang dulu sebelum di-embed ulang
+            dropped = set(removed) | set(added)
+            new_rows = self._embed_images(sorted(set(added)))
+
+            matrix, identities, ann = self._snapshot
+            keep = ~np.isin(identities, list(dropped)) if len(identities) else np.zeros(0, dtype=bool)
+            rows = [row for row, flag in zip(self._rows, keep) if flag]
+            matrix = matrix[keep]
+
+            if new_rows:
+                new_matrix = l2_normalize([row["embedding"] for row in new_rows])
+                matrix = new_matrix if len(rows) == 0 else np.vstack([matrix, new_matrix])
+                rows = rows + new_rows
+            matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+
+            if len(rows) == len(self._rows) and not new_rows:
+                return
+            # Backend diperbarui inkremental; file index di disk diperbarui pada load() berikutnya
+            ann = update_index(ann, matrix, keep, len(new_rows), self.backend, labels=self._person_labels(rows))
+            self._swap(rows, matrix, ann)
+            print(f"Index embedding diperbarui: +{len(new_rows)} baris, total {len(rows)} ({self.model_name}).")
+
+    def apply_changes(self, changes):
+        """
+        Menerapkan ChangeSet dari SyncWorker (path relatif bucket) ke index.
+        """
+        # Jika index dimuat thread lain lebih dulu, perubahan ini mungkin belum ikut terbaca
+        if not self.loaded and self.load():
+            return
+
+        def to_local(name):
+            return os.path.join(self.db_path, name.replace('/', os.sep))
+
+        self.update(
+            added=[to_local(name) for name in list(changes.added) + list(changes.updated)],
+            removed=[to_local(name) for name in changes.removed]
+        )
+
+    def search(self, embedding, k=1):
+        """
+        Mencari k identitas terdekat dengan cosine distance.
+
+        Args:
+            embedding (array-like): Embedding wajah yang dicari.
+            k (int): Jumlah kandidat teratas yang dikembalikan.
+
+        Returns:
+            list: List dict {"identity", "distance"} terurut dari jarak terkecil.
+        """
+        matrix, identities, ann = self._snapshot
+        if len(identities) == 0 or embedding is None:
+            return []
+
+        query = l2_normalize(embedding)
+        if query.shape[-1] != matrix.shape[1]:
+            raise ValueError(
+                f"Dimensi embedding tidak cocok: {query.shape[-1]} vs {matrix.shape[1]} ({self.model_name})."
+            )
+
+        top, similarities = ann.search(query, k)
+        return [
+            {"identity": identities[i], "distance": float(1.0 - similarity)}
+            for i, similarity in zip(top, similarities)
+        ]
+
+    def search_batch(self, embeddings, k=1):
+        """
+        Mencari banyak embedding sekaligus (satu perkalian matriks-matriks untuk backend exact).
+
+        Args:
+            embeddings (array-like): Matriks embedding berbentuk (jumlah query, dimensi).
+
+        Returns:
+            list: Untuk setiap query, list dict {"identity", "distance"} seperti search().
+        """
+        matrix, identities, ann = self._snapshot
+        if len(identities) == 0 or len(embeddings) == 0:
+            return [[] for _ in range(len(embeddings))]
+
+        queries = l2_normalize(embeddings)
+        if queries.shape[-1] != matrix.shape[1]:
+            raise ValueError(
+                f"Dimensi embedding tidak cocok: {queries.shape[-1]} vs {matrix.shape[1]} ({self.model_name})."
+            )
+        tops, similarities = ann.search_batch(queries, k)
+        return [
+            [{"identity": identities[i], "distance": float(1.0 - similarity)} for i, similarity in zip(top, sims)]
+            for top, sims in zip(tops, similarities)
+        ]
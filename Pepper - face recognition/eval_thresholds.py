@@ -0,0 +1,424 @@
+# eval_thresholds.py
+"""
+Evaluasi akurasi offline dan kalibrasi ambang batas jarak per model.
+
+1. Folder berlabel <folder>/<nama>/<gambar>.jpg di-embed sekali per model lewat
+   EmbeddingIndex. Hasilnya tersimpan di EmbeddingCache (EMBEDDING_CACHE_PATH), jadi
+   evaluasi ulang dengan target FAR lain atau folder yang sebagian sama tidak menjalankan
+   model lagi. Gambar tanpa wajah atau dengan lebih dari satu wajah dilewati karena
+   labelnya ambigu.
+2. Jarak semua pasangan dihitung per blok baris dengan satu perkalian matriks, lalu
+   dipisah menjadi pasangan genuine (orang sama) dan impostor (orang berbeda).
+3. TAR/FAR/FRR untuk semua ambang batas dihitung sekaligus dengan searchsorted pada jarak
+   yang sudah diurutkan: kurva ROC dan DET, AUC, EER, dan ambang batas untuk setiap target FAR.
+
+Jaraknya sama dengan yang dipakai server: cosine (1 - dot product embedding yang sudah
+dinormalisasi L2), cocok jika jarak <= DISTANCE_THRESHOLD. Model "dlib" (face_recognition,
+dipakai pepper_agent.py dengan MATCH_THRESHOLD 0.53) memakai jarak euclidean dan hanya
+tersedia jika paket face_recognition terpasang.
+
+Rekomendasi per model adalah ambang batas terbesar dengan FAR <= --recommend-far; jika
+jumlah pasangan impostor terlalu sedikit untuk target itu, dipakai ambang batas EER.
+Hasilnya bisa langsung dipakai lewat environment variable MODEL_THRESHOLDS / DISTANCE_THRESHOLD.
+
+Contoh:
+    python eval_thresholds.py dataset/ --output eval.json
+    python eval_thresholds.py dataset/ --models ArcFace --target-far 0.0001 0.001 0.01 --plot-dir eval_plots
+    python eval_thresholds.py dataset/ --models dlib
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import numpy as np
+
+from embedding_cache import default_cache
+from embedding_index import EmbeddingIndex, IMAGE_EXTENSIONS, identity_to_name
+
+DEFAULT_MODELS = ["ArcFace", "Facenet", "VGG-Face"]
+DLIB_MODEL = "dlib"
+# Ambang batas yang sedang dipakai, sebagai pembanding rekomendasi
+CURRENT_THRESHOLD = float(os.environ.get("DISTANCE_THRESHOLD", "0.6"))
+DLIB_THRESHOLD = 0.53
+# Baris per blok perhitungan jarak; membatasi memori sementara ke BLOCK_ROWS x jumlah gambar
+BLOCK_ROWS = 1024
+
+
+def list_images(folder):
+    images = []
+    for root, _, files in os.walk(folder):
+        for name in files:
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                images.append(os.path.join(root, name))
+    return sorted(images)
+
+
+def embed_deepface(folder, model_name, detector_backend="opencv"):
+    """
+    Embedding semua wajah di folder dengan pengaturan yang sama dengan index server.
+
+    Returns:
+        tuple: (matriks float32 ternormalisasi L2, array path gambar per baris)
+    """
+    index = EmbeddingIndex(folder, model_name, detector_backend=detector_backend, backend="exact")
+    index.load()
+    return index.vectors()
+
+
+def embed_dlib(folder):
+    """Embedding 128 dimensi face_recognition (seperti pepper_agent.py), tanpa normalisasi."""
+    try:
+        import face_recognition
+    except ImportError:
+        raise RuntimeError("Model dlib butuh paket face_recognition.")
+
+    cache = default_cache()
+    settings = (DLIB_MODEL, "hog", True, "base", 0)
+    vectors, identities = [], []
+    computed = 0
+    for path in list_images(folder):
+        image_hash = cache.file_hash(path)
+        results = cache.get(image_hash, *settings)
+        if results is None:
+            image = face_recognition.load_image_file(path)
+            locations = face_recognition.face_locations(image)
+            encodings = face_recognition.face_encodings(image, locations)
+            results = [
+                (np.asarray(encoding, dtype=np.float32), {"x": left, "y": top, "w": right - left, "h": bottom - top})
+                for encoding, (top, right, bottom, left) in zip(encodings, locations)
+            ]
+            cache.put(image_hash, *settings, results)
+            computed += 1
+        for embedding, _ in results:
+            vectors.append(embedding)
+            identities.append(path)
+    if computed:
+        print(f"Embedding baru dihitung untuk {computed} gambar ({DLIB_MODEL}).", file=sys.stderr)
+    matrix = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1)
+    return matrix, np.array(identities, dtype=object)
+
+
+def label_samples(identities, folder):
+    """
+    Memberi label integer per orang dan membuang gambar dengan lebih dari satu wajah.
+
+    Returns:
+        tuple: (mask baris yang dipakai, label int per baris yang dipakai, nama per label)
+    """
+    if not len(identities):
+        return np.zeros(0, dtype=bool), np.zeros(0, dtype=np.int64), np.array([])
+    paths, counts = np.unique(identities, return_counts=True)
+    single = np.isin(identities, paths[counts == 1])
+    names = np.array([identity_to_name(path, folder) for path in identities[single]])
+    classes, labels = np.unique(names, return_inverse=True)
+    return single, labels, classes
+
+
+def pair_distances(vectors, labels, metric="cosine", block_rows=BLOCK_ROWS):
+    """
+    Jarak semua pasangan (i < j), dipisah menjadi genuine dan impostor.
+
+    Args:
+        vectors (np.ndarray): Matriks embedding; untuk cosine harus sudah dinormalisasi L2.
+        labels (np.ndarray): Label integer per baris.
+        metric (str): "cosine" atau "euclidean".
+
+    Returns:
+        tuple: (jarak genuine, jarak impostor), masing-masing float32 terurut naik.
+    """
+    count = len(vectors)
+    columns = np.arange(count)
+    norms = np.einsum("ij,ij->i", vectors, vectors) if metric == "euclidean" else None
+    genuine, impostor = [], []
+    for start in range(0, count, block_rows):
+        rows = columns[start:start + block_rows]
+        products = vectors[rows] @ vectors.T
+        if metric == "cosine":
+            distances = 1.0 - products
+        else:
+            distances = np.sqrt(np.maximum(norms[rows, None] + norms[None, :] - 2.0 * products, 0.0))
+        upper = columns[None, :] > rows[:, None]
+        same = labels[rows, None] == labels[None, :]
+        genuine.append(distances[upper & same])
+        impostor.append(distances[upper & ~same])
+    genuine = np.sort(np.concatenate(genuine).astype(np.float32))
+    impostor = np.sort(np.concatenate(impostor).astype(np.float32))
+    return genuine, impostor
+
+
+def rates_at(genuine, impostor, thresholds):
+    """TAR dan FAR untuk array ambang batas (jarak <= ambang batas dianggap cocok)."""
+    tar = np.searchsorted(genuine, thresholds, side="right") / len(genuine)
+    far = np.searchsorted(impostor, thresholds, side="right") / len(impostor)
+    return tar, far
+
+
+def equal_error_rate(genuine, impostor):
+    """
+    EER dan ambang batasnya, diinterpolasi linear di antara dua ambang batas terdekat.
+    Juga mengembalikan AUC ROC yang dihitung pada semua ambang batas yang sama.
+    """
+    thresholds = np.unique(np.concatenate([genuine, impostor]))
+    tar, far = rates_at(genuine, impostor, thresholds)
+    frr = 1.0 - tar
+    # far - frr naik monoton terhadap ambang batas; EER ada di titik nolnya
+    diff = far - frr
+    i = int(np.clip(np.searchsorted(diff, 0.0), 1, len(thresholds) - 1))
+    span = diff[i] - diff[i - 1]
+    weight = -diff[i - 1] / span if span > 0 else 0.0
+    eer_threshold = thresholds[i - 1] + weight * (thresholds[i] - thresholds[i - 1])
+    eer_far = far[i - 1] + weight * (far[i] - far[i - 1])
+    eer_frr = frr[i - 1] + weight * (frr[i] - frr[i - 1])
+
+    roc_far = np.concatenate([[0.0], far])
+    roc_tar = np.concatenate([[0.0], tar])
+    auc = float(np.sum(np.diff(roc_far) * (roc_tar[1:] + roc_tar[:-1]) / 2.0))
+    return {"rate": float((eer_far + eer_frr) / 2.0), "threshold": float(eer_threshold)}, auc
+
+
+def threshold_at_far(genuine, impostor, target):
+    """Ambang batas terbesar dengan FAR <= target, beserta TAR/FAR-nya."""
+    allowed = int(np.floor(target * len(impostor)))
+    if allowed >= len(impostor):
+        threshold = float(impostor[-1])
+    else:
+        # Pasangan impostor ke-(allowed + 1) sudah tidak boleh lolos
+        threshold = float(np.nextafter(impostor[allowed], np.float32(-np.inf)))
+    tar, far = rates_at(genuine, impostor, np.array([threshold]))
+    return {
+        "target_far": target,
+        "threshold": threshold,
+        "tar": float(tar[0]),
+        "far": float(far[0]),
+        # Target di bawah 1 / jumlah pasangan impostor tidak bisa diukur dari data ini
+        "resolvable": target * len(impostor) >= 1.0,
+    }
+
+
+def curve_points(genuine, impostor, points):
+    """Titik kurva ROC/DET pada kuantil jarak genuine dan impostor (rapat di daerah FAR kecil)."""
+    quantiles = np.linspace(0.0, 1.0, max(2, points // 2))
+    thresholds = np.unique(np.concatenate([np.quantile(genuine, quantiles), np.quantile(impostor, quantiles)]))
+    tar, far = rates_at(genuine, impostor, thresholds)
+    return {
+        "thresholds": np.round(thresholds, 5).tolist(),
+        "tar": np.round(tar, 6).tolist(),
+        "far": np.round(far, 6).tolist(),
+        "frr": np.round(1.0 - tar, 6).tolist(),
+    }
+
+
+def _summary(values):
+    return {
+        "count": int(len(values)),
+        "mean": float(values.mean()),
+        "std": float(values.std()),
+        "min": float(values[0]),
+        "median": float(values[len(values) // 2]),
+        "max": float(values[-1]),
+    }
+
+
+def evaluate(genuine, impostor, current_threshold, target_fars, recommend_far, points):
+    """Metrik lengkap untuk satu model dari jarak genuine dan impostor yang sudah terurut."""
+    eer, auc = equal_error_rate(genuine, impostor)
+    tar, far = rates_at(genuine, impostor, np.array([current_threshold]))
+    at_far = [threshold_at_far(genuine, impostor, target) for target in target_fars]
+
+    recommended = threshold_at_far(genuine, impostor, recommend_far)
+    if recommended["resolvable"]:
+        recommendation = {"threshold": recommended["threshold"], "rule": f"far<={recommend_far}",
+                          "tar": recommended["tar"], "far": recommended["far"]}
+    else:
+        tar_eer, far_eer = rates_at(genuine, impostor, np.array([eer["threshold"]]))
+        recommendation = {"threshold": eer["threshold"], "rule": "eer",
+                          "tar": float(tar_eer[0]), "far": float(far_eer[0])}
+
+    return {
+        "genuine": _summary(genuine),
+        "impostor": _summary(impostor),
+        "eer": eer,
+        "auc": auc,
+        "current": {"threshold": current_threshold, "tar": float(tar[0]), "far": float(far[0])},
+        "at_far": at_far,
+        "recommended": recommendation,
+        "curve": curve_points(genuine, impostor, points),
+    }
+
+
+def _probit(rates):
+    # Sumbu DET: kuantil distribusi normal standar
+    from statistics import NormalDist
+    clipped = np.clip(rates, 1e-6, 1.0 - 1e-6)
+    return np.vectorize(NormalDist().inv_cdf)(clipped)
+
+
+def save_plots(results, plot_dir):
+    """Menyimpan roc.png, det.png dan distribusi jarak per model. Dilewati tanpa matplotlib."""
+    try:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print("matplotlib tidak terpasang; plot dilewati.", file=sys.stderr)
+        return []
+
+    os.makedirs(plot_dir, exist_ok=True)
+    paths = []
+
+    fig, ax = plt.subplots(figsize=(6, 5))
+    for model_name, result in results.items():
+        curve = result["curve"]
+        far = np.maximum(curve["far"], 1e-6)
+        ax.plot(far, curve["tar"], label=f"{model_name} (AUC {result['auc']:.4f})")
+    ax.set_xscale("log")
+    ax.set_xlabel("FAR")
+    ax.set_ylabel("TAR")
+    ax.set_title("ROC")
+    ax.grid(True, which="both", alpha=0.3)
+    ax.legend()
+    paths.append(os.path.join(plot_dir, "roc.png"))
+    fig.savefig(paths[-1], dpi=120, bbox_inches="tight")
+    plt.close(fig)
+
+    ticks = np.array([0.0001, 0.001, 0.01, 0.05, 0.2, 0.5])
+    fig, ax = plt.subplots(figsize=(6, 5))
+    for model_name, result in results.items():
+        curve = result["curve"]
+        line, = ax.plot(_probit(curve["far"]), _probit(curve["frr"]), label=f"{model_name} (EER {result['eer']['rate']:.2%})")
+        eer = result["eer"]["rate"]
+        ax.plot(_probit([eer]), _probit([eer]), "o", color=line.get_color())
+    limits = _probit([0.00005, 0.6])
+    ax.set_xlim(*limits)
+    ax.set_ylim(*limits)
+    ax.set_xticks(_probit(ticks))
+    ax.set_xticklabels([f"{t:g}" for t in ticks])
+    ax.set_yticks(_probit(ticks))
+    ax.set_yticklabels([f"{t:g}" for t in ticks])
+    ax.set_xlabel("FAR")
+    ax.set_ylabel("FRR")
+    ax.set_title("DET")
+    ax.grid(True, alpha=0.3)
+    ax.legend()
+    paths.append(os.path.join(plot_dir, "det.png"))
+    fig.savefig(paths[-1], dpi=120, bbox_inches="tight")
+    plt.close(fig)
+
+    for model_name, result in results.items():
+        genuine, impostor = result.pop("_distances")
+        fig, ax = plt.subplots(figsize=(6, 4))
+        bins = np.linspace(min(genuine[0], impostor[0]), max(genuine[-1], impostor[-1]), 80)
+        ax.hist(impostor, bins=bins, density=True, alpha=0.5, label="impostor")
+        ax.hist(genuine, bins=bins, density=True, alpha=0.5, label="genuine")
+        ax.axvline(result["current"]["threshold"], color="gray", linestyle="--", label="sekarang")
+        ax.axvline(result["recommended"]["threshold"], color="red", linestyle="--", label="rekomendasi")
+        ax.set_xlabel(f"jarak {result['metric']}")
+        ax.set_title(model_name)
+        ax.legend()
+        paths.append(os.path.join(plot_dir, f"distances_{model_name.lower().replace('-', '')}.png"))
+        fig.savefig(paths[-1], dpi=120, bbox_inches="tight")
+        plt.close(fig)
+    return paths
+
+
+def evaluate_model(folder, model_name, args):
+    started = time.perf_counter()
+    if model_name == DLIB_MODEL:
+        vectors, identities = embed_dlib(folder)
+        metric, current_threshold = "euclidean", DLIB_THRESHOLD
+    else:
+        vectors, identities = embed_deepface(folder, model_name, args.detector)
+        metric, current_threshold = "cosine", CURRENT_THRESHOLD
+    embed_seconds = time.perf_counter() - started
+
+    single, labels, classes = label_samples(identities, folder)
+    vectors = np.ascontiguousarray(vectors[single], dtype=np.float32)
+    images = len(list_images(folder))
+
+    started = time.perf_counter()
+    genuine, impostor = pair_distances(vectors, labels, metric)
+    if not len(genuine) or not len(impostor):
+        raise RuntimeError(
+            f"{model_name}: butuh minimal dua orang dan satu orang dengan >= 2 gambar "
+            f"(struktur <folder>/<nama>/<gambar>); didapat {len(vectors)} wajah dari {len(classes)} orang."
+        )
+    result = {"metric": metric}
+    result.update(evaluate(genuine, impostor, current_threshold, args.target_far, args.recommend_far, args.points))
+    result.update({
+        "images": images,
+        "faces_used": int(len(vectors)),
+        "images_skipped": images - int(len(vectors)),
+        "identities": int(len(classes)),
+        "embed_seconds": round(embed_seconds, 3),
+        "eval_seconds": round(time.perf_counter() - started, 3),
+    })
+    result["_distances"] = (genuine, impostor)
+    return result
+
+
+def print_summary(results):
+    print(f"{'model':<10} {'wajah':>6} {'genuine':>9} {'impostor':>10} {'EER':>7} {'AUC':>7} "
+          f"{'sekarang':>18} {'rekomendasi':>26}", file=sys.stderr)
+    for model_name, result in results.items():
+        current, recommended = result["current"], result["recommended"]
+        print(f"{model_name:<10} {result['faces_used']:>6} {result['genuine']['count']:>9} "
+              f"{result['impostor']['count']:>10} {result['eer']['rate']:>7.2%} {result['auc']:>7.4f} "
+              f"{current['threshold']:>6.3f} TAR {current['tar']:>6.2%} "
+              f"{recommended['threshold']:>6.4f} ({recommended['rule']}) TAR {recommended['tar']:>6.2%}",
+              file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluasi akurasi dan kalibrasi ambang batas jarak per model.")
+    parser.add_argument("folder", help="Folder berlabel <folder>/<nama>/<gambar>.jpg.")
+    parser.add_argument("--models", nargs="+", default=DEFAULT_MODELS,
+                        help=f"Model DeepFace, atau '{DLIB_MODEL}' untuk face_recognition (pepper_agent.py).")
+    parser.add_argument("--detector", default="opencv", help="Detector DeepFace (sama dengan server).")
+    parser.add_argument("--target-far", type=float, nargs="+", default=[0.0001, 0.001, 0.01],
+                        help="FAR yang dilaporkan ambang batasnya.")
+    parser.add_argument("--recommend-far", type=float, default=0.001,
+                        help="FAR maksimum untuk ambang batas yang direkomendasikan.")
+    parser.add_argument("--points", type=int, default=200, help="Jumlah titik kurva ROC/DET di laporan.")
+    parser.add_argument("--plot-dir", help="Direktori untuk roc.png, det.png dan histogram jarak (butuh matplotlib).")
+    parser.add_argument("--output", help="File JSON hasil.")
+    args = parser.parse_args()
+
+    folder = os.path.abspath(args.folder)
+    results = {}
+    for model_name in args.models:
+        print(f"Mengevaluasi {model_name}...", file=sys.stderr)
+        results[model_name] = evaluate_model(folder, model_name, args)
+
+    print_summary(results)
+    plots = save_plots(results, args.plot_dir) if args.plot_dir else []
+    for result in results.values():
+        result.pop("_distances", None)
+
+    recommended = {model_name: round(result["recommended"]["threshold"], 4) for model_name, result in results.items()}
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "folder": folder,
+            "python": platform.python_version(),
+            "args": vars(args),
+            "plots": plots,
+        },
+        "recommended": recommended,
+        "models": results,
+    }
+    deepface_models = {name: value for name, value in recommended.items() if name != DLIB_MODEL}
+    if deepface_models:
+        print("MODEL_THRESHOLDS=" + ",".join(f"{name}={value}" for name, value in deepface_models.items()),
+              file=sys.stderr)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
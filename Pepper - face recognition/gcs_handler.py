@@ -1,97 +1,88 @@
 # gcs_handler.py
 import os
+import threading
 
 GCS_BUCKET_NAME = os.environ.get("GCS_BUCKET_NAME", "your-bucket-name")
 GOOGLE_APPLICATION_CREDENTIALS = os.environ.get("GOOGLE_APPLICATION_CREDENTIALS", "key.json")
 os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = GOOGLE_APPLICATION_CREDENTIALS
 from google.cloud import storage
 from google.api_core.exceptions import NotFound
+from local_bucket import LocalBucket
+from gcs_transfer import default_engine, GCS_TRANSFER_WORKERS
+from sync_worker import SyncWorker
 
 # Konfigurasi GCS
 # Ganti dengan nama bucket GCS Anda
 # Direktori lokal untuk menyimpan database wajah yang disinkronkan
 LOCAL_DB_PATH = "gcs_database" 
+# Jika diisi, direktori ini dipakai sebagai pengganti bucket GCS (untuk pengujian lokal)
+GCS_LOCAL_BUCKET_PATH = os.environ.get("GCS_LOCAL_BUCKET_PATH")
+# Jeda sinkronisasi latar belakang dalam detik
+GCS_SYNC_INTERVAL = float(os.environ.get("GCS_SYNC_INTERVAL", "30"))
+
+
+# Klien GCS dibuat sekali per proses dan dipakai ulang oleh semua sinkronisasi dan unggahan
+_storage_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Mengembalikan klien GCS bersama. Pool koneksi HTTP-nya diperbesar sesuai
+    GCS_TRANSFER_WORKERS agar transfer paralel tidak saling menunggu koneksi.
+    """
+    global _storage_client
+    with _client_lock:
+        if _storage_client is None:
+            client = storage.Client()
+            try:
+                import requests
+                adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=GCS_TRANSFER_WORKERS, pool_maxsize=GCS_TRANSFER_WORKERS
+                )
+                client._http.mount("https://", adapter)
+            except Exception as e:
+                print(f"Peringatan: Gagal memperbesar pool koneksi GCS. Detail: {e}")
+            _storage_client = client
+        return _storage_client
+
+
+def get_bucket():
+    """
+    Mengembalikan bucket GCS, atau LocalBucket jika GCS_LOCAL_BUCKET_PATH diatur.
+    """
+    if GCS_LOCAL_BUCKET_PATH:
+        return LocalBucket(GCS_LOCAL_BUCKET_PATH, GCS_BUCKET_NAME)
+    return get_client().bucket(GCS_BUCKET_NAME)
+
+
+_sync_worker = None
+
 
 def synchronize_gcs_to_local():
     """
-    Melakukan sinkronisasi cerdas antara GCS dan direktori lokal.
-    - Mengunduh file baru dari GCS.
-    - Menghapus file lokal yang tidak ada lagi di GCS.
-    - Menghapus cache DeepFace (.pkl) hanya jika ada perubahan.
+    Menjalankan satu putaran sinkronisasi GCS -> lokal (tanpa thread latar belakang).
+    Perubahan dideteksi lewat manifest persisten (generation, size, md5) milik SyncWorker,
+    sehingga file yang ditimpa di GCS dengan nama yang sama juga ikut diunduh ulang.
+
+    Returns:
+        bool: True jika database lokal berubah (ada file diunduh atau dihapus).
     """
+    global _sync_worker
     print("Memulai sinkronisasi cerdas...")
+    if _sync_worker is None:
+        _sync_worker = SyncWorker(get_bucket, LOCAL_DB_PATH)
     try:
-        storage_client = storage.Client()
-        bucket = storage_client.bucket(GCS_BUCKET_NAME)
+        changes = _sync_worker.sync_once()
     except Exception as e:
-        print(f"Error: Gagal menginisialisasi klien GCS. Detail: {e}")
-        return
+        print(f"Error: Sinkronisasi dengan GCS gagal. Detail: {e}")
+        return False
 
-    # 1. Dapatkan daftar file (path relatif) dari GCS
-    gcs_files = {blob.name for blob in bucket.list_blobs()}
-
-    # 2. Dapatkan daftar file (path relatif) dari direktori lokal
-    if not os.path.exists(LOCAL_DB_PATH):
-        os.makedirs(LOCAL_DB_PATH)
-    
-    local_files = set()
-    for root, _, files in os.walk(LOCAL_DB_PATH):
-        for name in files:
-            if name.endswith(".pkl"):  # Abaikan file cache DeepFace
-                continue
-            local_path = os.path.join(root, name)
-            # Buat path relatif untuk perbandingan, pastikan separatornya '/'
-            relative_path = os.path.relpath(local_path, LOCAL_DB_PATH).replace('\\', '/')
-            local_files.add(relative_path)
-
-    # 3. Tentukan file yang akan diunduh dan dihapus
-    files_to_download = gcs_files - local_files
-    files_to_delete = local_files - gcs_files
-
-    db_changed = False
-
-    # 4. Unduh file-file baru
-    if files_to_download:
-        db_changed = True
-        print(f"Ditemukan {len(files_to_download)} file baru untuk diunduh.")
-        for file_path in files_to_download:
-            # Lewati "objek" folder yang ditandai dengan '/' di akhir nama
-            if file_path.endswith('/'):
-                print(f"Melewati objek folder: {file_path}")
-                continue
-                
-            blob = bucket.blob(file_path)
-            # Ganti separator agar sesuai dengan sistem operasi lokal
-            destination_file_path = os.path.join(LOCAL_DB_PATH, file_path.replace('/', os.sep))
-            
-            # Buat direktori jika belum ada
-            destination_dir = os.path.dirname(destination_file_path)
-            if not os.path.exists(destination_dir):
-                os.makedirs(destination_dir)
-            
-            print(f"Mengunduh {file_path}...")
-            blob.download_to_filename(destination_file_path)
-
-    # 5. Hapus file-file lama
-    if files_to_delete:
-        db_changed = True
-        print(f"Ditemukan {len(files_to_delete)} file lama untuk dihapus.")
-        for file_path in files_to_delete:
-            local_file_to_delete = os.path.join(LOCAL_DB_PATH, file_path.replace('/', os.sep))
-            if os.path.exists(local_file_to_delete):
-                print(f"Menghapus {local_file_to_delete}...")
-                os.remove(local_file_to_delete)
-
-    # 6. Hapus file cache .pkl jika database berubah
-    if db_changed:
-        print("Database berubah. Menghapus file cache representasi DeepFace.")
-        pkl_file = os.path.join(LOCAL_DB_PATH, "representations_vgg_face.pkl")
-        if os.path.exists(pkl_file):
-            os.remove(pkl_file)
-    else:
+    db_changed = bool(changes.added or changes.updated or changes.removed)
+    if not db_changed:
         print("Database lokal sudah sinkron dengan GCS.")
-    
     print("Sinkronisasi cerdas selesai.")
+    return db_changed
 
 
 def upload_face_to_gcs(image_path, person_name):
@@ -103,11 +94,10 @@ def upload_face_to_gcs(image_path, person_name):
         person_name (str): Nama orang, digunakan sebagai nama folder di GCS.
 
     Returns:
-        bool: True jika berhasil, False jika gagal.
+        Blob: Objek blob yang diunggah jika berhasil, None jika gagal.
     """
     try:
-        storage_client = storage.Client()
-        bucket = storage_client.bucket(GCS_BUCKET_NAME)
+        bucket = get_bucket()
         
         # Tentukan nama file unik untuk menghindari tumpang tindih
         file_name = os.path.basename(image_path)
@@ -116,9 +106,36 @@ def upload_face_to_gcs(image_path, person_name):
         blob = bucket.blob(destination_blob_name)
         
         print(f"Mengunggah {image_path} ke GCS di gs://{GCS_BUCKET_NAME}/{destination_blob_name}")
-        blob.upload_from_filename(image_path)
+        default_engine().call(blob.upload_from_filename, image_path)
+        print("Unggahan berhasil.")
+        return blob
+    except Exception as e:
+        print(f"Error: Gagal mengunggah file ke GCS. Detail: {e}")
+        return None
+
+
+def upload_face_bytes_to_gcs(image_bytes, person_name, file_name, content_type="image/jpeg"):
+    """
+    Mengunggah isi gambar langsung dari memori ke GCS di bawah folder nama orang tersebut,
+    tanpa menulis file sementara ke disk.
+
+    Args:
+        image_bytes (bytes): Isi file gambar.
+        person_name (str): Nama orang, digunakan sebagai nama folder di GCS.
+        file_name (str): Nama file unik di dalam folder tersebut.
+
+    Returns:
+        Blob: Objek blob yang diunggah jika berhasil, None jika gagal.
+    """
+    try:
+        bucket = get_bucket()
+        destination_blob_name = f"{person_name}/{file_name}"
+        blob = bucket.blob(destination_blob_name)
+
+        print(f"Mengunggah {len(image_bytes)} byte ke GCS di gs://{GCS_BUCKET_NAME}/{destination_blob_name}")
+        default_engine().call(lambda: blob.upload_from_string(image_bytes, content_type=content_type))
         print("Unggahan berhasil.")
-        return True
+        return blob
     except Exception as e:
         print(f"Error: Gagal mengunggah file ke GCS. Detail: {e}")
-        return False
\ No newline at end of file
+        return None
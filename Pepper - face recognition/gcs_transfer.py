@@ -0,0 +1,111 @@
+# gcs_transfer.py
+import os
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Jumlah transfer (unduh/unggah) yang berjalan paralel
+GCS_TRANSFER_WORKERS = int(os.environ.get("GCS_TRANSFER_WORKERS", "16"))
+# Jumlah percobaan ulang per objek untuk error sementara
+GCS_TRANSFER_RETRIES = int(os.environ.get("GCS_TRANSFER_RETRIES", "3"))
+
+
+def _is_retryable(error):
+    """Objek yang memang tidak ada atau permintaan yang salah tidak perlu dicoba ulang."""
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code == 408 or code == 429 or code >= 500
+    return not isinstance(error, (FileNotFoundError, PermissionError, ValueError))
+
+
+class TransferEngine:
+    """
+    Mesin transfer GCS dengan thread pool terbatas dan percobaan ulang (exponential backoff + jitter).
+
+    Thread pool dibuat sekali dan dipakai ulang oleh sinkronisasi maupun unggahan,
+    sehingga jumlah koneksi paralel ke GCS tetap terbatas di seluruh proses.
+    """
+
+    def __init__(self, max_workers=GCS_TRANSFER_WORKERS, retries=GCS_TRANSFER_RETRIES, backoff=0.5):
+        self.max_workers = max(1, max_workers)
+        self.retries = retries
+        self.backoff = backoff
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # Dibuat saat dipakai pertama kali agar aman dibuat sebelum fork worker server
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="gcs-transfer")
+            return self._executor
+
+    def call(self, func, *args):
+        """Menjalankan satu transfer dengan percobaan ulang. Error terakhir diteruskan ke pemanggil."""
+        attempt = 0
+        while True:
+            try:
+                return func(*args)
+            except Exception as e:
+                if attempt >= self.retries or not _is_retryable(e):
+                    raise
+                delay = self.backoff * (2 ** attempt) * (1 + random.random())
+                attempt += 1
+                print(f"Peringatan: Transfer gagal ({e}); mencoba lagi ({attempt}/{self.retries}) dalam {delay:.1f} detik.")
+                time.sleep(delay)
+
+    def map(self, func, items):
+        """
+        Menjalankan func(item) untuk setiap item secara paralel, masing-masing dengan percobaan ulang.
+
+        Returns:
+            list: Tuple (item, hasil, error) sesuai urutan item; error None jika berhasil.
+        """
+        items = list(items)
+        if not items:
+            return []
+        executor = self._get_executor()
+        futures = [executor.submit(self.call, func, item) for item in items]
+        results = []
+        for item, future in zip(items, futures):
+            try:
+                results.append((item, future.result(), None))
+            except Exception as e:
+                results.append((item, None, e))
+        return results
+
+    def download_many(self, blobs, destination_for):
+        """
+        Mengunduh banyak blob secara paralel.
+
+        Args:
+            blobs (list): Blob GCS (atau LocalBlob).
+            destination_for (callable): Mengembalikan path tujuan lokal untuk sebuah blob.
+        """
+        def download(blob):
+            destination = destination_for(blob)
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            blob.download_to_filename(destination)
+            return destination
+
+        return self.map(download, blobs)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+
+_default_engine = None
+_default_engine_lock = threading.Lock()
+
+
+def default_engine():
+    """Satu TransferEngine bersama per proses."""
+    global _default_engine
+    with _default_engine_lock:
+        if _default_engine is None:
+            _default_engine = TransferEngine()
+        return _default_engine
@@ -0,0 +1,46 @@
+# gunicorn.conf.py
+"""
+Konfigurasi Gunicorn untuk mode produksi.
+
+Contoh:
+    gunicorn -c gunicorn.conf.py app:app
+    WEB_WORKERS=4 WEB_THREADS=8 gunicorn -c gunicorn.conf.py app:app
+
+Setiap worker adalah proses terpisah yang memuat model dan index embedding sekali saat
+dimulai (lewat model_registry.start_warm_up). Aplikasi sengaja tidak di-preload di proses
+master: TensorFlow tidak aman di-fork setelah model dibangun, dan thread latar belakang
+(sinkronisasi GCS, pemanasan model) tidak ikut ter-fork. Data besar tetap dibagi antar worker
+lewat page cache sistem operasi: index IVF di-memory-map dan cache embedding SQLite dipakai
+bersama, sehingga worker kedua dan seterusnya tidak meng-embed ulang database.
+"""
+import os
+import shutil
+import tempfile
+import multiprocessing
+
+bind = os.environ.get("WEB_BIND", "127.0.0.1:8000")
+# Default satu worker per core; setiap worker menyimpan salinan model sendiri di RAM
+workers = int(os.environ.get("WEB_WORKERS", str(multiprocessing.cpu_count())))
+# Thread per worker untuk menumpuk I/O (unggahan, GCS) dengan inferensi
+worker_class = "gthread"
+threads = int(os.environ.get("WEB_THREADS", "4"))
+# Pemanasan model bisa memakan waktu lama; jangan anggap worker macet saat startup
+timeout = int(os.environ.get("WEB_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+preload_app = False
+
+# Setiap worker menulis snapshot metriknya ke sini; /metrics di worker mana pun menjumlahkan semuanya
+os.environ.setdefault("METRICS_DIR", os.path.join(tempfile.gettempdir(), "face_recognition_metrics"))
+
+
+def on_starting(server):
+    # Snapshot dari server sebelumnya tidak boleh ikut dijumlahkan
+    shutil.rmtree(os.environ["METRICS_DIR"], ignore_errors=True)
+
+
+def post_fork(server, worker):
+    # Batasi thread intra-op TensorFlow agar worker tidak saling berebut core
+    os.environ.setdefault("TF_NUM_INTRAOP_THREADS", os.environ.get("WEB_TF_THREADS", "1"))
+    os.environ.setdefault("TF_NUM_INTEROP_THREADS", "1")
+    server.log.info(f"Worker {worker.pid} dimulai; model dan index dimuat di proses ini.")
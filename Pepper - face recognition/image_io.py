@@ -0,0 +1,33 @@
+# image_io.py
+import io
+import cv2
+import numpy as np
+from flask import Request
+
+
+def decode_image(data):
+    """
+    Mendekode bytes gambar (JPEG/PNG) langsung dari memori menjadi array BGR,
+    format yang diterima oleh DeepFace, tanpa menulis file sementara ke disk.
+
+    Args:
+        data (bytes): Isi file gambar.
+
+    Returns:
+        np.ndarray: Gambar BGR uint8, atau None jika bytes tidak dapat didekode.
+    """
+    if not data:
+        return None
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    return cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+
+
+class InMemoryRequest(Request):
+    """
+    Request Flask yang menyimpan file unggahan di memori (BytesIO).
+    Bawaan Werkzeug memindahkan unggahan di atas 500 KB ke file sementara di disk;
+    ukuran total tetap dibatasi oleh MAX_CONTENT_LENGTH aplikasi.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return io.BytesIO()
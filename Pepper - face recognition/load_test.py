@@ -0,0 +1,154 @@
+# load_test.py
+"""
+Load test lokal untuk endpoint /recognize.
+
+Mode 1 - server yang sudah berjalan:
+    python load_test.py --image foto.jpg --concurrency 16 --duration 30
+
+Mode 2 - jalankan Gunicorn dengan beberapa jumlah worker lalu bandingkan throughput:
+    python load_test.py --image foto.jpg --workers 1 2 4 8 --concurrency 32
+
+Pada mode 2 setiap konfigurasi dijalankan di port lokal terpisah, ditunggu sampai /ready
+mengembalikan 200 (model dan index sudah dimuat), baru kemudian diberi beban. Hasilnya
+berupa JSON berisi request per detik dan latensi p50/p95/p99 untuk setiap jumlah worker.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import subprocess
+import requests
+import numpy as np
+
+BASE_URL = os.environ.get("BASE_URL", "http://localhost:8000")
+
+
+def wait_until_ready(base_url, timeout):
+    """Menunggu /ready mengembalikan 200. Mengembalikan False jika melewati timeout."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(f"{base_url}/ready", timeout=2).status_code == 200:
+                return True
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(1)
+    return False
+
+
+def run_load(base_url, image_bytes, concurrency, duration, endpoint="/recognize"):
+    """
+    Mengirim request sebanyak-banyaknya dari `concurrency` thread selama `duration` detik.
+
+    Returns:
+        dict: Ringkasan throughput dan latensi.
+    """
+    url = f"{base_url}{endpoint}"
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client():
+        # Satu Session per thread agar koneksi keep-alive dipakai ulang
+        session = requests.Session()
+        local_latencies, local_errors = [], 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                response = session.post(url, files={'image': ('load.jpg', image_bytes, 'image/jpeg')}, timeout=60)
+                if response.status_code != 200:
+                    local_errors += 1
+            except requests.exceptions.RequestException:
+                local_errors += 1
+            local_latencies.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local_latencies)
+            errors[0] += local_errors
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies_ms = np.asarray(latencies) * 1000 if latencies else np.zeros(1)
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors[0],
+        "requests_per_second": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 1),
+        "p95_ms": round(float(np.percentile(latencies_ms, 95)), 1),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 1),
+    }
+
+
+def run_with_gunicorn(workers, threads, port, args, image_bytes):
+    """Menjalankan Gunicorn dengan jumlah worker tertentu, memberi beban, lalu menghentikannya."""
+    env = dict(os.environ, WEB_WORKERS=str(workers), WEB_THREADS=str(threads), WEB_BIND=f"127.0.0.1:{port}")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", args.app],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        if not wait_until_ready(base_url, args.ready_timeout):
+            return {"workers": workers, "error": "server tidak siap sebelum timeout"}
+        # Satu putaran singkat untuk memanaskan koneksi dan jalur inferensi semua worker
+        run_load(base_url, image_bytes, args.concurrency, min(5, args.duration), args.endpoint)
+        result = run_load(base_url, image_bytes, args.concurrency, args.duration, args.endpoint)
+        result["workers"] = workers
+        result["threads"] = threads
+        return result
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test endpoint pengenalan wajah.")
+    parser.add_argument("--image", required=True, help="Gambar wajah yang dikirim berulang kali.")
+    parser.add_argument("--concurrency", type=int, default=16, help="Jumlah client paralel.")
+    parser.add_argument("--duration", type=float, default=30, help="Lama pengujian per konfigurasi (detik).")
+    parser.add_argument("--endpoint", default="/recognize")
+    parser.add_argument("--url", default=BASE_URL, help="Server yang sudah berjalan (mode 1).")
+    parser.add_argument("--workers", type=int, nargs="+", help="Jumlah worker Gunicorn yang diuji (mode 2).")
+    parser.add_argument("--threads", type=int, default=4, help="Thread per worker Gunicorn (mode 2).")
+    parser.add_argument("--app", default="app:app", help="Modul aplikasi untuk Gunicorn (mode 2).")
+    parser.add_argument("--port", type=int, default=8100, help="Port awal untuk mode 2.")
+    parser.add_argument("--ready-timeout", type=float, default=600)
+    args = parser.parse_args()
+
+    with open(args.image, 'rb') as f:
+        image_bytes = f.read()
+
+    if not args.workers:
+        if not wait_until_ready(args.url, args.ready_timeout):
+            print(f"Error: {args.url}/ready tidak mengembalikan 200.")
+            sys.exit(1)
+        print(json.dumps(run_load(args.url, image_bytes, args.concurrency, args.duration, args.endpoint), indent=2))
+        return
+
+    results = []
+    for offset, workers in enumerate(args.workers):
+        print(f"Menguji {workers} worker...")
+        results.append(run_with_gunicorn(workers, args.threads, args.port + offset, args, image_bytes))
+
+    baseline = next((r["requests_per_second"] for r in results if "requests_per_second" in r), None)
+    for result in results:
+        if baseline and "requests_per_second" in result:
+            result["scaling"] = round(result["requests_per_second"] / baseline, 2)
+    print(json.dumps({"cpu_count": os.cpu_count(), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# local_bucket.py
+import os
+import base64
+import hashlib
+import shutil
+
+
+class LocalBlob:
+    """
+    Pengganti google.cloud.storage.Blob yang disimpan di direktori lokal.
+    Hanya atribut dan metode yang dipakai oleh gcs_handler dan sync_worker yang disediakan.
+    """
+
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self._md5_hash = None
+
+    @property
+    def path(self):
+        return os.path.join(self.bucket.root, self.name.replace('/', os.sep))
+
+    def _stat(self):
+        return os.stat(self.path)
+
+    @property
+    def generation(self):
+        # Seperti GCS, generation berubah setiap kali objek ditimpa
+        return self._stat().st_mtime_ns
+
+    @property
+    def size(self):
+        return self._stat().st_size
+
+    @property
+    def md5_hash(self):
+        # Format sama dengan GCS: digest md5 yang di-encode base64
+        if self._md5_hash is None:
+            hasher = hashlib.md5()
+            with open(self.path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    hasher.update(chunk)
+            self._md5_hash = base64.b64encode(hasher.digest()).decode('ascii')
+        return self._md5_hash
+
+    def download_to_filename(self, filename):
+        shutil.copyfile(self.path, filename)
+
+    def _prepare_destination(self):
+        self._md5_hash = None
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+    def upload_from_filename(self, filename, content_type=None):
+        self._prepare_destination()
+        shutil.copyfile(filename, self.path)
+
+    def upload_from_string(self, data, content_type=None):
+        self._prepare_destination()
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        with open(self.path, 'wb') as f:
+            f.write(data)
+
+    def delete(self):
+        os.remove(self.path)
+
+
+class LocalBucket:
+    """
+    Pengganti bucket GCS berbasis direktori lokal, untuk pengujian dan benchmark
+    tanpa koneksi ke Google Cloud.
+    """
+
+    def __init__(self, root, name="local-bucket"):
+        self.root = root
+        self.name = name
+        os.makedirs(root, exist_ok=True)
+
+    def blob(self, blob_name):
+        return LocalBlob(self, blob_name)
+
+    def list_blobs(self, prefix=None):
+        blobs = []
+        for root, _, files in os.walk(self.root):
+            for name in files:
+                relative_path = os.path.relpath(os.path.join(root, name), self.root).replace('\\', '/')
+                if prefix and not relative_path.startswith(prefix):
+                    continue
+                blobs.append(LocalBlob(self, relative_path))
+        return sorted(blobs, key=lambda blob: blob.name)
@@ -0,0 +1,275 @@
+# metrics.py
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+# Jika diisi (misalnya dengan beberapa worker Gunicorn), setiap proses menulis snapshot
+# metriknya ke direktori ini dan /metrics menjumlahkan snapshot semua proses
+METRICS_DIR = os.environ.get("METRICS_DIR")
+# Header request untuk meminta rincian waktu per tahap di header Server-Timing respons
+TRACE_HEADER = "X-Face-Trace"
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BACKGROUND = "background"
+_FLUSH_INTERVAL = 1.0
+
+
+def _label_string(labelnames, values):
+    if not labelnames:
+        return ""
+    pairs = []
+    for name, value in zip(labelnames, values):
+        escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Counter monoton dengan label, format Prometheus."""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return {json.dumps(key): value for key, value in self._values.items()}
+
+    @staticmethod
+    def merge(total, snapshot):
+        for key, value in snapshot.items():
+            total[key] = total.get(key, 0) + value
+        return total
+
+    def render(self, merged):
+        lines = []
+        for key, value in sorted(merged.items()):
+            labels = _label_string(self.labelnames, json.loads(key))
+            lines.append(f"{self.name}{labels} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """Histogram kumulatif dengan label, format Prometheus."""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {json.dumps(key): [list(counts), total, count] for key, (counts, total, count) in self._values.items()}
+
+    @staticmethod
+    def merge(total, snapshot):
+        for key, (counts, value_sum, count) in snapshot.items():
+            if key not in total:
+                total[key] = [list(counts), value_sum, count]
+                continue
+            state = total[key]
+            state[0] = [a + b for a, b in zip(state[0], counts)]
+            state[1] += value_sum
+            state[2] += count
+        return total
+
+    def render(self, merged):
+        lines = []
+        for key, (counts, value_sum, count) in sorted(merged.items()):
+            values = json.loads(key)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _label_string(self.labelnames + ("le",), values + [_format_value(bound)])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _label_string(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(value_sum)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    """Kumpulan metrik satu proses, dengan penggabungan antarproses lewat METRICS_DIR."""
+
+    def __init__(self, directory=METRICS_DIR):
+        self.directory = directory
+        self._metrics = []
+        self._last_flush = 0.0
+        self._flush_lock = threading.Lock()
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def _snapshot(self):
+        return {metric.name: metric.snapshot() for metric in self._metrics}
+
+    def flush(self, force=False):
+        """Menulis snapshot proses ini ke METRICS_DIR (paling sering sekali per _FLUSH_INTERVAL)."""
+        if not self.directory:
+            return
+        now = time.time()
+        if not force and now - self._last_flush < _FLUSH_INTERVAL:
+            return
+        if not self._flush_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_flush = now
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f"{os.getpid()}.json")
+            temp_path = f"{path}.tmp"
+            with open(temp_path, "w") as f:
+                json.dump(self._snapshot(), f)
+            os.replace(temp_path, path)
+        finally:
+            self._flush_lock.release()
+
+    def _collect(self):
+        if not self.directory:
+            return [self._snapshot()]
+        self.flush(force=True)
+        snapshots = []
+        for file_name in os.listdir(self.directory):
+            if not file_name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, file_name)) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    def render(self):
+        """Teks eksposisi Prometheus (version 0.0.4)."""
+        snapshots = self._collect()
+        lines = []
+        for metric in self._metrics:
+            merged = {}
+            for snapshot in snapshots:
+                metric.merge(merged, snapshot.get(metric.name, {}))
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render(merged))
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+REQUESTS = REGISTRY.counter("face_requests_total", "Jumlah request per endpoint dan status HTTP.", ("endpoint", "status"))
+REQUEST_SECONDS = REGISTRY.histogram("face_request_duration_seconds", "Durasi request per endpoint.", ("endpoint",))
+STAGE_SECONDS = REGISTRY.histogram(
+    "face_stage_duration_seconds", "Durasi per tahap pemrosesan (decode, detect, embed, search, ...).",
+    ("endpoint", "stage")
+)
+ERRORS = REGISTRY.counter("face_stage_errors_total", "Jumlah error per tahap.", ("endpoint", "stage"))
+
+
+class RequestTrace:
+    """Waktu per tahap satu request; tahap dari thread lain ditambahkan lewat objek yang sama."""
+
+    def __init__(self, endpoint, enabled=False):
+        self.endpoint = endpoint or "unknown"
+        self.enabled = enabled
+        self.started = time.perf_counter()
+        self.stages = []
+
+    def add(self, stage, seconds):
+        # list.append atomik, jadi aman dipanggil dari thread executor
+        self.stages.append((stage, seconds))
+
+    def server_timing(self):
+        """Nilai header Server-Timing: total 'app' diikuti setiap tahap jika trace diminta."""
+        entries = [f"app;dur={(time.perf_counter() - self.started) * 1000:.1f}"]
+        if self.enabled:
+            entries += [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.stages]
+        return ", ".join(entries)
+
+
+_local = threading.local()
+
+
+def begin_request(endpoint, trace=False):
+    request_trace = RequestTrace(endpoint, trace)
+    _local.trace = request_trace
+    return request_trace
+
+
+def current_trace():
+    return getattr(_local, "trace", None)
+
+
+def end_request(status):
+    """Mencatat durasi dan status request aktif. Mengembalikan RequestTrace-nya (atau None)."""
+    request_trace = current_trace()
+    _local.trace = None
+    if request_trace is None:
+        return None
+    REQUESTS.inc(endpoint=request_trace.endpoint, status=status)
+    REQUEST_SECONDS.observe(time.perf_counter() - request_trace.started, endpoint=request_trace.endpoint)
+    REGISTRY.flush()
+    return request_trace
+
+
+@contextmanager
+def stage(name, trace=None):
+    """
+    Mengukur satu tahap. Tanpa request aktif (misalnya sinkronisasi GCS di latar belakang)
+    tahap dicatat dengan endpoint "background".
+
+        with metrics.stage("detect"):
+            face = model_registry.detect_face(image)
+    """
+    request_trace = trace or current_trace()
+    endpoint = request_trace.endpoint if request_trace is not None else BACKGROUND
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        ERRORS.inc(endpoint=endpoint, stage=name)
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        STAGE_SECONDS.observe(seconds, endpoint=endpoint, stage=name)
+        if request_trace is not None:
+            request_trace.add(name, seconds)
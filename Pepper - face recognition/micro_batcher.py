@@ -0,0 +1,113 @@
+# micro_batcher.py
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future
+import numpy as np
+import model_registry
+import metrics
+
+# Ukuran batch maksimal dan waktu tunggu maksimal sebelum batch dijalankan
+EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", "16"))
+EMBED_BATCH_WAIT_MS = float(os.environ.get("EMBED_BATCH_WAIT_MS", "10"))
+
+
+class MicroBatcher:
+    """
+    Penjadwal yang menggabungkan wajah dari request-request bersamaan menjadi satu batch.
+
+    Setiap request memanggil embed(face): potongan wajah dipreproses di thread request,
+    lalu dimasukkan ke antrean. Satu thread worker per model mengambil wajah pertama,
+    menunggu paling lama max_wait_ms untuk wajah berikutnya (atau sampai max_batch_size),
+    menjalankan satu forward pass untuk seluruh batch, lalu menyelesaikan Future setiap request.
+    Tanpa beban, latensi tambahan paling banyak max_wait_ms; di bawah beban, biaya per
+    panggilan model dibagi ke banyak wajah.
+    """
+
+    def __init__(self, model_name, max_batch_size=EMBED_BATCH_SIZE, max_wait_ms=EMBED_BATCH_WAIT_MS,
+                 normalization="base"):
+        self.model_name = model_name
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self.normalization = normalization
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._batches = 0
+        self._faces = 0
+
+    def _ensure_started(self):
+        # Thread dimulai saat dipakai pertama kali, sehingga aman dibuat sebelum fork worker server
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._run, name=f"micro-batcher-{self.model_name}", daemon=True
+                    )
+                    self._thread.start()
+
+    def submit(self, face):
+        """
+        Memasukkan satu potongan wajah (hasil model_registry.detect_face) ke antrean.
+
+        Returns:
+            Future: Selesai dengan vektor embedding float32.
+        """
+        self._ensure_started()
+        tensor = model_registry.preprocess_face(face, self.model_name, self.normalization)
+        future = Future()
+        self._queue.put((tensor, future))
+        return future
+
+    def embed(self, face, timeout=None):
+        """Versi blocking dari submit()."""
+        return self.submit(face).result(timeout)
+
+    def _collect(self):
+        """Mengambil satu batch: tunggu item pertama tanpa batas, lalu tambahan sampai tenggat."""
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # Lewati request yang sudah dibatalkan (misalnya client timeout)
+            batch = [(tensor, future) for tensor, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                # Forward pass satu batch; tahap "embed" di request juga mencakup waktu antre
+                with metrics.stage("embed_batch"):
+                    embeddings = model_registry.forward_batch(
+                        np.concatenate([tensor for tensor, _ in batch], axis=0), self.model_name
+                    )
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), embedding in zip(batch, embeddings):
+                future.set_result(embedding)
+            with self._lock:
+                self._batches += 1
+                self._faces += len(batch)
+
+    def stats(self):
+        """Jumlah batch, jumlah wajah, dan rata-rata ukuran batch sejak proses dimulai."""
+        with self._lock:
+            batches, faces = self._batches, self._faces
+        return {
+            "batches": batches,
+            "faces": faces,
+            "mean_batch_size": round(faces / batches, 2) if batches else 0.0,
+            "pending": self._queue.qsize(),
+        }
@@ -0,0 +1,199 @@
+# model_registry.py
+import threading
+import numpy as np
+from deepface import DeepFace
+from deepface.modules import preprocessing
+
+# Status pemanasan per model: "loading", "ready", atau pesan error
+_status = {}
+_ready = threading.Event()
+_lock = threading.Lock()
+_warm_up_thread = None
+
+
+def get_model(model_name):
+    """
+    Mengambil model pengenalan wajah yang sudah dimuat.
+    DeepFace menyimpan model sebagai singleton, jadi pemanggilan berikutnya tidak memuat ulang bobot.
+    """
+    return DeepFace.build_model(model_name)
+
+
+def warm_up_model(model_name, detector_backend="opencv"):
+    """
+    Memuat model lalu menjalankan satu inferensi dummy agar graph TensorFlow sudah siap
+    sebelum request pertama datang.
+    """
+    model = get_model(model_name)
+    height, width = model.input_shape[1], model.input_shape[0]
+    dummy_image = np.zeros((height, width, 3), dtype=np.uint8)
+
+    # Inferensi dummy tanpa deteksi untuk memanaskan model embedding
+    DeepFace.represent(
+        img_path=dummy_image,
+        model_name=model_name,
+        detector_backend="skip",
+        enforce_detection=False
+    )
+    # Panaskan juga detektor wajah yang dipakai oleh endpoint
+    DeepFace.extract_faces(
+        img_path=dummy_image,
+        detector_backend=detector_backend,
+        enforce_detection=False
+    )
+
+
+def detect_face(img, detector_backend="opencv", align=True):
+    """
+    Mendeteksi dan menyelaraskan wajah pertama pada gambar.
+    Jika tidak ada wajah (enforce_detection=False), DeepFace mengembalikan seluruh gambar.
+
+    Returns:
+        np.ndarray: Potongan wajah RGB dalam skala [0, 1], atau None.
+    """
+    faces = DeepFace.extract_faces(
+        img_path=img,
+        detector_backend=detector_backend,
+        align=align,
+        enforce_detection=False
+    )
+    if not faces:
+        return None
+    return faces[0]["face"]
+
+
+def detect_faces(img, detector_backend="opencv", align=True):
+    """
+    Semua wajah yang benar-benar terdeteksi pada gambar, tanpa fallback seluruh gambar
+    yang dikembalikan DeepFace jika tidak ada wajah. Dipakai untuk pemeriksaan kualitas pendaftaran.
+
+    Returns:
+        list: Hasil DeepFace.extract_faces (dict "face", "facial_area", "confidence").
+    """
+    height, width = img.shape[:2]
+    faces = DeepFace.extract_faces(
+        img_path=img,
+        detector_backend=detector_backend,
+        align=align,
+        enforce_detection=False
+    )
+    return [
+        face for face in faces
+        if (face["facial_area"]["w"], face["facial_area"]["h"]) != (width, height)
+    ]
+
+
+def preprocess_face(face, model_name, normalization="base"):
+    """
+    Menyiapkan satu potongan wajah sebagai input model, sama seperti DeepFace.represent:
+    RGB -> BGR, resize dengan padding ke ukuran input model, lalu normalisasi.
+
+    Returns:
+        np.ndarray: Tensor berbentuk (1, tinggi, lebar, 3).
+    """
+    model = get_model(model_name)
+    target_size = model.input_shape
+    img = face[:, :, ::-1]
+    img = preprocessing.resize_image(img=img, target_size=(target_size[1], target_size[0]))
+    return preprocessing.normalize_input(img=img, normalization=normalization)
+
+
+def embed_faces(faces, model_name, normalization="base"):
+    """
+    Menghitung embedding banyak wajah dalam satu forward pass model.
+
+    Args:
+        faces (list): Potongan wajah hasil detect_face (RGB, [0, 1]).
+        model_name (str): Nama model DeepFace.
+
+    Returns:
+        np.ndarray: Matriks embedding float32 berbentuk (jumlah wajah, dimensi).
+    """
+    if not faces:
+        return np.zeros((0, 0), dtype=np.float32)
+    batch = np.concatenate([preprocess_face(face, model_name, normalization) for face in faces], axis=0)
+    return forward_batch(batch, model_name)
+
+
+def forward_batch(batch, model_name):
+    """
+    Menjalankan model pada tensor yang sudah dipreproses (hasil preprocess_face yang digabung).
+
+    Returns:
+        np.ndarray: Matriks embedding float32 berbentuk (ukuran batch, dimensi).
+    """
+    model = get_model(model_name)
+    keras_model = getattr(model, "model", None)
+    if hasattr(keras_model, "predict_on_batch"):
+        # Model Keras: satu panggilan untuk seluruh batch
+        return keras_model(batch, training=False).numpy().astype(np.float32)
+    # Model non-Keras (misalnya Dlib, SFace) hanya mendukung satu gambar per panggilan
+    return np.asarray([model.forward(batch[i:i + 1]) for i in range(len(batch))], dtype=np.float32)
+
+
+def warm_up(model_names, detector_backend="opencv", after=None):
+    """
+    Memanaskan semua model secara berurutan lalu menandai layanan siap.
+
+    Args:
+        model_names (list): Daftar nama model DeepFace yang akan dimuat.
+        detector_backend (str): Detektor wajah yang ikut dipanaskan.
+        after (callable): Opsional, dijalankan setelah semua model siap
+            (misalnya memuat index embedding) sebelum layanan dinyatakan siap.
+    """
+    for model_name in model_names:
+        with _lock:
+            _status[model_name] = "loading"
+        try:
+            print(f"Memanaskan model {model_name}...")
+            warm_up_model(model_name, detector_backend)
+            with _lock:
+                _status[model_name] = "ready"
+            print(f"Model {model_name} siap.")
+        except Exception as e:
+            print(f"Error: Gagal memanaskan model {model_name}. Detail: {e}")
+            with _lock:
+                _status[model_name] = f"error: {e}"
+
+    if after is not None:
+        try:
+            after()
+        except Exception as e:
+            print(f"Error: Gagal menjalankan langkah setelah pemanasan. Detail: {e}")
+
+    _ready.set()
+
+
+def start_warm_up(model_names, detector_backend="opencv", after=None):
+    """
+    Menjalankan warm_up di thread latar belakang (hanya sekali per proses)
+    agar server bisa langsung menerima request ke endpoint kesiapan.
+    """
+    global _warm_up_thread
+    with _lock:
+        if _warm_up_thread is not None:
+            return _warm_up_thread
+        # Hilangkan duplikat tetapi pertahankan urutan
+        model_names = list(dict.fromkeys(model_names))
+        for model_name in model_names:
+            _status[model_name] = "loading"
+        _warm_up_thread = threading.Thread(
+            target=warm_up,
+            args=(model_names, detector_backend, after),
+            name="model-warm-up",
+            daemon=True
+        )
+        _warm_up_thread.start()
+    return _warm_up_thread
+
+
+def is_ready():
+    """True jika semua model sudah selesai dipanaskan."""
+    return _ready.is_set()
+
+
+def status():
+    """Ringkasan status untuk endpoint kesiapan."""
+    with _lock:
+        models = dict(_status)
+    return {"ready": is_ready(), "models": models}
@@ -1,10 +1,46 @@
 import qi
-import requests
 import os
 import time
+from edge_filter import EdgeFilter, NO_FACE, TOO_SMALL, AT_EDGE, BLURRY, DUPLICATE
+from robot_client import default_client
+
+# Ganti dengan IP VM Compute Engine kamu lewat environment variable BASE_URL (dibaca robot_client)
+
+# Kalimat untuk frame yang ditolak pre-filter (tidak dikirim ke server)
+REJECT_MESSAGES = {
+    NO_FACE: "Saya tidak melihat wajah. Silakan menghadap kamera.",
+    TOO_SMALL: "Wajah anda terlalu jauh. Silakan mendekat.",
+    AT_EDGE: "Silakan berdiri di tengah, di depan kamera.",
+    BLURRY: "Fotonya buram. Silakan diam sebentar.",
+}
+
+# Pre-filter dibuat sekali dan dipakai ulang, supaya dedupe mengingat wajah sebelumnya
+# beserta jawaban server untuk wajah itu
+_edge_filter = None
+
+
+def get_edge_filter():
+    global _edge_filter
+    if _edge_filter is None:
+        try:
+            _edge_filter = EdgeFilter()
+        except Exception as e:
+            # Tanpa pre-filter, foto utuh tetap dikirim seperti sebelumnya
+            print("Pre-filter tidak tersedia:", e)
+            _edge_filter = False
+    return _edge_filter or None
+
+
+def respond(tts, data):
+    if data.get("status") == "recognized":
+        nama = data.get("name")
+        confidence = data.get("confidence", "N/A")
+        tts.say("Hallo %s, selamat datang kembali. Kepercayaan saya %s." % (nama, confidence))
+    elif data.get("status") == "unrecognized":
+        tts.say(data.get("message", "Maaf, wajah anda tidak saya kenali."))
+    else:
+        tts.say("Terjadi kesalahan pada server.")
 
-# Ganti dengan IP VM Compute Engine kamu
-BASE_URL = os.environ.get("BASE_URL", "http://localhost:8000")
 
 def main(session):
     tts = session.service("ALTextToSpeech")
@@ -18,25 +54,43 @@ def main(session):
     full_path = os.path.join(save_path, file_name)
     photo.setResolution(2)  # 640x480
     photo.takePicture(save_path, file_name)
+    image = None
+    result = None
+
+    # 2. Pre-filter di robot: hanya potongan wajah baru yang tajam yang dikirim
+    edge_filter = get_edge_filter()
+    if edge_filter is not None:
+        try:
+            result = edge_filter.process_file(full_path)
+        except Exception as e:
+            print("Error pre-filter:", e)
+            result = None
+        if result is not None:
+            print("Pre-filter:", result.reason, edge_filter.stats())
+            if result.reason == DUPLICATE:
+                # Wajah yang sama seperti barusan: ulangi jawaban untuk wajah itu, tanpa request
+                respond(tts, result.answer)
+                return
+            if not result.accepted and result.reason in REJECT_MESSAGES:
+                tts.say(REJECT_MESSAGES[result.reason])
+                return
+            if result.accepted:
+                image = (file_name, result.jpeg, 'image/jpeg')
     tts.say("Foto sudah diambil, saya akan mengirim ke server.")
 
-    # 2. Kirim ke endpoint /recognize
-    url = BASE_URL + "/recognize"
+    # 3. Kirim ke endpoint /recognize lewat session keep-alive bersama
+    client = default_client()
     try:
-        with open(full_path, 'rb') as f:
-            files = {'image': (file_name, f, 'image/jpeg')}
-            response = requests.post(url, files=files, timeout=20)
-            data = response.json()
-            print("Respons dari server:", data)
-
-            if data.get("status") == "recognized":
-                nama = data.get("name")
-                confidence = data.get("confidence", "N/A")
-                tts.say("Hallo %s, selamat datang kembali. Kepercayaan saya %s." % (nama, confidence))
-            elif data.get("status") == "unrecognized":
-                tts.say(data.get("message", "Maaf, wajah anda tidak saya kenali."))
-            else:
-                tts.say("Terjadi kesalahan pada server.")
+        if image is not None:
+            data = client.recognize(image[1], filename=image[0])
+        else:
+            data = client.recognize(full_path)
+        print("Respons dari server:", data)
+        print("Waktu per fase (ms):", client.last_timings)
+        # Hanya jawaban yang valid diingat; setelah error atau "tidak ada wajah" frame berikutnya dikirim lagi
+        if result is not None and result.accepted and data.get("status") in ("recognized", "unrecognized"):
+            edge_filter.commit(result, data)
+        respond(tts, data)
     except Exception as e:
         print("Error:", e)
         tts.say("Maaf, terjadi error saat mengirim ke server.")
@@ -0,0 +1,295 @@
+# register_queue.py
+import os
+import time
+import uuid
+import sqlite3
+import threading
+from collections import namedtuple
+import metrics
+
+# Antrean pendaftaran disimpan di SQLite agar semua worker Gunicorn melihat job yang sama:
+# job yang diterima satu worker bisa ditanyakan statusnya lewat worker lain
+REGISTER_JOBS_PATH = os.environ.get("REGISTER_JOBS_PATH", "register_jobs.sqlite3")
+# Thread pemroses per proses; sengaja kecil agar lonjakan pendaftaran tidak menghabiskan CPU pengenalan
+REGISTER_WORKERS = int(os.environ.get("REGISTER_WORKERS", "1"))
+# Jumlah job menunggu maksimal sebelum /register menolak dengan 503
+REGISTER_QUEUE_SIZE = int(os.environ.get("REGISTER_QUEUE_SIZE", "256"))
+# Lama job selesai disimpan (detik) agar statusnya masih bisa ditanyakan
+REGISTER_JOB_TTL = float(os.environ.get("REGISTER_JOB_TTL", "86400"))
+# Job "processing" tanpa heartbeat selama ini dianggap ditinggalkan proses yang mati dan diambil ulang.
+# Selama handler berjalan heartbeat diperbarui tiap timeout/3, jadi job yang lama tetap miliknya.
+REGISTER_JOB_TIMEOUT = float(os.environ.get("REGISTER_JOB_TIMEOUT", "300"))
+
+QUEUED = "queued"
+PROCESSING = "processing"
+SUCCESS = "success"
+ERROR = "error"
+
+# Job tanpa bytes gambar; gambar hanya dibaca saat job diproses
+Job = namedtuple("Job", ["job_id", "idempotency_key", "name", "status", "message", "created", "started", "finished"])
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    idempotency_key TEXT UNIQUE,
+    name TEXT NOT NULL,
+    image BLOB,
+    status TEXT NOT NULL,
+    message TEXT,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    claim TEXT,
+    heartbeat REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created);
+"""
+# Kolom yang ditambahkan setelah versi pertama antrean; file lama dimigrasi saat dibuka
+_ADDED_COLUMNS = (("claim", "TEXT"), ("heartbeat", "REAL"))
+_JOB_COLUMNS = "job_id, idempotency_key, name, status, message, created, started, finished"
+
+
+class QueueFull(Exception):
+    """Antrean pendaftaran penuh; klien sebaiknya mencoba lagi nanti."""
+
+
+class IdempotencyConflict(Exception):
+    """Idempotency key yang sama sudah dipakai untuk nama lain."""
+
+
+class RegistrationRejected(Exception):
+    """Gambar ditolak (misalnya tidak ada wajah); job selesai dengan status error tanpa diulang."""
+
+
+def job_to_dict(job):
+    """Representasi JSON job untuk respons /register dan /register/<job_id>."""
+    return {
+        "job_id": job.job_id,
+        "status": job.status,
+        "name": job.name,
+        "message": job.message,
+        "created": job.created,
+        "started": job.started,
+        "finished": job.finished,
+    }
+
+
+class RegistrationQueue:
+    """
+    Antrean pendaftaran wajah yang persisten.
+
+    /register hanya memanggil submit(): bytes gambar disimpan bersama job, lalu request langsung
+    selesai dengan job_id. Thread worker di setiap proses mengambil job tertua secara atomik
+    (BEGIN IMMEDIATE) dan menjalankan handler(job, image_bytes): pemeriksaan kualitas, unggah
+    ke GCS, embedding dan penambahan ke index. Statusnya bisa ditanyakan lewat get().
+
+    Idempotency key membuat pengiriman ulang request yang sama (misalnya karena timeout di robot)
+    mengembalikan job yang sudah ada, bukan mendaftarkan wajah dua kali.
+    """
+
+    def __init__(self, handler, path=REGISTER_JOBS_PATH, workers=REGISTER_WORKERS,
+                 max_queued=REGISTER_QUEUE_SIZE, ttl=REGISTER_JOB_TTL, timeout=REGISTER_JOB_TIMEOUT,
+                 poll_interval=1.0):
+        self.handler = handler
+        self.path = path
+        self.workers = max(1, workers)
+        self.max_queued = max_queued
+        self.ttl = ttl
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        # Autocommit; transaksi dibuka sendiri dengan BEGIN IMMEDIATE agar klaim job atomik antarproses
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for column, column_type in _ADDED_COLUMNS:
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def _transaction(self, work):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = work(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    @staticmethod
+    def _fetch(conn, where, params):
+        row = conn.execute(f"SELECT {_JOB_COLUMNS} FROM jobs WHERE {where}", params).fetchone()
+        return Job(*row) if row is not None else None
+
+    def submit(self, name, image_bytes, idempotency_key=None):
+        """
+        Memasukkan satu pendaftaran ke antrean.
+
+        Returns:
+            tuple: (Job, True jika job baru dibuat atau False jika idempotency key sudah dikenal)
+
+        Raises:
+            QueueFull: Jika sudah ada max_queued job yang menunggu.
+            IdempotencyConflict: Jika idempotency key sudah dipakai untuk nama lain.
+        """
+        def insert(conn):
+            if idempotency_key:
+                existing = self._fetch(conn, "idempotency_key = ?", (idempotency_key,))
+                if existing is not None:
+                    if existing.name != name:
+                        raise IdempotencyConflict(idempotency_key)
+                    return existing, False
+            queued = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()[0]
+            if queued >= self.max_queued:
+                raise QueueFull(queued)
+            job = Job(uuid.uuid4().hex, idempotency_key or None, name, QUEUED, None, time.time(), None, None)
+            conn.execute(
+                "INSERT INTO jobs (job_id, idempotency_key, name, image, status, created) VALUES (?, ?, ?, ?, ?, ?)",
+                (job.job_id, job.idempotency_key, name, sqlite3.Binary(image_bytes), QUEUED, job.created)
+            )
+            return job, True
+
+        job, created = self._transaction(insert)
+        if created:
+            self._wake.set()
+        return job, created
+
+    def get(self, job_id):
+        """Job dengan id tersebut, atau None."""
+        with self._lock:
+            return self._fetch(self._conn, "job_id = ?", (job_id,))
+
+    def stats(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+    def _claim(self):
+        """
+        Mengambil job tertua yang menunggu (atau yang heartbeat-nya berhenti karena prosesnya mati)
+        beserta gambarnya.
+
+        Returns:
+            tuple: (Job, bytes gambar, token klaim), atau (None, None, None) jika tidak ada job.
+        """
+        def claim(conn):
+            now = time.time()
+            conn.execute("DELETE FROM jobs WHERE finished IS NOT NULL AND finished < ?", (now - self.ttl,))
+            row = conn.execute(
+                "SELECT job_id, image FROM jobs WHERE status = ? "
+                "OR (status = ? AND COALESCE(heartbeat, started) < ?) ORDER BY created LIMIT 1",
+                (QUEUED, PROCESSING, now - self.timeout)
+            ).fetchone()
+            if row is None:
+                return None, None, None
+            token = uuid.uuid4().hex
+            conn.execute(
+                "UPDATE jobs SET status = ?, started = ?, heartbeat = ?, claim = ? WHERE job_id = ?",
+                (PROCESSING, now, now, token, row[0])
+            )
+            return self._fetch(conn, "job_id = ?", (row[0],)), bytes(row[1]), token
+
+        return self._transaction(claim)
+
+    def _heartbeat(self, job_id, token):
+        """Memperpanjang klaim; False jika job sudah diambil alih pemroses lain."""
+        cursor = self._transaction(lambda conn: conn.execute(
+            "UPDATE jobs SET heartbeat = ? WHERE job_id = ? AND claim = ? AND status = ?",
+            (time.time(), job_id, token, PROCESSING)
+        ))
+        return cursor.rowcount > 0
+
+    def _keep_alive(self, job_id, token, done):
+        while not done.wait(self.timeout / 3.0):
+            try:
+                if not self._heartbeat(job_id, token):
+                    print(f"Peringatan: Klaim job pendaftaran {job_id} sudah diambil alih pemroses lain.")
+                    return
+            except sqlite3.Error as e:
+                print(f"Error saat memperbarui heartbeat job pendaftaran {job_id}: {e}")
+
+    def _finish(self, job_id, token, status, message):
+        """Menyimpan hasil job; hanya jika klaimnya masih milik pemroses ini."""
+        # Bytes gambar tidak lagi dibutuhkan setelah job selesai
+        cursor = self._transaction(lambda conn: conn.execute(
+            "UPDATE jobs SET status = ?, message = ?, finished = ?, image = NULL "
+            "WHERE job_id = ? AND claim = ? AND status = ?",
+            (status, message, time.time(), job_id, token, PROCESSING)
+        ))
+        return cursor.rowcount > 0
+
+    def _process(self, job, image_bytes, token):
+        metrics.STAGE_SECONDS.observe(job.started - job.created, endpoint="register_job", stage="queue_wait")
+        metrics.begin_request("register_job")
+        # Heartbeat selama handler berjalan, agar unggahan yang lambat tidak diambil ulang pemroses lain
+        done = threading.Event()
+        keep_alive = threading.Thread(target=self._keep_alive, args=(job.job_id, token, done),
+                                      name=f"register-heartbeat-{job.job_id[:8]}", daemon=True)
+        keep_alive.start()
+        try:
+            message = self.handler(job, image_bytes)
+            status = SUCCESS
+        except RegistrationRejected as e:
+            message, status = str(e), ERROR
+        except Exception as e:
+            print(f"Error selama pendaftaran (job {job.job_id}): {e}")
+            message, status = f"Terjadi kesalahan internal: {e}", ERROR
+        finally:
+            done.set()
+            keep_alive.join()
+        metrics.end_request(status)
+        if not self._finish(job.job_id, token, status, message):
+            print(f"Peringatan: Hasil job pendaftaran {job.job_id} diabaikan karena klaimnya sudah diambil alih.")
+            return
+        print(f"Job pendaftaran {job.job_id} ({job.name}) selesai: {status}. "
+              f"Menunggu {job.started - job.created:.2f} s, diproses {time.time() - job.started:.2f} s.")
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.clear()
+            try:
+                job, image_bytes, token = self._claim()
+            except sqlite3.Error as e:
+                print(f"Error saat mengambil job pendaftaran: {e}")
+                job = None
+            if job is None:
+                # Job dari proses lain ditemukan lewat polling; job dari proses ini membangunkan langsung
+                self._wake.wait(self.poll_interval)
+                continue
+            try:
+                self._process(job, image_bytes, token)
+            except sqlite3.Error as e:
+                # Job tetap "processing" dan diambil ulang setelah timeout
+                print(f"Error saat menyimpan status job pendaftaran {job.job_id}: {e}")
+
+    def start(self):
+        """Memulai thread worker (sekali per proses)."""
+        if not self._threads:
+            self._stop.clear()
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"register-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+
+def read_idempotency_key(request):
+    """Idempotency key dari header Idempotency-Key, field form atau JSON 'idempotency_key'."""
+    key = request.headers.get("Idempotency-Key") or request.form.get("idempotency_key")
+    if not key:
+        data = request.get_json(silent=True)
+        if isinstance(data, dict):
+            key = data.get("idempotency_key")
+    return str(key)[:128] if key else None
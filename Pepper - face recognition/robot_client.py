@@ -0,0 +1,254 @@
+"""
+Client HTTP bersama untuk sisi robot (pepper_client, test_client, box capture_camera).
+
+- Satu requests.Session per proses: koneksi TCP dipakai ulang (keep-alive) antar request.
+- Timeout connect/read bisa diatur, dan percobaan ulang dengan backoff eksponensial untuk
+  kegagalan koneksi serta status 502/503/504.
+- Pendaftaran dikirim sebagai multipart biner, bukan base64 di JSON (payload ~33% lebih kecil),
+  dengan header Idempotency-Key sehingga percobaan ulang tidak mendaftarkan wajah dua kali.
+  Server hanya memasukkan pendaftaran ke antrean; statusnya ditanyakan lewat register_status()
+  atau ditunggu dengan wait_for_registration().
+- Setiap panggilan mencatat waktu per fase di `last_timings` (milidetik):
+    connect  : membuka koneksi TCP baru (0 jika koneksi keep-alive dipakai ulang)
+    upload   : mengirim request dan menunggu header respons, dikurangi connect dan server
+    server   : waktu proses di server (header Server-Timing "app")
+    download : membaca body respons
+    total    : seluruh panggilan, termasuk percobaan ulang
+
+Kompatibel dengan Python 2.7 di robot dan Python 3 di PC.
+
+Environment variable:
+    BASE_URL                (default http://localhost:8000)
+    CLIENT_CONNECT_TIMEOUT  detik (default 3)
+    CLIENT_READ_TIMEOUT     detik (default 20)
+    CLIENT_RETRIES          jumlah percobaan ulang (default 2)
+    CLIENT_BACKOFF          faktor backoff detik (default 0.3)
+"""
+import os
+import re
+import time
+import uuid
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from urllib3.util.retry import Retry
+    from urllib3.connection import HTTPConnection, HTTPSConnection
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+except ImportError:
+    # requests lama di robot membawa urllib3 sendiri
+    from requests.packages.urllib3.util.retry import Retry
+    from requests.packages.urllib3.connection import HTTPConnection, HTTPSConnection
+    from requests.packages.urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+BASE_URL = os.environ.get("BASE_URL", "http://localhost:8000")
+CONNECT_TIMEOUT = float(os.environ.get("CLIENT_CONNECT_TIMEOUT", "3"))
+READ_TIMEOUT = float(os.environ.get("CLIENT_READ_TIMEOUT", "20"))
+RETRIES = int(os.environ.get("CLIENT_RETRIES", "2"))
+BACKOFF = float(os.environ.get("CLIENT_BACKOFF", "0.3"))
+
+RETRY_STATUSES = (502, 503, 504)
+# Teks (path): unicode di Python 2, str di Python 3. Di Python 2 str adalah bytes.
+try:
+    _TEXT_TYPE = unicode
+except NameError:
+    _TEXT_TYPE = str
+_SERVER_TIMING = re.compile(r"(?:^|,)\s*app\s*;[^,]*?dur=([0-9.]+)")
+
+# Waktu connect dicatat per thread oleh koneksi di bawah
+_connect_times = threading.local()
+
+
+def _record_connect(connect):
+    def timed_connect(self):
+        started = time.time()
+        try:
+            return connect(self)
+        finally:
+            _connect_times.total = getattr(_connect_times, "total", 0.0) + time.time() - started
+    return timed_connect
+
+
+class _TimedHTTPConnection(HTTPConnection):
+    connect = _record_connect(HTTPConnection.connect)
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    connect = _record_connect(HTTPSConnection.connect)
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class TimedAdapter(HTTPAdapter):
+    """HTTPAdapter yang pool koneksinya mencatat lama connect()."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        HTTPAdapter.init_poolmanager(self, *args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimedHTTPConnectionPool,
+            "https": _TimedHTTPSConnectionPool,
+        }
+
+
+def _make_retry(retries, backoff):
+    # POST aman diulang: /recognize tidak mengubah apa pun dan /register memakai Idempotency-Key
+    methods = frozenset(["GET", "POST"])
+    kwargs = dict(total=retries, connect=retries, read=retries, status=retries,
+                  backoff_factor=backoff, status_forcelist=RETRY_STATUSES, raise_on_status=False)
+    try:
+        return Retry(allowed_methods=methods, **kwargs)
+    except TypeError:
+        # urllib3 < 1.26
+        return Retry(method_whitelist=methods, **kwargs)
+
+
+def server_time_ms(response):
+    """Waktu proses server dari header Server-Timing, atau None."""
+    match = _SERVER_TIMING.search(response.headers.get("Server-Timing", ""))
+    return float(match.group(1)) if match else None
+
+
+class FaceClient(object):
+    """
+    Client /recognize, /recognize_batch, /register dan /register/<job_id> dengan satu session keep-alive.
+
+    Args:
+        base_url (str): Alamat server, misalnya http://<IP_VM>:8000.
+        connect_timeout (float): Batas waktu membuka koneksi (detik).
+        read_timeout (float): Batas waktu menunggu respons (detik).
+        retries (int): Jumlah percobaan ulang.
+        backoff (float): Faktor backoff eksponensial (detik).
+    """
+
+    def __init__(self, base_url=BASE_URL, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 retries=RETRIES, backoff=BACKOFF):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        adapter = TimedAdapter(pool_connections=1, pool_maxsize=4, max_retries=_make_retry(retries, backoff))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.last_timings = {}
+
+    def _request(self, method, path, **kwargs):
+        url = self.base_url + path
+        _connect_times.total = 0.0
+        started = time.time()
+        response = self.session.request(method, url, timeout=self.timeout, stream=True, **kwargs)
+        headers_at = time.time()
+        content = response.content
+        finished = time.time()
+
+        connect = _connect_times.total
+        server = server_time_ms(response)
+        waited = (headers_at - started) * 1000.0
+        self.last_timings = {
+            "connect": round(connect * 1000.0, 1),
+            "upload": round(max(0.0, waited - connect * 1000.0 - (server or 0.0)), 1),
+            "server": server,
+            "download": round((finished - headers_at) * 1000.0, 1),
+            "total": round((finished - started) * 1000.0, 1),
+            "request_bytes": len(response.request.body or b""),
+            "response_bytes": len(content),
+        }
+        return response
+
+    @staticmethod
+    def _is_file(path):
+        try:
+            return os.path.isfile(path)
+        except (TypeError, ValueError):
+            # Misalnya isi gambar yang mengandung NUL
+            return False
+
+    @staticmethod
+    def _file(image, filename, content_type="image/jpeg"):
+        """image boleh berupa file object, bytes, atau path file."""
+        if hasattr(image, "read"):
+            return (filename or "face.jpg", image.read(), content_type)
+        if isinstance(image, bytearray):
+            image = bytes(image)
+        # Di Python 2 str adalah bytes: isi JPEG/PNG selalu mengandung NUL di header-nya,
+        # path tidak pernah, jadi potongan wajah kecil tetap dikirim sebagai data
+        is_path = isinstance(image, _TEXT_TYPE) or (
+            bytes is str and isinstance(image, bytes) and len(image) < 4096 and b"\0" not in image
+        )
+        if is_path:
+            if not FaceClient._is_file(image):
+                raise IOError("File gambar tidak ditemukan: %s" % image)
+            with open(image, "rb") as f:
+                return (filename or os.path.basename(image), f.read(), content_type)
+        if isinstance(image, bytes):
+            return (filename or "face.jpg", image, content_type)
+        raise IOError("Gambar harus berupa path, bytes, atau file object: %r" % type(image))
+
+    def recognize(self, image, filename=None):
+        """Mengirim satu gambar ke /recognize. Mengembalikan JSON respons."""
+        response = self._request("POST", "/recognize", files={"image": self._file(image, filename)})
+        return response.json()
+
+    def recognize_batch(self, images):
+        """images: list path atau (filename, bytes). Mengembalikan JSON respons."""
+        files = []
+        for image in images:
+            if isinstance(image, tuple):
+                files.append(("images", self._file(image[1], image[0])))
+            else:
+                files.append(("images", self._file(image, None)))
+        response = self._request("POST", "/recognize_batch", files=files)
+        return response.json()
+
+    def register(self, name, image, filename=None, idempotency_key=None):
+        """
+        Mendaftarkan wajah sebagai multipart biner (tanpa base64).
+
+        Server langsung menjawab dengan job_id (status "queued"); wajah baru bisa dikenali
+        setelah job berstatus "success".
+
+        Returns:
+            dict: JSON respons, berisi job_id dan status_url.
+        """
+        headers = {"Idempotency-Key": idempotency_key or uuid.uuid4().hex}
+        response = self._request("POST", "/register", data={"name": name},
+                                 files={"image": self._file(image, filename)}, headers=headers)
+        return response.json()
+
+    def register_status(self, job_id):
+        """Status job pendaftaran: queued, processing, success atau error."""
+        return self._request("GET", "/register/%s" % job_id).json()
+
+    def wait_for_registration(self, job_id, timeout=60.0, interval=0.5):
+        """
+        Menunggu job pendaftaran selesai (success atau error).
+        Mengembalikan JSON status terakhir; statusnya masih queued/processing jika timeout.
+        """
+        deadline = time.time() + timeout
+        while True:
+            status = self.register_status(job_id)
+            if status.get("status") not in ("queued", "processing") or time.time() >= deadline:
+                return status
+            time.sleep(interval)
+
+    def close(self):
+        self.session.close()
+
+
+_default_client = None
+_default_lock = threading.Lock()
+
+
+def default_client():
+    """FaceClient bersama per proses, dibuat saat pertama kali dipakai."""
+    global _default_client
+    with _default_lock:
+        if _default_client is None:
+            _default_client = FaceClient()
+        return _default_client
@@ -0,0 +1,386 @@
+# sync_worker.py
+import os
+import json
+import time
+import base64
+import hashlib
+import threading
+from contextlib import contextmanager
+from collections import namedtuple
+from gcs_transfer import default_engine
+import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows: manifest ditulis tanpa kunci antarproses
+    fcntl = None
+
+# Satu kumpulan perubahan hasil satu putaran sinkronisasi (path relatif dengan separator '/')
+ChangeSet = namedtuple("ChangeSet", ["version", "added", "updated", "removed"])
+
+# Snapshot database yang tidak pernah diubah setelah dibuat; diganti utuh setiap ada perubahan
+DatabaseSnapshot = namedtuple("DatabaseSnapshot", ["version", "files", "synced_at"])
+
+# Satu entri manifest: metadata blob di GCS beserta mtime file lokal hasil unduhannya
+ManifestEntry = namedtuple("ManifestEntry", ["generation", "size", "md5", "mtime_ns"])
+
+# Akhiran file sementara saat mengunduh, agar tidak pernah terbaca sebagai gambar setengah jadi
+TEMP_SUFFIX = ".part"
+
+# Lokasi manifest sinkronisasi; default di samping direktori database (bukan di dalamnya)
+SYNC_MANIFEST_PATH = os.environ.get("SYNC_MANIFEST_PATH")
+
+# Manifest disimpan setelah setiap potongan unduhan ini, sehingga sinkronisasi yang terputus
+# bisa dilanjutkan tanpa mengunduh ulang file yang sudah selesai
+_CHECKPOINT_EVERY = 64
+
+_UNKNOWN = ManifestEntry(None, None, None, None)
+
+
+def _temp_path(path):
+    """Path sementara unik per proses, karena beberapa worker server bisa menyinkronkan direktori yang sama."""
+    return f"{path}.{os.getpid()}{TEMP_SUFFIX}"
+
+
+def _md5_base64(data=None, path=None):
+    """Digest md5 dalam format GCS (base64), dari bytes atau dari isi file."""
+    hasher = hashlib.md5()
+    if path is not None:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                hasher.update(chunk)
+    else:
+        hasher.update(data)
+    return base64.b64encode(hasher.digest()).decode('ascii')
+
+
+@contextmanager
+def _file_lock(path):
+    """Kunci eksklusif antarproses (flock) selama blok berjalan."""
+    if fcntl is None:
+        yield
+        return
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _matches_file(entry, stat):
+    return stat is not None and entry.size == stat.st_size and entry.mtime_ns == stat.st_mtime_ns
+
+
+def _has_changes(changes):
+    return bool(changes.added or changes.updated or changes.removed)
+
+
+class SyncWorker:
+    """
+    Sinkronisasi GCS -> lokal di thread latar belakang.
+
+    - Menyimpan manifest persisten nama blob -> (generation, size, md5, mtime lokal)
+      sehingga hanya blob baru atau yang ditimpa yang diunduh. Blob yang ditimpa dengan
+      isi yang sama (md5 sama) hanya diperbarui generation-nya tanpa memicu embedding.
+    - Manifest disimpan bertahap selama unduhan, sehingga restart atau sinkronisasi yang
+      terputus melanjutkan dari file terakhir yang selesai tanpa os.walk penuh.
+      Setiap worker Gunicorn menjalankan SyncWorker sendiri pada direktori yang sama, jadi
+      penyimpanan manifest dikunci dan digabung dengan isi file yang ditulis worker lain.
+    - Setiap putaran yang menghasilkan perubahan menerbitkan ChangeSet ke pelanggan
+      dan mengganti snapshot database secara atomik.
+    - Request tidak pernah menunggu GCS; mereka cukup membaca snapshot terakhir.
+    """
+
+    def __init__(self, bucket_factory, local_path, interval=30.0, transfers=None,
+                 manifest_path=SYNC_MANIFEST_PATH):
+        """
+        Args:
+            bucket_factory (callable): Mengembalikan objek bucket (GCS atau LocalBucket).
+            local_path (str): Direktori database lokal.
+            interval (float): Jeda antar sinkronisasi dalam detik.
+            transfers (TransferEngine): Mesin unduhan paralel; default memakai mesin bersama proses.
+            manifest_path (str): File JSON manifest; default "<local_path>.manifest.json".
+        """
+        self.bucket_factory = bucket_factory
+        self.local_path = local_path
+        self.interval = interval
+        self.transfers = transfers
+        self.manifest_path = manifest_path or f"{os.path.normpath(local_path)}.manifest.json"
+        self._bucket = None
+        self._manifest = None
+        self._subscribers = []
+        self._sync_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.snapshot = DatabaseSnapshot(version=0, files={}, synced_at=None)
+
+    def subscribe(self, callback):
+        """Mendaftarkan callback(changes) yang dipanggil setelah setiap perubahan database."""
+        self._subscribers.append(callback)
+
+    def _get_bucket(self):
+        if self._bucket is None:
+            self._bucket = self.bucket_factory()
+        return self._bucket
+
+    def _local_file_path(self, name):
+        return os.path.join(self.local_path, name.replace('/', os.sep))
+
+    def _local_stat(self, name):
+        try:
+            return os.stat(self._local_file_path(name))
+        except FileNotFoundError:
+            return None
+
+    def _read_manifest_file(self):
+        """
+        Returns:
+            dict: Isi file manifest apa adanya (tanpa pemeriksaan file lokal).
+
+        Raises:
+            FileNotFoundError: Jika manifest belum ada.
+            OSError, ValueError: Jika manifest tidak bisa dibaca.
+        """
+        with open(self.manifest_path) as f:
+            data = json.load(f)
+        manifest = {}
+        for name, fields in data.get("files", {}).items():
+            try:
+                manifest[name] = ManifestEntry(**fields)
+            except TypeError:
+                manifest[name] = _UNKNOWN
+        return manifest
+
+    def _load_manifest(self):
+        """
+        Membaca manifest dari disk. Entri yang file lokalnya hilang atau berubah di luar
+        sinkronisasi (ukuran/mtime berbeda) ditandai tidak dikenal agar diunduh ulang.
+
+        Returns:
+            dict: Manifest, atau None jika belum ada atau tidak bisa dibaca.
+        """
+        try:
+            stored = self._read_manifest_file()
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f"Peringatan: Manifest {self.manifest_path} tidak bisa dibaca, membangun ulang. Detail: {e}")
+            return None
+        return {
+            name: entry if _matches_file(entry, self._local_stat(name)) else _UNKNOWN
+            for name, entry in stored.items()
+        }
+
+    def _save_manifest(self, manifest):
+        """
+        Menyimpan manifest secara atomik (file sementara per proses lalu os.replace).
+
+        Worker lain bisa sudah menyimpan entri yang tidak (atau belum) dikenal proses ini, jadi
+        isi file dibaca ulang di bawah kunci dan digabung: untuk setiap nama dipilih entri yang
+        cocok dengan file lokal saat ini (ukuran dan mtime), entri milik proses ini jika tidak
+        ada yang cocok, dan entri worker lain dibuang jika file lokalnya sudah tidak ada.
+        """
+        with _file_lock(f"{self.manifest_path}.lock"):
+            try:
+                stored = self._read_manifest_file()
+            except (OSError, ValueError):
+                stored = {}
+            merged = {}
+            for name in set(stored) | set(manifest):
+                ours, theirs = manifest.get(name), stored.get(name)
+                stat = self._local_stat(name)
+                if theirs is not None and not _matches_file(theirs, stat):
+                    theirs = None
+                if ours is not None and (theirs is None or _matches_file(ours, stat)):
+                    merged[name] = ours
+                elif theirs is not None:
+                    merged[name] = theirs
+
+            temp_path = _temp_path(self.manifest_path)
+            with open(temp_path, 'w') as f:
+                json.dump({"files": {name: entry._asdict() for name, entry in merged.items()}}, f)
+            os.replace(temp_path, self.manifest_path)
+
+    def _seed_manifest(self, remote):
+        """
+        Membangun manifest awal dari file yang sudah ada di disk (hanya jika belum ada manifest).
+        File lokal dengan ukuran dan md5 sama dengan blob di GCS dianggap sudah sesuai
+        sehingga migrasi ke manifest tidak mengunduh ulang seluruh bucket.
+        """
+        manifest = {}
+        for root, _, files in os.walk(self.local_path):
+            for name in files:
+                local_file = os.path.join(root, name)
+                if name.endswith(TEMP_SUFFIX):
+                    # Sisa unduhan yang terputus
+                    os.remove(local_file)
+                    continue
+                if name.endswith(".pkl"):
+                    continue
+                relative_path = os.path.relpath(local_file, self.local_path).replace('\\', '/')
+                blob = remote.get(relative_path)
+                stat = os.stat(local_file)
+                if (blob is not None and blob.size == stat.st_size
+                        and blob.md5_hash == _md5_base64(path=local_file)):
+                    manifest[relative_path] = ManifestEntry(blob.generation, blob.size, blob.md5_hash, stat.st_mtime_ns)
+                else:
+                    # Tidak dikenal: akan diunduh ulang atau dihapus pada putaran ini
+                    manifest[relative_path] = _UNKNOWN
+        return manifest
+
+    def _download(self, blob):
+        """
+        Returns:
+            ManifestEntry: Entri manifest untuk file yang baru diunduh.
+        """
+        destination_file_path = self._local_file_path(blob.name)
+        os.makedirs(os.path.dirname(destination_file_path), exist_ok=True)
+        temp_path = _temp_path(destination_file_path)
+        blob.download_to_filename(temp_path)
+        # Ganti file secara atomik agar pembaca tidak pernah melihat file setengah terunduh
+        os.replace(temp_path, destination_file_path)
+        return ManifestEntry(blob.generation, blob.size, blob.md5_hash, os.stat(destination_file_path).st_mtime_ns)
+
+    def sync_once(self):
+        """
+        Menjalankan satu putaran sinkronisasi.
+
+        Returns:
+            ChangeSet: Perubahan yang diterapkan (bisa kosong).
+        """
+        with self._sync_lock, metrics.stage("gcs_sync"):
+            os.makedirs(self.local_path, exist_ok=True)
+            remote = {}
+            for blob in self._get_bucket().list_blobs():
+                # Lewati "objek" folder yang ditandai dengan '/' di akhir nama
+                if blob.name.endswith('/'):
+                    continue
+                remote[blob.name] = blob
+
+            if self._manifest is None:
+                self._manifest = self._load_manifest()
+                if self._manifest is None:
+                    self._manifest = self._seed_manifest(remote)
+                    self._save_manifest(self._manifest)
+            manifest = dict(self._manifest)
+            dirty = False
+
+            added, updated, removed = [], [], []
+            to_download = []
+            for name, blob in remote.items():
+                entry = manifest.get(name)
+                if entry is not None and entry.generation == blob.generation:
+                    continue
+                if entry is not None and entry.generation is not None and entry.md5 == blob.md5_hash:
+                    # Ditimpa dengan isi yang sama: cukup catat generation baru, tanpa unduh dan embedding ulang
+                    manifest[name] = entry._replace(generation=blob.generation)
+                    dirty = True
+                    continue
+                to_download.append(blob)
+
+            if to_download:
+                print(f"Mengunduh {len(to_download)} file...")
+            # Unduhan berjalan paralel dengan percobaan ulang; yang tetap gagal dicoba lagi putaran berikutnya.
+            # Manifest disimpan per potongan agar sinkronisasi yang terputus bisa dilanjutkan.
+            engine = self.transfers or default_engine()
+            for start in range(0, len(to_download), _CHECKPOINT_EVERY):
+                for blob, entry, error in engine.map(self._download, to_download[start:start + _CHECKPOINT_EVERY]):
+                    if error is not None:
+                        print(f"Error: Gagal mengunduh {blob.name}. Detail: {error}")
+                        continue
+                    (updated if blob.name in manifest else added).append(blob.name)
+                    manifest[blob.name] = entry
+                self._save_manifest(manifest)
+
+            for name in set(manifest) - set(remote):
+                local_file = self._local_file_path(name)
+                if os.path.exists(local_file):
+                    print(f"Menghapus {local_file}...")
+                    os.remove(local_file)
+                del manifest[name]
+                removed.append(name)
+                dirty = True
+
+            if dirty:
+                self._save_manifest(manifest)
+            self._manifest = manifest
+            changes = ChangeSet(self.snapshot.version + 1, sorted(added), sorted(updated), sorted(removed))
+            if not _has_changes(changes):
+                self.snapshot = self.snapshot._replace(synced_at=time.time())
+                return changes._replace(version=self.snapshot.version)
+
+            print(f"Database berubah: {len(added)} baru, {len(updated)} diperbarui, {len(removed)} dihapus.")
+            self.snapshot = DatabaseSnapshot(version=changes.version, files=manifest, synced_at=time.time())
+
+        self._publish(changes)
+        return changes
+
+    def _publish(self, changes):
+        for callback in list(self._subscribers):
+            try:
+                callback(changes)
+            except Exception as e:
+                print(f"Error: Pelanggan sinkronisasi gagal memproses perubahan. Detail: {e}")
+
+    def register_upload(self, blob, data):
+        """
+        Mencatat blob yang baru saja diunggah oleh proses ini tanpa sinkronisasi penuh.
+        Isi blob (bytes yang sama dengan yang diunggah) ditulis ke database lokal,
+        generation-nya dicatat di manifest, dan perubahannya diterbitkan ke pelanggan
+        sehingga hanya wajah baru ini yang di-embed.
+
+        Returns:
+            ChangeSet: Perubahan yang diterbitkan (kosong jika sudah tercatat sebelumnya).
+        """
+        with self._sync_lock:
+            manifest = dict(self._manifest or {})
+            if blob.name in manifest and manifest[blob.name].generation == blob.generation:
+                return ChangeSet(self.snapshot.version, [], [], [])
+
+            destination_file_path = self._local_file_path(blob.name)
+            os.makedirs(os.path.dirname(destination_file_path), exist_ok=True)
+            temp_path = _temp_path(destination_file_path)
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, destination_file_path)
+
+            known = blob.name in manifest
+            manifest[blob.name] = ManifestEntry(
+                blob.generation, len(data), _md5_base64(data), os.stat(destination_file_path).st_mtime_ns
+            )
+            if self._manifest is not None:
+                self._manifest = manifest
+                self._save_manifest(manifest)
+            version = self.snapshot.version + 1
+            changes = ChangeSet(version, [] if known else [blob.name], [blob.name] if known else [], [])
+            self.snapshot = DatabaseSnapshot(version=version, files=manifest, synced_at=self.snapshot.synced_at)
+
+        self._publish(changes)
+        return changes
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.sync_once()
+            except Exception as e:
+                print(f"Error selama sinkronisasi latar belakang: {e}")
+                # Buat ulang klien pada putaran berikutnya
+                self._bucket = None
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def start(self):
+        """Memulai thread sinkronisasi (sekali per proses)."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="gcs-sync", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -1,8 +1,9 @@
 import requests
-import base64
 import os
+from robot_client import FaceClient, BASE_URL
 
-BASE_URL = os.environ.get("BASE_URL", "http://localhost:8000")
+# Satu session keep-alive untuk semua tes; waktu per fase dicetak setelah tiap request
+client = FaceClient(BASE_URL)
 
 def test_recognize(image_path):
     """
@@ -13,28 +14,43 @@ def test_recognize(image_path):
         return
 
     print(f"\n--- MENCOBA MENGENALI WAJAH DARI: {image_path} ---")
-    url = f"{BASE_URL}/recognize"
-    
-    with open(image_path, 'rb') as f:
-        files = {'image': (os.path.basename(image_path), f, 'image/jpeg')}
-        try:
-            response = requests.post(url, files=files)
-            response.raise_for_status()  # Akan error jika status code bukan 2xx
-            
-            data = response.json()
-            print("Respons dari server (JSON):", data)
-
-            if data.get("status") == "recognized":
-                nama = data.get("name")
-                confidence = data.get("confidence", "N/A") # Ambil skor confidence
-                print(f"\n>>> Output Aplikasi: Hallo {nama}, selamat datang kembali (Kepercayaan: {confidence})")
-            elif data.get("status") == "unrecognized":
-                print(f"\n>>> Output Aplikasi: {data.get('message')}")
-            else: # Menangani kemungkinan status error dari server
-                print(f"\n>>> Output Aplikasi: Terjadi kesalahan: {data.get('message')}")
-
-        except requests.exceptions.RequestException as e:
-            print(f"Error saat request: {e}")
+
+    try:
+        data = client.recognize(image_path)
+        print("Respons dari server (JSON):", data)
+        print("Waktu per fase (ms):", client.last_timings)
+
+        if data.get("status") == "recognized":
+            nama = data.get("name")
+            confidence = data.get("confidence", "N/A") # Ambil skor confidence
+            print(f"\n>>> Output Aplikasi: Hallo {nama}, selamat datang kembali (Kepercayaan: {confidence})")
+        elif data.get("status") == "unrecognized":
+            print(f"\n>>> Output Aplikasi: {data.get('message')}")
+        else: # Menangani kemungkinan status error dari server
+            print(f"\n>>> Output Aplikasi: Terjadi kesalahan: {data.get('message')}")
+
+    except requests.exceptions.RequestException as e:
+        print(f"Error saat request: {e}")
+
+
+def test_recognize_batch(image_paths):
+    """
+    Mengirim beberapa gambar sekaligus ke endpoint /recognize_batch.
+    """
+    image_paths = [path for path in image_paths if os.path.exists(path)]
+    if not image_paths:
+        print("Error: Tidak ada file gambar yang ditemukan untuk batch.")
+        return
+
+    print(f"\n--- MENCOBA MENGENALI {len(image_paths)} GAMBAR SEKALIGUS ---")
+
+    try:
+        data = client.recognize_batch(image_paths)
+        for path, result in zip(image_paths, data.get("results", [])):
+            print(f"{os.path.basename(path)}: {result}")
+        print("Waktu per fase (ms):", client.last_timings)
+    except requests.exceptions.RequestException as e:
+        print(f"Error saat request: {e}")
 
 
 def test_register(person_name, image_path):
@@ -46,22 +62,16 @@ def test_register(person_name, image_path):
         return
 
     print(f"\n--- MENDAFTARKAN WAJAH BARU: {person_name} DARI {image_path} ---")
-    url = f"{BASE_URL}/register"
-
-    # Baca gambar dan encode ke base64
-    with open(image_path, "rb") as image_file:
-        encoded_string = base64.b64encode(image_file.read()).decode('utf-8')
-
-    payload = {
-        "name": person_name,
-        "image": encoded_string
-    }
 
+    # Gambar dikirim sebagai multipart biner (tanpa base64)
     try:
-        response = requests.post(url, json=payload)
-        response.raise_for_status()
+        data = client.register(person_name, image_path)
         print("Respons dari server:")
-        print(response.json())
+        print(data)
+        print("Waktu per fase (ms):", client.last_timings)
+        # Pendaftaran diproses di latar belakang; tunggu sampai job selesai
+        if data.get("job_id"):
+            print("Status akhir pendaftaran:", client.wait_for_registration(data["job_id"]))
     except requests.exceptions.RequestException as e:
         print(f"Error saat request: {e}")
 
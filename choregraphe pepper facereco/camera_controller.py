@@ -0,0 +1,225 @@
+# camera_controller.py
+"""
+Adaptive camera resolution, frame rate and detection scale for pepper_agent.
+
+The controller walks a ladder of capture settings ordered by how many pixels the face
+detector sees. After each recognition result it looks at two signals:
+
+- latency: EWMA of the recognition stage; above the budget it steps down the ladder.
+- face size: height of the smallest detected face in detection pixels; too small means
+  a distant face (step up), comfortably large means the faces are close and a cheaper
+  setting still finds them (step down). With no faces for a while it steps up so
+  distant faces can be found at all, as long as the latency budget allows it.
+
+A change needs `patience` agreeing observations and is followed by a `cooldown`, so the
+camera is not resubscribed back and forth.
+
+The frame rate runs at the level's max_fps unless capture is the bottleneck. getImageRemote()
+blocks until the next frame, so its duration mostly measures the subscribed rate itself and
+says nothing about spare capacity. Instead the controller compares the interval between
+delivered frames with the subscribed rate: only when frames arrive clearly slower than
+subscribed is the rate capped to what was delivered. After `probe_interval` seconds the cap
+is lifted again, so the rate climbs back once the link recovers.
+"""
+import time
+import threading
+from collections import namedtuple
+
+# ALVideoDevice resolution ids (vision_definitions.kQQVGA / kQVGA / kVGA)
+RESOLUTIONS = {
+    0: (160, 120),
+    1: (320, 240),
+    2: (640, 480),
+}
+
+# (resolution id, detection scale, max fps), ordered by detection pixels
+Level = namedtuple("Level", ["resolution", "scale", "max_fps"])
+DEFAULT_LEVELS = (
+    Level(0, 1.0, 30),
+    Level(1, 0.5, 15),
+    Level(1, 0.75, 15),
+    Level(1, 1.0, 15),
+    Level(2, 0.75, 10),
+    Level(2, 1.0, 10),
+)
+# Level 1 is the previous hardcoded setting (kQVGA, scale 0.5)
+DEFAULT_START_LEVEL = 1
+
+Settings = namedtuple("Settings", ["resolution", "width", "height", "scale", "fps"])
+
+
+def detection_size(level):
+    width, height = RESOLUTIONS[level.resolution]
+    return int(round(width * level.scale)), int(round(height * level.scale))
+
+
+class AdaptiveCameraController(object):
+    """
+    Args:
+        latency_budget (float): Target recognition latency per frame (seconds).
+        min_face_px (int): Smallest face height (detection pixels) the detector finds reliably.
+        large_face_ratio (float): Faces taller than min_face_px * ratio at the next lower level
+            count as close enough to step down.
+        min_fps (int): Lowest capture frame rate.
+        patience (int): Agreeing observations required before a change.
+        cooldown (float): Seconds after a change during which no other change is made.
+        idle_frames (int): Results without faces before stepping up to look for distant faces.
+        levels (tuple): Capture ladder (Level tuples, cheapest first).
+        start_level (int): Index of the initial level.
+        alpha (float): EWMA smoothing factor for the latency measurements.
+        capture_tolerance (float): Delivered frame rate this far below the subscribed rate
+            (as a fraction) counts as a capture bottleneck.
+        probe_interval (float): Seconds a capture cap is kept before trying max_fps again.
+        min_frames (int): Frames measured at the current rate before judging the capture.
+    """
+
+    def __init__(self, latency_budget=0.15, min_face_px=40, large_face_ratio=2.0, min_fps=5, patience=3,
+                 cooldown=2.0, idle_frames=30, levels=DEFAULT_LEVELS, start_level=DEFAULT_START_LEVEL, alpha=0.3,
+                 capture_tolerance=0.15, probe_interval=10.0, min_frames=5):
+        self.latency_budget = latency_budget
+        self.min_face_px = min_face_px
+        self.large_face_ratio = large_face_ratio
+        self.min_fps = min_fps
+        self.patience = patience
+        self.cooldown = cooldown
+        self.idle_frames = idle_frames
+        self.levels = tuple(levels)
+        self.alpha = alpha
+        self.capture_tolerance = capture_tolerance
+        self.probe_interval = probe_interval
+        self.min_frames = min_frames
+        self.level = max(0, min(start_level, len(self.levels) - 1))
+        self.fps = self.levels[self.level].max_fps
+        self.recognize_latency = None
+        self.capture_latency = None
+        self.frame_interval = None
+        # Frame rate the capture delivered when it was the bottleneck; None while it keeps up
+        self.capture_fps = None
+        self.changes = 0
+        self._lock = threading.Lock()
+        self._vote = 0
+        self._votes = 0
+        self._idle = 0
+        self._changed_at = 0.0
+        self._capped_at = 0.0
+        self._last_frame = None
+        self._frames = 0
+
+    @property
+    def scale(self):
+        return self.levels[self.level].scale
+
+    def settings(self):
+        level = self.levels[self.level]
+        width, height = RESOLUTIONS[level.resolution]
+        return Settings(level.resolution, width, height, level.scale, self.fps)
+
+    def _ewma(self, current, sample):
+        return sample if current is None else current + self.alpha * (sample - current)
+
+    def observe_capture(self, latency, now=None):
+        """Records one getImageRemote() call that returned a frame at `now` (capture thread)."""
+        now = time.time() if now is None else now
+        with self._lock:
+            self.capture_latency = self._ewma(self.capture_latency, latency)
+            if self._last_frame is not None:
+                self.frame_interval = self._ewma(self.frame_interval, now - self._last_frame)
+                self._frames += 1
+            self._last_frame = now
+
+    def _reset_capture(self):
+        # Intervals measured at the old rate or resolution say little about the new one
+        self.frame_interval = None
+        self._last_frame = None
+        self._frames = 0
+
+    def _update_capture_cap(self, now):
+        if self._frames < self.min_frames or not self.frame_interval:
+            return
+        delivered = 1.0 / self.frame_interval
+        if delivered < self.fps * (1.0 - self.capture_tolerance):
+            # Frames arrive clearly slower than subscribed: capture (transfer) is the bottleneck
+            self.capture_fps = max(1, int(delivered))
+            self._capped_at = now
+        elif self.capture_fps is not None and now - self._capped_at >= self.probe_interval:
+            # Keeping up at the capped rate; try the full rate again
+            self.capture_fps = None
+
+    def _fps_for(self, level):
+        fps = level.max_fps
+        if self.capture_fps is not None:
+            fps = min(fps, self.capture_fps)
+        return max(self.min_fps, fps)
+
+    def _decide(self, face_heights):
+        """Returns -1 (cheaper), +1 (more detail) or 0 for one observation."""
+        if self.recognize_latency > self.latency_budget:
+            return -1
+        if not face_heights:
+            self._idle += 1
+            return 1 if self._idle >= self.idle_frames else 0
+        self._idle = 0
+
+        # Face heights are fractions of the frame height, so they carry across levels
+        smallest = min(face_heights)
+        _, det_height = detection_size(self.levels[self.level])
+        if smallest * det_height < self.min_face_px:
+            return 1
+        if self.level > 0:
+            _, lower_height = detection_size(self.levels[self.level - 1])
+            if smallest * lower_height >= self.min_face_px * self.large_face_ratio:
+                return -1
+        return 0
+
+    def observe(self, latency, face_heights, now=None):
+        """
+        Feeds one recognition result.
+
+        Args:
+            latency (float): Recognition latency of the result (seconds).
+            face_heights (list): Face heights as fractions of the frame height.
+
+        Returns:
+            Settings or None: The new settings when they changed, otherwise None.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            self.recognize_latency = self._ewma(self.recognize_latency, latency)
+            self._update_capture_cap(now)
+            vote = self._decide(face_heights)
+            level = self.level
+            if vote and now - self._changed_at >= self.cooldown:
+                self._votes = self._votes + 1 if vote == self._vote else 1
+                self._vote = vote
+                if self._votes >= self.patience:
+                    level = max(0, min(self.level + vote, len(self.levels) - 1))
+                    self._votes = 0
+                    self._idle = 0
+            elif not vote:
+                self._votes = 0
+
+            fps = self._fps_for(self.levels[level])
+            if level == self.level and (fps == self.fps or now - self._changed_at < self.cooldown):
+                return None
+            if level != self.level:
+                # Latency and capture capacity measured at the old level say little about the new one
+                self.recognize_latency = None
+                self.capture_fps = None
+            self._reset_capture()
+            self.level = level
+            self.fps = fps
+            self._changed_at = now
+            self.changes += 1
+            return self.settings()
+
+    def stats(self):
+        settings = self.settings()
+        return {
+            "resolution": "%dx%d" % (settings.width, settings.height),
+            "scale": settings.scale,
+            "fps": settings.fps,
+            "recognize_ms": round(self.recognize_latency * 1000, 1) if self.recognize_latency else None,
+            "capture_ms": round(self.capture_latency * 1000, 1) if self.capture_latency else None,
+            "delivered_fps": round(1.0 / self.frame_interval, 1) if self.frame_interval else None,
+            "changes": self.changes,
+        }
@@ -1,7 +1,7 @@
 import time
 import sys
 import os
-# Note: 'requests' and 'json' are imported after the sys.path modification
+# Note: 'requests' is imported after the sys.path modification
 
 class MyClass(GeneratedClass):
     def __init__(self):
@@ -14,6 +14,10 @@ class MyClass(GeneratedClass):
         # The original record folder is fine, as it's a known path on the robot
         self.recordFolder = "/home/nao/recordings/cameras/"
         self.tts = None # Initialize tts proxy
+        self.edgeFilter = None # Created on the first start, kept so answered faces are remembered
+        self.client = None # Shared keep-alive HTTP client, kept across starts
+        # The static IP of your GCP VM instance
+        self.apiBase = "http://<YOUR_STATIC_IP>:8000" # IMPORTANT: Replace with your actual IP
 
     def onLoad(self):
         self.bIsRunning = False
@@ -27,6 +31,15 @@ class MyClass(GeneratedClass):
     def onUnload(self):
         pass
 
+    def respond(self, data):
+        # /recognize answers with 'status' and 'name'
+        if data.get('status') == 'unrecognized':
+            self.tts.say("I don't believe we have met before.")
+        else:
+            # Replace underscores with spaces for more natural speech
+            friendly_name = data.get('name', 'someone new').replace('_', ' ')
+            self.tts.say("Hello, " + friendly_name)
+
     def onInput_onStart(self):
         # === START: DYNAMIC LIBRARY LOADING ===
         # This block must come first to enable the 'requests' import.
@@ -36,19 +49,40 @@ class MyClass(GeneratedClass):
             if lib_path not in sys.path:
                 sys.path.append(lib_path)
             import requests
-            import json
         except Exception as e:
             self.logger.error("Failed to import requests library: %s" % str(e))
             self.tts.say("I have a problem with my communication module.")
             self.onStopped()
             return
+        # Optional on-robot pre-filter (copy edge_filter.py from the server folder into lib/).
+        # Without it the full photo is sent, as before.
+        if self.edgeFilter is None:
+            try:
+                from edge_filter import EdgeFilter
+                self.edgeFilter = EdgeFilter()
+            except Exception as e:
+                self.logger.warning("Edge pre-filter unavailable, sending full photos: %s" % str(e))
+                self.edgeFilter = False
+        # Optional shared client (copy robot_client.py into lib/): keeps the connection open
+        # between starts and retries with backoff. Without it a plain requests.post is used.
+        if self.client is None:
+            try:
+                from robot_client import FaceClient
+                self.client = FaceClient(self.apiBase)
+            except Exception as e:
+                self.logger.warning("Shared HTTP client unavailable, using requests.post: %s" % str(e))
+                self.client = False
         # === END: DYNAMIC LIBRARY LOADING ===
 
         if(self.bIsRunning):
             return
         self.bIsRunning = True
 
-        resolution = self.resolutionMap
+        # setResolution() takes one resolution id, not the whole map
+        try:
+            resolution = self.resolutionMap[self.getParameter("Resolution")]
+        except Exception:
+            resolution = self.resolutionMap['640 x 480']
         cameraID = self.cameraMap[self.getParameter("Camera")]
         fileName = self.getParameter("File Name") # e.g., "test"
 
@@ -64,34 +98,54 @@ class MyClass(GeneratedClass):
             # The image is now saved. Let's send it to the API.
             image_filename = fileName + ".jpg"
             image_path = os.path.join(self.recordFolder, image_filename)
-            
-            # The static IP of your GCP VM instance
-            api_url = "http://<YOUR_STATIC_IP>:8000/recognize" # IMPORTANT: Replace with your actual IP
+            api_url = self.apiBase + "/recognize"
 
             if not os.path.exists(image_path):
                 self.logger.error("Image file not found at: %s" % image_path)
                 self.tts.say("I couldn't find the picture I just took.")
             else:
                 try:
+                    # Only a sharp, new, centred face is worth a round trip; send just its crop
+                    payload = None
+                    result = None
+                    if self.edgeFilter:
+                        result = self.edgeFilter.process_file(image_path)
+                        self.logger.info("Pre-filter: %s %s" % (result.reason, self.edgeFilter.stats()))
+                        if result.reason == "duplicate":
+                            # Same face as a moment ago: repeat the answer given for that face, without a request
+                            self.respond(result.answer)
+                            self.bIsRunning = False
+                            self.onStopped()
+                            return
+                        if not result.accepted:
+                            self.tts.say("Please look straight at me and hold still.")
+                            self.bIsRunning = False
+                            self.onStopped()
+                            return
+                        payload = result.jpeg
+
                     self.tts.say("Let me see who you are.")
-                    with open(image_path, 'rb') as img_file:
-                        files = {'image': (image_filename, img_file, 'image/jpeg')}
-                        # Send the request with a timeout
-                        response = requests.post(api_url, files=files, timeout=20)
+                    if self.client:
+                        data = self.client.recognize(payload if payload is not None else image_path, image_filename)
+                        self.logger.info("Phase timings (ms): %s" % self.client.last_timings)
+                    else:
+                        with open(image_path, 'rb') as img_file:
+                            files = {'image': (image_filename, payload if payload is not None else img_file, 'image/jpeg')}
+                            # Send the request with a timeout
+                            response = requests.post(api_url, files=files, timeout=20)
+                        data = response.json() if response.status_code == 200 else None
+                        if data is None:
+                            self.logger.error("API Error: Status %d, Response: %s" % (response.status_code, response.text))
 
                     # Process the response
-                    if response.status_code == 200:
-                        data = response.json()
-                        identity = data.get('identity', 'someone new')
-                        if identity == 'unknown':
-                            self.tts.say("I don't believe we have met before.")
-                        else:
-                            # Replace underscores with spaces for more natural speech
-                            friendly_name = identity.replace('_', ' ')
-                            self.tts.say("Hello, " + friendly_name)
-                    else:
-                        self.logger.error("API Error: Status %d, Response: %s" % (response.status_code, response.text))
+                    if data is None or data.get('status') not in ('recognized', 'unrecognized'):
+                        self.logger.error("API Error: %s" % data)
                         self.tts.say("I'm having trouble connecting to my brain.")
+                    else:
+                        # Only a valid answer is remembered, so a failed request is retried on the next frame
+                        if result is not None:
+                            self.edgeFilter.commit(result, data)
+                        self.respond(data)
 
                 except requests.exceptions.RequestException as e:
                     self.logger.error("Network request failed: %s" % str(e))
@@ -0,0 +1,162 @@
+# face_tracker.py
+"""
+Lightweight IoU/centroid tracker for face boxes.
+
+Each track caches the encoding and identity computed for it, so a face that stays
+in front of the robot is encoded once instead of on every processed frame. A track
+is (re)encoded only when it is new, when its box has drifted away from where it was
+last encoded, or when its cached result is older than max_age seconds.
+"""
+import time
+import threading
+import numpy as np
+
+
+def box_iou(boxes_a, boxes_b):
+    """Pairwise IoU between two arrays of (top, right, bottom, left) boxes."""
+    a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    top = np.maximum(a[:, None, 0], b[None, :, 0])
+    right = np.minimum(a[:, None, 1], b[None, :, 1])
+    bottom = np.minimum(a[:, None, 2], b[None, :, 2])
+    left = np.maximum(a[:, None, 3], b[None, :, 3])
+    intersection = np.clip(right - left, 0, None) * np.clip(bottom - top, 0, None)
+    area_a = (a[:, 1] - a[:, 3]) * (a[:, 2] - a[:, 0])
+    area_b = (b[:, 1] - b[:, 3]) * (b[:, 2] - b[:, 0])
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return np.where(union > 0, intersection / np.maximum(union, 1e-6), 0.0)
+
+
+def box_centroids(boxes):
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    return np.stack([(boxes[:, 1] + boxes[:, 3]) / 2, (boxes[:, 0] + boxes[:, 2]) / 2], axis=1)
+
+
+class Track(object):
+    def __init__(self, track_id, box):
+        self.track_id = track_id
+        self.box = tuple(box)
+        self.missed = 0
+        self.name = None
+        self.encoding = None
+        # Box and time at which encoding/name were computed
+        self.encoded_box = None
+        self.encoded_at = 0.0
+
+
+class FaceTracker(object):
+    """
+    Args:
+        iou_threshold (float): Minimum IoU to associate a detection with a track.
+        centroid_threshold (float): Fallback association when IoU is too low: maximum
+            centroid distance as a fraction of the track's box width.
+        drift_iou (float): Re-encode when IoU between the current box and the box at the
+            last encoding drops below this.
+        max_age (float): Re-encode when the cached result is older than this (seconds).
+        max_missed (int): Frames a track may go undetected before it is dropped.
+    """
+
+    def __init__(self, iou_threshold=0.3, centroid_threshold=0.5, drift_iou=0.5, max_age=2.0, max_missed=5):
+        self.iou_threshold = iou_threshold
+        self.centroid_threshold = centroid_threshold
+        self.drift_iou = drift_iou
+        self.max_age = max_age
+        self.max_missed = max_missed
+        self.tracks = []
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.encoded = 0
+        self.reused = 0
+
+    def _associate(self, boxes):
+        """Greedy matching by IoU, then by centroid distance for the leftovers."""
+        matches = {}
+        if not self.tracks or not len(boxes):
+            return matches
+        track_boxes = [track.box for track in self.tracks]
+        iou = box_iou(track_boxes, boxes)
+        for flat in np.argsort(-iou, axis=None):
+            t, d = np.unravel_index(flat, iou.shape)
+            if iou[t, d] < self.iou_threshold:
+                break
+            if t in matches.values() or d in matches:
+                continue
+            matches[d] = t
+
+        free_tracks = [t for t in range(len(self.tracks)) if t not in matches.values()]
+        free_boxes = [d for d in range(len(boxes)) if d not in matches]
+        if free_tracks and free_boxes:
+            track_centroids = box_centroids([track_boxes[t] for t in free_tracks])
+            box_centers = box_centroids([boxes[d] for d in free_boxes])
+            distances = np.linalg.norm(track_centroids[:, None] - box_centers[None, :], axis=2)
+            widths = np.asarray([track_boxes[t][1] - track_boxes[t][3] for t in free_tracks], dtype=np.float32)
+            for flat in np.argsort(distances, axis=None):
+                i, j = np.unravel_index(flat, distances.shape)
+                t, d = free_tracks[i], free_boxes[j]
+                if distances[i, j] > self.centroid_threshold * max(widths[i], 1.0):
+                    break
+                if t in matches.values() or d in matches:
+                    continue
+                matches[d] = t
+        return matches
+
+    def update(self, boxes, now=None):
+        """
+        Associates this frame's detections with tracks.
+
+        Returns:
+            tuple: (tracks in the same order as boxes, indices of boxes that need encoding)
+        """
+        now = time.time() if now is None else now
+        boxes = [tuple(box) for box in boxes]
+        with self._lock:
+            matches = self._associate(boxes)
+            matched_tracks = set(matches.values())
+
+            for t, track in enumerate(self.tracks):
+                if t not in matched_tracks:
+                    track.missed += 1
+
+            result = []
+            needs_encoding = []
+            for d, box in enumerate(boxes):
+                if d in matches:
+                    track = self.tracks[matches[d]]
+                    track.box = box
+                    track.missed = 0
+                else:
+                    track = Track(self._next_id, box)
+                    self._next_id += 1
+                    self.tracks.append(track)
+                result.append(track)
+                if self._is_stale(track, now):
+                    needs_encoding.append(d)
+
+            self.tracks = [track for track in self.tracks if track.missed <= self.max_missed]
+            self.encoded += len(needs_encoding)
+            self.reused += len(boxes) - len(needs_encoding)
+            return result, needs_encoding
+
+    def _is_stale(self, track, now):
+        if track.encoded_box is None:
+            return True
+        if now - track.encoded_at > self.max_age:
+            return True
+        return box_iou([track.box], [track.encoded_box])[0, 0] < self.drift_iou
+
+    def set_result(self, track, encoding, name, now=None):
+        """Caches the encoding and identity computed for a track."""
+        with self._lock:
+            track.encoding = encoding
+            track.name = name
+            track.encoded_box = track.box
+            track.encoded_at = time.time() if now is None else now
+
+    def invalidate(self):
+        """Forces every track to be re-encoded (for example after reloading known encodings)."""
+        with self._lock:
+            for track in self.tracks:
+                track.encoded_box = None
+
+    def stats(self):
+        return {"tracks": len(self.tracks), "encoded": self.encoded, "reused": self.reused}
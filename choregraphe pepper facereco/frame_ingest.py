@@ -0,0 +1,76 @@
+# frame_ingest.py
+"""
+Zero-copy frame ingestion for ALVideoDevice images.
+
+getImageRemote() returns [width, height, layers, colorspace, sec, usec, data, ...].
+wrap_frame() exposes `data` as a read-only (height, width, layers) NumPy view without
+copying it. FrameBuffers owns preallocated scratch arrays for the downscaled detection
+frame and the BGR display frame so the steady state allocates nothing per frame.
+"""
+import threading
+import numpy as np
+import cv2
+
+
+def wrap_frame(result):
+    """
+    Wraps the image buffer of a getImageRemote() result as a NumPy view (no copy).
+
+    Returns:
+        np.ndarray: uint8 array of shape (height, width, layers), or None if there is no data.
+    """
+    if result is None or result[6] is None:
+        return None
+    width, height, layers = result[0], result[1], result[2]
+    return np.frombuffer(result[6], dtype=np.uint8).reshape(height, width, layers)
+
+
+def _scaled_size(image, scale):
+    height, width = image.shape[:2]
+    return int(round(width * scale)), int(round(height * scale))
+
+
+class FrameBuffers(object):
+    """
+    Preallocated scratch buffers, sized from the frames passed in.
+
+    Buffers are per thread: each recognition worker gets its own downscale buffer and
+    the renderer its own BGR/display buffers, so no two threads ever write the same array.
+    Callers must finish with a buffer before the same thread asks for it again. A buffer
+    is only reallocated when the camera resolution or detection scale changes.
+    """
+
+    def __init__(self, width, height, scale=0.5, display_scale=0.75, channels=3):
+        self.width = width
+        self.height = height
+        self.scale = scale
+        self.display_scale = display_scale
+        self.channels = channels
+        self._local = threading.local()
+
+    def _buffer(self, name, shape):
+        buffer = getattr(self._local, name, None)
+        if buffer is None or buffer.shape != shape:
+            buffer = np.empty(shape, dtype=np.uint8)
+            setattr(self._local, name, buffer)
+        return buffer
+
+    def downscale(self, image, scale=None):
+        """Resizes into this thread's detection buffer (scale defaults to self.scale)."""
+        size = _scaled_size(image, self.scale if scale is None else scale)
+        dst = self._buffer("small", (size[1], size[0], self.channels))
+        return cv2.resize(image, size, dst=dst)
+
+    def to_bgr(self, image):
+        """RGB -> BGR into this thread's display buffer (writable, so it can be drawn on)."""
+        dst = self._buffer("bgr", image.shape[:2] + (self.channels,))
+        return cv2.cvtColor(image, cv2.COLOR_RGB2BGR, dst=dst)
+
+    def display(self, image):
+        """Resizes into this thread's window-sized buffer."""
+        height, width = image.shape[:2]
+        # Window size stays fixed when the camera resolution changes
+        scale = self.display_scale * self.width / float(width)
+        size = (int(round(width * scale)), int(round(height * scale)))
+        dst = self._buffer("display", (size[1], size[0], self.channels))
+        return cv2.resize(image, size, dst=dst)
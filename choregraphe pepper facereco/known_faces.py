@@ -0,0 +1,188 @@
+# known_faces.py
+"""
+Compact known-encodings store for pepper_agent.
+
+One file holds the name table and a float32 encoding matrix:
+
+    b"KFS1" | uint32 count | uint32 dim | uint32 names_len | names (UTF-8 JSON) | padding | float32[count, dim]
+
+The matrix is memory-mapped on load, so opening a large store is instant and pages are
+shared with any other process using the same file. Matching all faces of a frame against
+all known encodings is a single matrix operation.
+
+The enrolment tool still writes the legacy encodings_names/encodings pickles; KnownFaceStore
+re-converts them whenever either pickle is newer than the store. To convert by hand:
+    python known_faces.py convert --names encodings_names --encodings encodings --out known_faces.bin
+"""
+import os
+import json
+import struct
+import pickle
+import argparse
+import threading
+import numpy as np
+
+MAGIC = b"KFS1"
+_HEADER = struct.Struct("<4sIII")
+_ALIGN = 16
+
+
+def save_store(path, names, encodings):
+    """Writes names and encodings atomically (temporary file, then os.replace)."""
+    matrix = np.ascontiguousarray(np.asarray(encodings, dtype=np.float32).reshape(len(names), -1))
+    names_blob = json.dumps(list(names)).encode("utf-8")
+    header = _HEADER.pack(MAGIC, matrix.shape[0], matrix.shape[1], len(names_blob))
+    padding = (-(len(header) + len(names_blob))) % _ALIGN
+
+    temp_path = "%s.%d.tmp" % (path, os.getpid())
+    with open(temp_path, "wb") as f:
+        f.write(header)
+        f.write(names_blob)
+        f.write(b"\0" * padding)
+        f.write(matrix.tobytes())
+    os.replace(temp_path, path)
+
+
+def load_store(path, mmap=True):
+    """Returns a KnownFaces snapshot; the matrix is memory-mapped when mmap is True."""
+    with open(path, "rb") as f:
+        magic, count, dim, names_len = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != MAGIC:
+            raise ValueError("%s is not a known-faces store" % path)
+        names = json.loads(f.read(names_len).decode("utf-8"))
+    offset = _HEADER.size + names_len
+    offset += (-offset) % _ALIGN
+    if count == 0:
+        matrix = np.zeros((0, dim), dtype=np.float32)
+    elif mmap:
+        matrix = np.memmap(path, dtype=np.float32, mode="r", offset=offset, shape=(count, dim))
+    else:
+        matrix = np.fromfile(path, dtype=np.float32, count=count * dim, offset=offset).reshape(count, dim)
+    return KnownFaces(names, matrix)
+
+
+def convert_pickles(names_path, encodings_path, out_path):
+    """Converts the legacy encodings_names/encodings pickle pair into a store file."""
+    with open(names_path, "rb") as fp:
+        names = pickle.load(fp)
+    with open(encodings_path, "rb") as fp:
+        encodings = pickle.load(fp)
+    if len(names) != len(encodings):
+        raise ValueError("%d names but %d encodings" % (len(names), len(encodings)))
+    save_store(out_path, names, encodings)
+    return len(names)
+
+
+class KnownFaces(object):
+    """Immutable snapshot of known names and encodings."""
+
+    def __init__(self, names, matrix):
+        self.names = list(names)
+        self.matrix = matrix
+        # Squared norms are precomputed once per snapshot for the batched distance
+        self._norms = np.einsum("ij,ij->i", matrix, matrix) if len(matrix) else np.zeros(0, dtype=np.float32)
+
+    def __len__(self):
+        return len(self.names)
+
+    def distances(self, encodings):
+        """Euclidean distances (same metric as face_recognition.face_distance), shape (faces, known)."""
+        queries = np.asarray(encodings, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries[None, :]
+        if not len(self) or not len(queries):
+            return np.zeros((len(queries), len(self)), dtype=np.float32)
+        squared = (np.einsum("ij,ij->i", queries, queries)[:, None] + self._norms[None, :]
+                   - 2.0 * queries @ self.matrix.T)
+        return np.sqrt(np.maximum(squared, 0.0))
+
+    def match(self, encodings, threshold):
+        """
+        Matches every face in one matrix operation.
+
+        Returns:
+            list: (name or "Unknown", distance) per face.
+        """
+        distances = self.distances(encodings)
+        if not distances.shape[1]:
+            return [("Unknown", float("inf")) for _ in range(len(distances))]
+        best = np.argmin(distances, axis=1)
+        best_distances = distances[np.arange(len(best)), best]
+        return [
+            (self.names[index] if distance < threshold else "Unknown", float(distance))
+            for index, distance in zip(best, best_distances)
+        ]
+
+
+class KnownFaceStore(object):
+    """
+    Holds the current KnownFaces snapshot. reload_async() loads the file on a background
+    thread and swaps the snapshot reference in one assignment, so readers never block
+    and never see a half-loaded table.
+    """
+
+    def __init__(self, path, legacy_names="encodings_names", legacy_encodings="encodings"):
+        self.path = path
+        self.legacy_names = legacy_names
+        self.legacy_encodings = legacy_encodings
+        self._reload_lock = threading.Lock()
+        self.current = self._load()
+
+    def _legacy_is_newer(self):
+        """True if the legacy pickles exist and either was written after the store."""
+        try:
+            legacy_mtime = max(os.path.getmtime(self.legacy_names), os.path.getmtime(self.legacy_encodings))
+        except OSError:
+            return False
+        try:
+            return legacy_mtime > os.path.getmtime(self.path)
+        except OSError:
+            return True
+
+    def _load(self):
+        # Faces enrolled since the last conversion are only in the pickles
+        if self._legacy_is_newer():
+            count = convert_pickles(self.legacy_names, self.legacy_encodings, self.path)
+            print("Converted %d legacy encodings into %s." % (count, self.path))
+        return load_store(self.path)
+
+    def match(self, encodings, threshold):
+        return self.current.match(encodings, threshold)
+
+    def reload(self):
+        self.current = self._load()
+        return self.current
+
+    def reload_async(self, on_reloaded=None):
+        """Reloads in the background; returns False if a reload is already running."""
+        if not self._reload_lock.acquire(False):
+            return False
+
+        def run():
+            try:
+                snapshot = self.reload()
+                print("Reloaded %d known encodings." % len(snapshot))
+                if on_reloaded is not None:
+                    on_reloaded(snapshot)
+            except Exception as e:
+                print("Failed to reload known encodings:", e)
+            finally:
+                self._reload_lock.release()
+
+        threading.Thread(target=run, name="known-faces-reload", daemon=True).start()
+        return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Known-encodings store tools.")
+    subparsers = parser.add_subparsers(dest="command")
+    convert = subparsers.add_parser("convert", help="Convert the legacy pickle pair into a store file.")
+    convert.add_argument("--names", default="encodings_names")
+    convert.add_argument("--encodings", default="encodings")
+    convert.add_argument("--out", default="known_faces.bin")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        print("Wrote %d encodings to %s." % (convert_pickles(args.names, args.encodings, args.out), args.out))
+    else:
+        parser.print_help()
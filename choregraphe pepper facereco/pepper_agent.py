@@ -7,11 +7,15 @@ import time
 import os
 import sys
 import numpy as np
-import pickle
 import argparse
 import vision_definitions
+import threading
 import traceback
-from PIL import Image
+from recognition_pipeline import RecognitionPipeline, DROP_POLICIES
+from face_tracker import FaceTracker
+from known_faces import KnownFaceStore
+from frame_ingest import wrap_frame, FrameBuffers
+from camera_controller import AdaptiveCameraController
 
 # ======================
 # CONFIG
@@ -20,115 +24,169 @@ DEFAULT_IP = "xxx.xxx.xxx.xxx"
 DEFAULT_PORT = 9559
 
 
+# ======================
+# FACE RECOGNITION
+# ======================
+# Euclidean distance; calibrate with "Pepper - face recognition/eval_thresholds.py --models dlib"
+MATCH_THRESHOLD = 0.53
+# Face boxes are kept in this frame size, so tracks and drawing survive resolution changes
+REFERENCE_WIDTH, REFERENCE_HEIGHT = 320, 240
+
+
+def draw_faces(bgr_image, faces, revscale):
+    for (top, right, bottom, left), name in faces:
+        top = int(top * revscale)
+        right = int(right * revscale)
+        bottom = int(bottom * revscale)
+        left = int(left * revscale)
+
+        color = (0, 255, 0) if name != "Unknown" else (255, 0, 0)
+        text_color = (0, 0, 0) if name != "Unknown" else (255, 255, 255)
+
+        cv2.rectangle(bgr_image, (left, top), (right, bottom), color, 2)
+        cv2.rectangle(bgr_image, (left, bottom + 70), (right, bottom), color, cv2.FILLED)
+        cv2.putText(bgr_image, name, (left + 6, bottom + 29), cv2.FONT_HERSHEY_DUPLEX, 1.0, text_color, 1)
+
+
 # ======================
 # FACE RECOGNITION MAIN FUNCTION
 # ======================
-def idPersons(session, ip=DEFAULT_IP, port=DEFAULT_PORT):
+def idPersons(session, ip=DEFAULT_IP, port=DEFAULT_PORT, workers=1, queue_size=1,
+              drop_policy="drop_oldest", max_frame_age=0.5, store_path="known_faces.bin",
+              adaptive=True, latency_budget=0.15, min_face_px=40, match_threshold=MATCH_THRESHOLD):
     # Connect to Pepper's services
     videoService = session.service('ALVideoDevice')
     tts = session.service('ALTextToSpeech')
 
+    # Picks resolution, frame rate and detection scale from measured latency and face size
+    # (starts at kQVGA with scale 0.5)
+    controller = AdaptiveCameraController(latency_budget=latency_budget, min_face_px=min_face_px)
+    settings = controller.settings()
+
     SID = "pepper_face_recognition"
-    resolution = vision_definitions.kQVGA  # 320x240
     colorSpace = vision_definitions.kRGBColorSpace
-    nameId = videoService.subscribe(SID, resolution, colorSpace, 10)
+    nameId = videoService.subscribe(SID, settings.resolution, colorSpace, settings.fps)
 
-    # Load face encodings and names
-    with open('encodings_names', 'rb') as fp:
-        known_face_names = pickle.load(fp)
-    with open('encodings', 'rb') as fp:
-        known_face_encodings = pickle.load(fp)
+    # Load face encodings and names (memory-mapped store; converted from the legacy pickles on first run)
+    known_faces = KnownFaceStore(store_path)
 
     # Setup image and control variables
-    width, height = 320, 240
-    scale = 0.5
-    revscale = 1 / scale
-    process_this_frame = 0
+    width, height = REFERENCE_WIDTH, REFERENCE_HEIGHT
     blank_image = np.zeros((width, height, 3), np.uint8)
-    greeted = []
-
+    greeted = set()
+    greeted_lock = threading.Lock()
+    # Caches each tracked face's identity so only new, moved or stale faces are re-encoded
+    tracker = FaceTracker()
+    # Per-thread scratch buffers for the downscaled and BGR/display frames
+    buffers = FrameBuffers(width, height, settings.scale, display_scale=0.75)
+
+    def grab():
+        # Capture stage: runs on its own thread at camera rate
+        started = time.time()
+        result = videoService.getImageRemote(nameId)
+        finished = time.time()
+        controller.observe_capture(finished - started, finished)
+        # Read-only view over NAOqi's buffer; every later stage only reads it
+        image = wrap_frame(result)
+        if image is None:
+            print("No image data.")
+        return image
+
+    def greet(name):
+        if name == "Unknown":
+            return
+        with greeted_lock:
+            first_time = name not in greeted
+            greeted.add(name)
+        if first_time:
+            # Asynchronous so speech never stalls recognition
+            tts.say("Hi " + name + "! Nice to see you.", _async=True)
+
+    def recognize(image):
+        # Detect + encode + match stage: runs on the worker threads at whatever rate the CPU allows
+        small_frame = buffers.downscale(image, controller.scale)
+        face_locations = face_recognition.face_locations(small_frame)
+        # Track and report in reference coordinates; detection size changes with the controller
+        to_reference = float(REFERENCE_WIDTH) / small_frame.shape[1]
+        boxes = [tuple(int(round(v * to_reference)) for v in location) for location in face_locations]
+        tracks, needs_encoding = tracker.update(boxes)
+
+        # Only encode faces whose track is new, has drifted, or whose cached result is stale
+        if needs_encoding:
+            locations = [face_locations[i] for i in needs_encoding]
+            face_encodings = face_recognition.face_encodings(small_frame, locations)
+            # All faces of the frame against all known encodings in one matrix operation
+            matches = known_faces.match(face_encodings, match_threshold)
+            for i, face_encoding, (name, _) in zip(needs_encoding, face_encodings, matches):
+                tracker.set_result(tracks[i], face_encoding, name)
+                greet(name)
+
+        return [(box, track.name or "Unknown") for box, track in zip(boxes, tracks)]
+
+    def adapt(result):
+        # Called once per new recognition result, on the main thread
+        heights = [float(bottom - top) / REFERENCE_HEIGHT for (top, _, bottom, _), _ in result.faces]
+        new_settings = controller.observe(result.latency, heights)
+        if new_settings is None:
+            return
+        try:
+            videoService.setResolution(nameId, new_settings.resolution)
+            videoService.setFrameRate(nameId, new_settings.fps)
+            print("Camera settings:", controller.stats())
+        except Exception as e:
+            print("Failed to apply camera settings:", e)
+
+    pipeline = RecognitionPipeline(
+        grab, recognize, workers=workers, queue_size=queue_size,
+        drop_policy=drop_policy, max_frame_age=max_frame_age
+    ).start()
+
+    # Render stage: main thread (required by cv2.imshow), draws the newest frame with the newest result
+    last_rendered = -1
+    last_result = -1
     try:
         while True:
-            try:
-                result = videoService.getImageRemote(nameId)
-                image = None
-
-                if result is None or result[6] is None:
-                    print("No image data.")
-                    continue
-
-                image_string = str(result[6])
-                im = Image.frombytes("RGB", (width, height), image_string)
-                image = np.asarray(im)
-
-            except Exception as e:
-                print("Image capture error:", e)
-                traceback.print_exc()
-                continue
-
-            if image is not None:
-                if process_this_frame == 0:
-                    small_frame = cv2.resize(image, (0, 0), fx=scale, fy=scale)
-                    face_locations = face_recognition.face_locations(small_frame)
-                    face_encodings = face_recognition.face_encodings(small_frame, face_locations)
-                    face_names = []
-
-                    for face_encoding in face_encodings:
-                        distances = face_recognition.face_distance(known_face_encodings, face_encoding)
-                        name = "Unknown"
-                        blank_image[:, :] = (0, 0, 255)
-
-                        if len(distances) > 0:
-                            min_distance = np.min(distances)
-                            min_index = np.argmin(distances)
-
-                            if min_distance < 0.53:
-                                name = known_face_names[min_index]
-                                blank_image[:, :] = (0, 255, 0)
-
-                                if name not in greeted:
-                                    tts.say("Hi " + name + "! Nice to see you.")
-                                    greeted.append(name)
-
-                        face_names.append(name)
-
-                process_this_frame = (process_this_frame + 1) % 2
-
-                # Draw results
-                bgr_image = image[:, :, ::-1]
-                for (top, right, bottom, left), name in zip(face_locations, face_names):
-                    top = int(top * revscale)
-                    right = int(right * revscale)
-                    bottom = int(bottom * revscale)
-                    left = int(left * revscale)
-
-                    color = (0, 255, 0) if name != "Unknown" else (255, 0, 0)
-                    text_color = (0, 0, 0) if name != "Unknown" else (255, 255, 255)
-
-                    cv2.rectangle(bgr_image, (left, top), (right, bottom), color, 2)
-                    cv2.rectangle(bgr_image, (left, bottom + 70), (right, bottom), color, cv2.FILLED)
-                    cv2.putText(bgr_image, name, (left + 6, bottom + 29), cv2.FONT_HERSHEY_DUPLEX, 1.0, text_color, 1)
-
-                # Display
-                frame_resized = cv2.resize(bgr_image, (0, 0), fx=0.75, fy=0.75)
-                cv2.imshow('Video', frame_resized)
-                cv2.imshow('Access', blank_image)
-
-                # Keyboard controls
-                key = cv2.waitKey(1) & 0xFF
-                if key == ord('q'):
+            frame = pipeline.latest_frame()
+            if frame is None or frame.index == last_rendered:
+                if cv2.waitKey(5) & 0xFF == ord('q'):
                     break
-                elif key == ord('r'):
-                    with open('encodings_names', 'rb') as fp:
-                        known_face_names = pickle.load(fp)
-                    with open('encodings', 'rb') as fp:
-                        known_face_encodings = pickle.load(fp)
-                    print('Reloaded encodings.')
+                continue
+            last_rendered = frame.index
+
+            result = pipeline.latest_result()
+            faces = result.faces if result is not None else []
+            if adaptive and result is not None and result.frame_index != last_result:
+                last_result = result.frame_index
+                adapt(result)
+            if faces:
+                blank_image[:, :] = (0, 255, 0) if faces[-1][1] != "Unknown" else (0, 0, 255)
+
+            # Draw results
+            bgr_image = buffers.to_bgr(frame.image)
+            draw_faces(bgr_image, faces, float(bgr_image.shape[1]) / REFERENCE_WIDTH)
+
+            # Display
+            frame_resized = buffers.display(bgr_image)
+            cv2.imshow('Video', frame_resized)
+            cv2.imshow('Access', blank_image)
+
+            # Keyboard controls
+            key = cv2.waitKey(1) & 0xFF
+            if key == ord('q'):
+                break
+            elif key == ord('r'):
+                # Loaded and swapped in the background; the video loop keeps running
+                known_faces.reload_async(on_reloaded=lambda _: tracker.invalidate())
+            elif key == ord('s'):
+                print('Pipeline stats:', pipeline.stats(), 'Tracker stats:', tracker.stats(),
+                      'Camera stats:', controller.stats())
 
     except Exception as e:
         print("Error in main loop:", e)
         traceback.print_exc()
     finally:
+        pipeline.stop()
+        videoService.unsubscribe(nameId)
         cv2.destroyAllWindows()
 
 
@@ -139,6 +197,21 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--ip", type=str, default=DEFAULT_IP, help="Robot IP address. Use '127.0.0.1' for local.")
     parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Naoqi port number. Default is 9559.")
+    parser.add_argument("--workers", type=int, default=1, help="Recognition worker threads.")
+    parser.add_argument("--queue-size", type=int, default=1, help="Frames buffered for the recognition workers.")
+    parser.add_argument("--drop-policy", choices=DROP_POLICIES, default="drop_oldest",
+                        help="Which frames to drop when recognition falls behind.")
+    parser.add_argument("--max-frame-age", type=float, default=0.5,
+                        help="Skip frames older than this many seconds (0 disables).")
+    parser.add_argument("--store", default="known_faces.bin", help="Known-encodings store file.")
+    parser.add_argument("--latency-budget-ms", type=float, default=150,
+                        help="Recognition latency the adaptive camera settings aim to stay under.")
+    parser.add_argument("--min-face-px", type=int, default=40,
+                        help="Smallest face height (detection pixels) before the resolution is raised.")
+    parser.add_argument("--fixed-camera", action="store_true",
+                        help="Keep the starting camera settings (kQVGA, scale 0.5) instead of adapting them.")
+    parser.add_argument("--match-threshold", type=float, default=MATCH_THRESHOLD,
+                        help="Largest encoding distance accepted as a match.")
     args = parser.parse_args()
 
     session = qi.Session()
@@ -148,4 +221,7 @@ if __name__ == "__main__":
         print(f"Can't connect to Naoqi at ip \"{args.ip}\" on port {args.port}.\nCheck script arguments. Use -h for help.")
         sys.exit(1)
 
-    idPersons(session, args.ip, args.port)
+    idPersons(session, args.ip, args.port, workers=args.workers, queue_size=args.queue_size,
+              drop_policy=args.drop_policy, max_frame_age=args.max_frame_age, store_path=args.store,
+              adaptive=not args.fixed_camera, latency_budget=args.latency_budget_ms / 1000.0,
+              min_face_px=args.min_face_px, match_threshold=args.match_threshold)
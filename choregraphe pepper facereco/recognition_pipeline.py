@@ -0,0 +1,174 @@
+# recognition_pipeline.py
+"""
+Staged real-time pipeline: capture -> recognize -> render.
+
+The capture thread pulls frames at camera rate and hands them to two places:
+the renderer (always the newest frame) and a bounded queue for the recognition
+workers. When the workers fall behind, the queue's drop policy decides which
+frames are discarded, so display FPS never depends on recognition speed.
+"""
+import time
+import threading
+from collections import deque, namedtuple
+
+Frame = namedtuple("Frame", ["index", "timestamp", "image"])
+Result = namedtuple("Result", ["frame_index", "timestamp", "faces", "latency"])
+
+# drop_oldest: keep the most recent frames (with maxsize=1 this is a latest-frame slot)
+# drop_newest: keep the queued frames and reject new ones until a worker catches up
+DROP_POLICIES = ("drop_oldest", "drop_newest")
+
+
+class FrameQueue:
+    """Bounded, thread-safe frame queue with an explicit drop policy."""
+
+    def __init__(self, maxsize=1, policy="drop_oldest"):
+        if policy not in DROP_POLICIES:
+            raise ValueError("Unknown drop policy: %s" % policy)
+        self.maxsize = max(1, maxsize)
+        self.policy = policy
+        self.dropped = 0
+        self._items = deque()
+        self._cond = threading.Condition()
+
+    def put(self, item):
+        """Returns False if the item (or an older one) was dropped."""
+        with self._cond:
+            accepted = True
+            if len(self._items) >= self.maxsize:
+                self.dropped += 1
+                if self.policy == "drop_newest":
+                    return False
+                self._items.popleft()
+                accepted = False
+            self._items.append(item)
+            self._cond.notify()
+            return accepted
+
+    def get(self, timeout=None):
+        """Returns the next item, or None on timeout."""
+        with self._cond:
+            if not self._items:
+                self._cond.wait(timeout)
+            if not self._items:
+                return None
+            return self._items.popleft()
+
+
+class LatestValue:
+    """Single slot holding the newest value; readers never block."""
+
+    def __init__(self, value=None):
+        self._value = value
+        self._lock = threading.Lock()
+
+    def set(self, value):
+        with self._lock:
+            self._value = value
+
+    def set_if_newer(self, result):
+        """Only replace the current result with one from a later frame (workers may finish out of order)."""
+        with self._lock:
+            if self._value is None or result.frame_index > self._value.frame_index:
+                self._value = result
+                return True
+            return False
+
+    def get(self):
+        return self._value
+
+
+class RecognitionPipeline:
+    """
+    Runs a capture thread and N recognition workers. The caller drives the
+    renderer from its own (main) thread via latest_frame() / latest_result(),
+    because cv2.imshow must run on the main thread.
+
+    Args:
+        grab (callable): Returns an RGB frame (np.ndarray) or None.
+        recognize (callable): recognize(image) -> list of (box, name) for the frame.
+        workers (int): Number of recognition worker threads.
+        queue_size (int): Frames buffered for the workers.
+        drop_policy (str): One of DROP_POLICIES.
+        max_frame_age (float): Workers skip frames older than this (seconds); 0 disables.
+    """
+
+    def __init__(self, grab, recognize, workers=1, queue_size=1, drop_policy="drop_oldest", max_frame_age=0.5):
+        self.grab = grab
+        self.recognize = recognize
+        self.workers = max(1, workers)
+        self.max_frame_age = max_frame_age
+        self.frames = FrameQueue(queue_size, drop_policy)
+        self._latest_frame = LatestValue()
+        self._latest_result = LatestValue()
+        self._stop = threading.Event()
+        self._threads = []
+        self._stats_lock = threading.Lock()
+        self.captured = 0
+        self.recognized = 0
+        self.stale = 0
+
+    def start(self):
+        self._threads = [threading.Thread(target=self._capture_loop, name="capture", daemon=True)]
+        self._threads += [
+            threading.Thread(target=self._recognize_loop, name="recognize-%d" % i, daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout=2)
+
+    def _capture_loop(self):
+        index = 0
+        while not self._stop.is_set():
+            try:
+                image = self.grab()
+            except Exception as e:
+                print("Image capture error:", e)
+                time.sleep(0.05)
+                continue
+            if image is None:
+                continue
+            frame = Frame(index, time.time(), image)
+            index += 1
+            self.captured += 1
+            self._latest_frame.set(frame)
+            self.frames.put(frame)
+
+    def _recognize_loop(self):
+        while not self._stop.is_set():
+            frame = self.frames.get(timeout=0.1)
+            if frame is None:
+                continue
+            if self.max_frame_age and time.time() - frame.timestamp > self.max_frame_age:
+                with self._stats_lock:
+                    self.stale += 1
+                continue
+            started = time.time()
+            try:
+                faces = self.recognize(frame.image)
+            except Exception as e:
+                print("Recognition error:", e)
+                continue
+            self._latest_result.set_if_newer(Result(frame.index, frame.timestamp, faces, time.time() - started))
+            with self._stats_lock:
+                self.recognized += 1
+
+    def latest_frame(self):
+        return self._latest_frame.get()
+
+    def latest_result(self):
+        return self._latest_result.get()
+
+    def stats(self):
+        return {
+            "captured": self.captured,
+            "recognized": self.recognized,
+            "dropped": self.frames.dropped,
+            "stale": self.stale,
+        }
@@ -1,32 +1,113 @@
 import os
-import uuid
 import base64
-from flask import Flask, request, jsonify
-from deepface import DeepFace
-import pandas as pd
-from gcs_handler import synchronize_gcs_to_local, upload_face_to_gcs, LOCAL_DB_PATH
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, request, jsonify, Response
+from gcs_handler import upload_face_bytes_to_gcs, get_bucket, LOCAL_DB_PATH, GCS_SYNC_INTERVAL
+from sync_worker import SyncWorker
+from image_io import decode_image, InMemoryRequest
+from embedding_index import EmbeddingIndex, identity_to_name
+from micro_batcher import MicroBatcher
+from register_queue import (RegistrationQueue, RegistrationRejected, QueueFull, IdempotencyConflict,
+                            job_to_dict, read_idempotency_key)
+import model_registry
+import metrics
 
-<<<<<<< HEAD
 #kalau local gunakan
 os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = os.path.join(os.path.dirname(__file__), "key.json")
 
-=======
->>>>>>> 5d40392faa97039738396a3e40fe5be59770201c
 app = Flask(__name__)
+app.request_class = InMemoryRequest
 
 # --- Konfigurasi ---
 MODEL_NAME = "VGG-Face"
 DISTANCE_METRIC = "cosine"
-DISTANCE_THRESHOLD = 0.6
-UPLOAD_FOLDER = 'temp_uploads'
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
+DISTANCE_THRESHOLD = float(os.environ.get("DISTANCE_THRESHOLD", "0.6"))
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", str(16 * 1024 * 1024)))
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES
 
 UNRECOGNIZED_MESSAGE = "wajah anda tidak saya kenali silahkan daftarkan wajah anda"
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", "64"))
+
+face_index = EmbeddingIndex(LOCAL_DB_PATH, MODEL_NAME)
+
+# Model yang dibandingkan oleh /compare_models
+MODELS = ["ArcFace", "Facenet", "VGG-Face"]
+
+
+def parse_model_thresholds(value):
+    """'ArcFace=0.68,Facenet=0.4' -> {"ArcFace": 0.68, "Facenet": 0.4}"""
+    thresholds = {}
+    for item in value.split(","):
+        if item.strip():
+            model_name, threshold = item.split("=", 1)
+            thresholds[model_name.strip()] = float(threshold)
+    return thresholds
+
+
+# Ambang batas per model (keluaran eval_thresholds.py); model yang tidak disebut memakai DISTANCE_THRESHOLD
+MODEL_THRESHOLDS = dict.fromkeys(set(MODELS) | {MODEL_NAME}, DISTANCE_THRESHOLD)
+MODEL_THRESHOLDS.update(parse_model_thresholds(os.environ.get("MODEL_THRESHOLDS", "")))
+DISTANCE_THRESHOLD = MODEL_THRESHOLDS[MODEL_NAME]
+
+# Satu index per model; MODEL_NAME memakai index yang sama dengan /recognize
+model_indexes = {
+    model_name: face_index if model_name == MODEL_NAME else EmbeddingIndex(LOCAL_DB_PATH, model_name)
+    for model_name in MODELS
+}
+# Satu micro-batcher per model; /recognize dan /compare_models berbagi batch yang sama
+embedders = {model_name: MicroBatcher(model_name) for model_name in set(MODELS) | {MODEL_NAME}}
+embedder = embedders[MODEL_NAME]
+# Satu worker per model agar embedding ketiga model dihitung paralel
+compare_executor = ThreadPoolExecutor(max_workers=len(MODELS), thread_name_prefix="compare-models")
+
+sync_worker = SyncWorker(get_bucket, LOCAL_DB_PATH, interval=GCS_SYNC_INTERVAL)
+sync_worker.subscribe(face_index.apply_changes)
+for index in model_indexes.values():
+    if index is not face_index:
+        sync_worker.subscribe(index.apply_changes)
+sync_worker.start()
+
+
+def load_indexes():
+    face_index.load()
+    for index in model_indexes.values():
+        if not index.loaded:
+            index.load()
+
+
+model_registry.start_warm_up([MODEL_NAME] + MODELS, after=load_indexes)
+
+
+@app.before_request
+def start_trace():
+    metrics.begin_request(request.endpoint, trace=request.headers.get(metrics.TRACE_HEADER) == "1")
+
+
+@app.after_request
+def add_server_timing(response):
+    trace = metrics.end_request(response.status_code)
+    if trace is not None:
+        response.headers["Server-Timing"] = trace.server_timing()
+    return response
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route('/ready', methods=['GET'])
+def readiness():
+    state = model_registry.status()
+    state["database_version"] = sync_worker.snapshot.version
+    state["batching"] = {model_name: batcher.stats() for model_name, batcher in embedders.items()}
+    return jsonify(state), (200 if state["ready"] else 503)
+
 
 @app.route('/recognize', methods=['POST'])
 def recognize_face():
-    synchronize_gcs_to_local()
+    if not face_index.loaded:
+        face_index.load()
 
     if 'image' not in request.files:
         return jsonify({"status": "error", "message": "Tidak ada file gambar dalam permintaan"}), 400
@@ -36,50 +117,38 @@ def recognize_face():
         return jsonify({"status": "error", "message": "Nama file kosong"}), 400
 
     if file:
-        filename = str(uuid.uuid4()) + os.path.splitext(file.filename)[1]
-        temp_image_path = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(temp_image_path)
+        with metrics.stage("decode"):
+            image = decode_image(file.read())
+        if image is None:
+            return jsonify({"status": "error", "message": "File bukan gambar yang valid."}), 400
 
         try:
-            dfs = DeepFace.find(
-                img_path=temp_image_path,
-                db_path=LOCAL_DB_PATH,
-                model_name=MODEL_NAME,
-                distance_metric=DISTANCE_METRIC,
-                enforce_detection=False
-            )
-
-            if not dfs or dfs[0].empty:
+            with metrics.stage("detect"):
+                face = model_registry.detect_face(image)
+            with metrics.stage("embed"):
+                embedding = embedder.embed(face) if face is not None else None
+            with metrics.stage("search"):
+                matches = face_index.search(embedding, k=1)
+
+            if not matches:
                 print("Wajah tidak ditemukan di database atau tidak ada kecocokan.")
                 return jsonify({"status": "unrecognized", "message": UNRECOGNIZED_MESSAGE})
 
-            result_df = dfs[0]
-            best_match = result_df.iloc[0]
-            distance_column_name = [col for col in result_df.columns if DISTANCE_METRIC in col]
-
-            if not distance_column_name:
-                if 'distance' in result_df.columns:
-                    distance_column_name = ['distance']
-                else:
-                    raise KeyError(f"Tidak dapat menemukan kolom jarak. Kolom yang tersedia: {list(result_df.columns)}")
-
-            distance = best_match[distance_column_name[0]]
+            best_match = matches[0]
+            distance = best_match['distance']
 
             if distance <= DISTANCE_THRESHOLD:
-                identity_path = best_match['identity']
-                person_name = os.path.basename(os.path.dirname(identity_path))
-                if person_name == LOCAL_DB_PATH:
-                    person_name = os.path.splitext(os.path.basename(identity_path))[0]
-
+                person_name = identity_to_name(best_match['identity'], LOCAL_DB_PATH)
                 confidence_score = (1 - distance) * 100
 
                 print(f"Wajah dikenali sebagai: {person_name} dengan jarak: {distance} (kepercayaan: {confidence_score:.2f}%)")
-                return jsonify({
-                    "status": "recognized", 
-                    "name": person_name, 
-                    "distance": float(distance),
-                    "confidence": f"{confidence_score:.2f}%"
-                })
+                with metrics.stage("response"):
+                    return jsonify({
+                        "status": "recognized", 
+                        "name": person_name, 
+                        "distance": float(distance),
+                        "confidence": f"{confidence_score:.2f}%"
+                    })
             else:
                 print(f"Kecocokan ditemukan tetapi jarak ({distance}) di atas ambang batas ({DISTANCE_THRESHOLD}).")
                 return jsonify({"status": "unrecognized", "message": UNRECOGNIZED_MESSAGE})
@@ -89,55 +158,179 @@ def recognize_face():
             if "Face could not be detected" in str(e):
                 return jsonify({"status": "error", "message": "Tidak ada wajah yang terdeteksi di gambar."})
             return jsonify({"status": "error", "message": f"Terjadi kesalahan internal: {str(e)}"})
-        finally:
-            if os.path.exists(temp_image_path):
-                os.remove(temp_image_path)
 
     return jsonify({"status": "error", "message": "Terjadi kesalahan yang tidak diketahui."}), 500
 
 
-@app.route('/register', methods=['POST'])
-def register_face():
-    data = request.get_json()
-    if not data or 'name' not in data or 'image' not in data:
-        return jsonify({"status": "error", "message": "Permintaan tidak valid. 'name' dan 'image' diperlukan."}), 400
+def _match_to_result(matches):
+    if not matches or matches[0]['distance'] > DISTANCE_THRESHOLD:
+        return {"status": "unrecognized", "message": UNRECOGNIZED_MESSAGE}
 
-    person_name = data['name']
-    image_data = data['image']
+    distance = matches[0]['distance']
+    person_name = identity_to_name(matches[0]['identity'], LOCAL_DB_PATH)
+    confidence_score = (1 - distance) * 100
+    return {
+        "status": "recognized",
+        "name": person_name,
+        "distance": float(distance),
+        "confidence": f"{confidence_score:.2f}%"
+    }
 
-    try:
-        image_bytes = base64.b64decode(image_data)
-        filename = f"{person_name}_{uuid.uuid4()}.jpg"
-        temp_image_path = os.path.join(UPLOAD_FOLDER, filename)
-        
-        with open(temp_image_path, 'wb') as f:
-            f.write(image_bytes)
-
-        success = upload_face_to_gcs(temp_image_path, person_name)
-
-        if success:
-            print("Memperbarui database lokal setelah pendaftaran baru...")
-            synchronize_gcs_to_local()
-            return jsonify({"status": "success", "message": f"Wajah untuk {person_name} berhasil didaftarkan."})
-        else:
-            return jsonify({"status": "error", "message": "Gagal mengunggah gambar ke GCS."}), 500
 
+@app.route('/recognize_batch', methods=['POST'])
+def recognize_batch():
+    files = request.files.getlist('images')
+    if not files:
+        return jsonify({"status": "error", "message": "Tidak ada file gambar dalam permintaan"}), 400
+    if len(files) > MAX_BATCH_SIZE:
+        return jsonify({"status": "error", "message": f"Maksimal {MAX_BATCH_SIZE} gambar per permintaan."}), 413
+
+    if not face_index.loaded:
+        face_index.load()
+
+    results = [None] * len(files)
+    faces, positions = [], []
+    for position, file in enumerate(files):
+        try:
+            with metrics.stage("decode"):
+                image = decode_image(file.read())
+            if image is None:
+                results[position] = {"status": "error", "message": "File bukan gambar yang valid."}
+                continue
+            with metrics.stage("detect"):
+                face = model_registry.detect_face(image)
+            if face is None:
+                results[position] = {"status": "error", "message": "Tidak ada wajah yang terdeteksi di gambar."}
+                continue
+            faces.append(face)
+            positions.append(position)
+        except Exception as e:
+            print(f"Error selama deteksi gambar ke-{position}: {e}")
+            results[position] = {"status": "error", "message": f"Terjadi kesalahan internal: {str(e)}"}
+
+    try:
+        with metrics.stage("embed"):
+            embeddings = model_registry.embed_faces(faces, MODEL_NAME)
+        with metrics.stage("search"):
+            batch_matches = face_index.search_batch(embeddings, k=1)
     except Exception as e:
-        print(f"Error selama pendaftaran: {e}")
+        print(f"Error selama pemrosesan batch: {e}")
         return jsonify({"status": "error", "message": f"Terjadi kesalahan internal: {str(e)}"}), 500
-    finally:
-        if 'temp_image_path' in locals() and os.path.exists(temp_image_path):
-            os.remove(temp_image_path)
 
+    for position, matches in zip(positions, batch_matches):
+        results[position] = _match_to_result(matches)
 
-@app.route('/compare_models', methods=['POST'])
-def compare_models():
-    MODELS = ["ArcFace", "Facenet", "VGG-Face"]
-    DISTANCE_METRIC = "cosine"
-    DISTANCE_THRESHOLD = 0.6
+    recognized = sum(1 for result in results if result["status"] == "recognized")
+    print(f"Batch {len(files)} gambar diproses, {recognized} wajah dikenali.")
+    with metrics.stage("response"):
+        return jsonify({"status": "success", "results": results})
+
+
+def read_register_payload():
+    """
+    Membaca (bytes gambar, nama) dari multipart biner atau JSON base64.
+    Multipart lebih disarankan: tanpa base64 payload ~33% lebih kecil.
+    """
+    upload = request.files.get('image')
+    if upload is not None:
+        return upload.read(), request.form.get('name')
+    data = request.get_json(silent=True)
+    if not data or 'name' not in data or 'image' not in data:
+        return None, None
+    try:
+        return base64.b64decode(data['image']), data['name']
+    except (ValueError, TypeError):
+        return None, None
+
+
+def process_registration(job, image_bytes):
+    """Pemeriksaan kualitas, unggah ke GCS, lalu embedding dan penambahan ke semua index."""
+    with metrics.stage("decode"):
+        image = decode_image(image_bytes)
+    if image is None:
+        raise RegistrationRejected("Data 'image' bukan gambar yang valid.")
+    with metrics.stage("quality"):
+        faces = model_registry.detect_faces(image)
+    if not faces:
+        raise RegistrationRejected("Tidak ada wajah yang terdeteksi di gambar.")
+    if len(faces) > 1:
+        raise RegistrationRejected("Terdeteksi lebih dari satu wajah; kirim gambar dengan satu wajah saja.")
+
+    filename = f"{job.name}_{job.job_id}.jpg"
+    with metrics.stage("upload"):
+        blob = upload_face_bytes_to_gcs(image_bytes, job.name, filename)
+    if not blob:
+        raise RuntimeError("Gagal mengunggah gambar ke GCS.")
+    with metrics.stage("index"):
+        sync_worker.register_upload(blob, image_bytes)
+    return f"Wajah untuk {job.name} berhasil didaftarkan."
 
-    synchronize_gcs_to_local()
 
+register_queue = RegistrationQueue(process_registration).start()
+
+
+@app.route('/register', methods=['POST'])
+def register_face():
+    with metrics.stage("read"):
+        image_bytes, person_name = read_register_payload()
+    if not image_bytes or not person_name:
+        return jsonify({"status": "error", "message": "Permintaan tidak valid. 'name' dan 'image' diperlukan."}), 400
+
+    try:
+        with metrics.stage("enqueue"):
+            job, created = register_queue.submit(person_name, image_bytes, read_idempotency_key(request))
+    except QueueFull:
+        response = jsonify({"status": "error", "message": "Antrean pendaftaran penuh, coba lagi nanti."})
+        response.headers["Retry-After"] = "5"
+        return response, 503
+    except IdempotencyConflict:
+        return jsonify({"status": "error", "message": "Idempotency-Key sudah dipakai untuk nama lain."}), 409
+
+    body = job_to_dict(job)
+    body["status_url"] = f"/register/{job.job_id}"
+    if created:
+        body["message"] = f"Pendaftaran wajah untuk {person_name} sedang diproses."
+    return jsonify(body), 202 if created else 200
+
+
+@app.route('/register/<job_id>', methods=['GET'])
+def register_status(job_id):
+    job = register_queue.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Job pendaftaran tidak ditemukan."}), 404
+    return jsonify(job_to_dict(job))
+
+
+def _compare_one(model_name, face, trace=None):
+    """Embedding dan pencarian untuk satu model, dijalankan di compare_executor."""
+    index = model_indexes[model_name]
+    if not index.loaded:
+        index.load()
+
+    # Thread executor tidak punya trace request, jadi trace diteruskan secara eksplisit
+    stage_suffix = model_name.lower().replace("-", "")
+    with metrics.stage(f"embed_{stage_suffix}", trace=trace):
+        embedding = embedders[model_name].embed(face)
+    with metrics.stage(f"search_{stage_suffix}", trace=trace):
+        matches = index.search(embedding, k=1)
+    if not matches:
+        return {"status": "unrecognized", "message": UNRECOGNIZED_MESSAGE}
+
+    distance = matches[0]['distance']
+    if distance <= MODEL_THRESHOLDS[model_name]:
+        person_name = identity_to_name(matches[0]['identity'], LOCAL_DB_PATH)
+        confidence_score = (1 - distance) * 100
+        return {
+            "status": "recognized",
+            "name": person_name,
+            "distance": float(distance),
+            "confidence": f"{confidence_score:.2f}%"
+        }
+    return {"status": "unrecognized", "message": f"Jarak terlalu jauh: {distance:.4f}"}
+
+
+@app.route('/compare_models', methods=['POST'])
+def compare_models():
     if 'image' not in request.files:
         return jsonify({"status": "error", "message": "Tidak ada file gambar dalam permintaan"}), 400
 
@@ -145,61 +338,25 @@ def compare_models():
     if file.filename == '':
         return jsonify({"status": "error", "message": "Nama file kosong"}), 400
 
-    filename = str(uuid.uuid4()) + os.path.splitext(file.filename)[1]
-    temp_image_path = os.path.join(UPLOAD_FOLDER, filename)
-    file.save(temp_image_path)
-
-    results = {}
+    with metrics.stage("decode"):
+        image = decode_image(file.read())
+    if image is None:
+        return jsonify({"status": "error", "message": "File bukan gambar yang valid."}), 400
 
     try:
-        for model_name in MODELS:
+        # Deteksi dan penyelarasan wajah cukup sekali untuk semua model
+        with metrics.stage("detect"):
+            face = model_registry.detect_face(image)
+        if face is None:
+            return jsonify({"status": "error", "message": "Tidak ada wajah yang terdeteksi di gambar."})
+
+        # Embedding per model berjalan paralel; latensi mengikuti model yang paling lambat
+        trace = metrics.current_trace()
+        futures = {model_name: compare_executor.submit(_compare_one, model_name, face, trace) for model_name in MODELS}
+        results = {}
+        for model_name, future in futures.items():
             try:
-                dfs = DeepFace.find(
-                    img_path=temp_image_path,
-                    db_path=LOCAL_DB_PATH,
-                    model_name=model_name,
-                    distance_metric=DISTANCE_METRIC,
-                    enforce_detection=False
-                )
-
-                if not dfs or dfs[0].empty:
-                    results[model_name] = {
-                        "status": "unrecognized",
-                        "message": UNRECOGNIZED_MESSAGE
-                    }
-                    continue
-
-                result_df = dfs[0]
-                best_match = result_df.iloc[0]
-
-                distance_column_name = [col for col in result_df.columns if DISTANCE_METRIC in col]
-                if not distance_column_name:
-                    distance_column_name = ['distance'] if 'distance' in result_df.columns else []
-                if not distance_column_name:
-                    results[model_name] = {"status": "error", "message": "Kolom jarak tidak ditemukan"}
-                    continue
-
-                distance = best_match[distance_column_name[0]]
-
-                if distance <= DISTANCE_THRESHOLD:
-                    identity_path = best_match['identity']
-                    person_name = os.path.basename(os.path.dirname(identity_path))
-                    if person_name == LOCAL_DB_PATH:
-                        person_name = os.path.splitext(os.path.basename(identity_path))[0]
-
-                    confidence_score = (1 - distance) * 100
-
-                    results[model_name] = {
-                        "status": "recognized",
-                        "name": person_name,
-                        "distance": float(distance),
-                        "confidence": f"{confidence_score:.2f}%"
-                    }
-                else:
-                    results[model_name] = {
-                        "status": "unrecognized",
-                        "message": f"Jarak terlalu jauh: {distance:.4f}"
-                    }
+                results[model_name] = future.result()
             except Exception as model_err:
                 results[model_name] = {
                     "status": "error",
@@ -213,13 +370,10 @@ def compare_models():
 
     except Exception as e:
         return jsonify({"status": "error", "message": f"Terjadi kesalahan internal: {str(e)}"}), 500
-    finally:
-        if os.path.exists(temp_image_path):
-            os.remove(temp_image_path)
-
 
 if __name__ == '__main__':
     if not os.path.exists(LOCAL_DB_PATH):
         os.makedirs(LOCAL_DB_PATH)
     
-    app.run(host='0.0.0.0', port=8000, debug=True)
+    # Untuk produksi: gunicorn -c "../Pepper - face recognition/gunicorn.conf.py" app:app
+    app.run(host='0.0.0.0', port=8000, debug=os.environ.get("FLASK_DEBUG") == "1", threaded=True)